@@ -165,6 +165,7 @@ from .make_links import make_links
 from .make_link_logs import make_link_logs
 from .dir_mod import (clear_dirs, check_manifest, delete_files,
                      list_directory, remove_dir)
+from .parallel_zip import ParallelZipFile
 
 
 from .run_program import run_stata, run_matlab, run_perl, run_python, run_mathematica
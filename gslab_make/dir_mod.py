@@ -14,6 +14,7 @@ import gslab_make.private.messages as messages
 from glob import glob
 from gslab_make.private.exceptionclasses import CustomError, CritError, SyntaxError, LogicError
 from gslab_make.private.preliminaries import print_error
+from gslab_make.parallel_zip import ParallelZipFile
 
 
 #== Directory modification functions =================
@@ -240,8 +241,8 @@ def unzip_externals(external_dir='@DEFAULTVALUE@'):
                 unzip(absname, dirname)
 
 
-def zip_dir(source_dir, dest):
-    zf = zipfile.ZipFile('%s.zip' % (dest), 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+def zip_dir(source_dir, dest, workers = None):
+    zf = ParallelZipFile('%s.zip' % (dest), 'w', workers = workers)
     abs_src = os.path.abspath(source_dir)
     for dirname, subdirs, files in os.walk(source_dir):
         for filename in files:
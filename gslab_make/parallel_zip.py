@@ -0,0 +1,243 @@
+#! /usr/bin/env python
+
+import os
+import io
+import time
+import zlib
+import zipfile
+import warnings
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes of member content deflated by a single worker task.
+CHUNK_SIZE = 4 * 1024 * 1024
+# Size of the deflate history window carried from one chunk to the next.
+WINDOW_SIZE = 32 * 1024
+# zipfile.ZipFile internals that the parallel writer updates in place. They
+# have been stable since Python 3.6; if one is missing, members are written
+# one at a time through the public zipfile interface instead.
+ZIPFILE_INTERNALS = ('fp', 'start_dir', 'filelist', 'NameToInfo', '_didModify', '_writing')
+
+
+class ParallelZipFile(object):
+    """Write a deflated .zip archive using a pool of compression threads
+
+    ParallelZipFile queues members with `write()` and `writestr()` and builds
+    the archive when it is closed. Each member is cut into `chunk_size` pieces
+    that are deflated concurrently (zlib releases the GIL while compressing).
+    Every piece after the first is primed with the last 32 KB of the piece
+    before it and all but the last end on a sync flush, so the pieces join
+    into a single valid deflate stream.
+
+    Local headers, compressed data and the central directory are always
+    written in the order in which members were queued. The archive's bytes
+    depend only on the queued members, `compresslevel` and `chunk_size`,
+    never on the number of workers. If the running zipfile module lacks one of
+    the internals listed in ZIPFILE_INTERNALS, the members are written serially
+    with zipfile's own write() and writestr() instead.
+
+    e.g.
+    with ParallelZipFile('out.zip', 'w', workers = 8) as zf:
+        zf.write('./data/file1.txt', 'file1.txt')
+        zf.writestr('notes.txt', 'some text')
+    """
+
+    def __init__(self, file, mode = 'w', compresslevel = 6, workers = None,
+                 chunk_size = CHUNK_SIZE):
+        self.zf            = zipfile.ZipFile(file, mode, zipfile.ZIP_DEFLATED, allowZip64 = True)
+        self.compresslevel = compresslevel
+        self.workers       = workers or os.cpu_count() or 1
+        self.chunk_size    = chunk_size
+        self.members       = []
+        self._zip64        = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def write(self, filename, arcname = None):
+        """Queue the file at `filename` to be stored under `arcname`."""
+        zinfo = zipfile.ZipInfo.from_file(filename, arcname)
+        self.members.append((zinfo, filename))
+
+    def writestr(self, zinfo_or_arcname, data):
+        """
+        Queue `data` (str or bytes) to be stored under `zinfo_or_arcname`, a
+        ZipInfo or a name. As with zipfile.ZipFile.writestr, a ZipInfo keeps
+        its own date_time and a name is stamped with the current local time.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if isinstance(zinfo_or_arcname, zipfile.ZipInfo):
+            zinfo = zinfo_or_arcname
+        else:
+            zinfo = zipfile.ZipInfo(zinfo_or_arcname,
+                                    date_time = time.localtime(time.time())[:6])
+            if zinfo.filename.endswith('/'):
+                zinfo.external_attr = (0o40775 << 16) | 0x10
+            else:
+                zinfo.external_attr = 0o600 << 16
+        zinfo.file_size = len(data)
+        self.members.append((zinfo, data))
+
+    def namelist(self):
+        """Return the names of archived and queued members."""
+        return self.zf.namelist() + [zinfo.filename for zinfo, _ in self.members]
+
+    def close(self):
+        """Deflate all queued members, write them and the central directory."""
+        if getattr(self.zf, 'fp', None) is None:
+            return
+        try:
+            if self._has_internals():
+                self._write_parallel()
+            else:
+                self._write_serial()
+            self.members = []
+        finally:
+            self.zf.close()
+
+    def _has_internals(self):
+        """Return whether the zipfile internals used by _write_event exist."""
+        return all(hasattr(self.zf, name) for name in ZIPFILE_INTERNALS) and \
+               hasattr(zipfile.ZipInfo, 'FileHeader')
+
+    def _write_parallel(self):
+        if self.zf._writing:
+            raise ValueError("Can't write to ZIP archive while an open writing handle exists.")
+        self.zf.fp.seek(self.zf.start_dir)
+        with ThreadPoolExecutor(max_workers = self.workers) as pool:
+            pending = collections.deque()
+            for event in self._events(pool):
+                pending.append(event)
+                if len(pending) > 4 * self.workers:
+                    self._write_event(*pending.popleft())
+            while pending:
+                self._write_event(*pending.popleft())
+
+    def _write_serial(self):
+        for zinfo, content in self.members:
+            if isinstance(content, bytes):
+                self.zf.writestr(zinfo, content, zipfile.ZIP_DEFLATED, self.compresslevel)
+            elif zinfo.is_dir():
+                self.zf.writestr(zinfo, b'', zipfile.ZIP_STORED)
+            else:
+                self.zf.write(content, zinfo.filename, zipfile.ZIP_DEFLATED, self.compresslevel)
+
+    def _events(self, pool):
+        """
+        Yield, in archive order, the steps needed to write each member:
+        ('begin', zinfo, None), one ('chunk', zinfo, future) per piece of deflated
+        content and ('end', zinfo, (crc, size)).
+        """
+        for zinfo, content in self.members:
+            yield ('begin', zinfo, None)
+            if zinfo.is_dir():
+                yield ('end', zinfo, (0, 0))
+                continue
+            crc     = 0
+            size    = 0
+            history = b''
+            for chunk, last in self._chunks(content):
+                crc  = zlib.crc32(chunk, crc)
+                size = size + len(chunk)
+                future = pool.submit(_deflate, chunk, history, last, self.compresslevel)
+                if len(chunk) >= WINDOW_SIZE:
+                    history = chunk[-WINDOW_SIZE:]
+                else:
+                    history = (history + chunk)[-WINDOW_SIZE:]
+                yield ('chunk', zinfo, future)
+            yield ('end', zinfo, (crc, size))
+
+    def _chunks(self, content):
+        """
+        Yield (chunk, is_last_chunk) pairs for a file path or bytes object.
+        An empty member yields a single empty chunk.
+        """
+        if isinstance(content, bytes):
+            reader = io.BytesIO(content)
+        else:
+            reader = open(content, 'rb')
+        with reader:
+            chunk = reader.read(self.chunk_size)
+            while True:
+                following = reader.read(self.chunk_size)
+                yield chunk, not following
+                if not following:
+                    break
+                chunk = following
+
+    def _write_event(self, kind, zinfo, payload):
+        """
+        Write one step from _events(). Members are never interleaved, so the
+        ZIP64 choice made at 'begin' is kept on self until the matching 'end'.
+        """
+        fp = self.zf.fp
+        if kind == 'begin':
+            if zinfo.filename in self.zf.NameToInfo:
+                warnings.warn('Duplicate name: %r' % zinfo.filename, stacklevel = 4)
+            if zinfo.is_dir():
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo.CRC           = 0
+            zinfo.compress_size = 0
+            zinfo.header_offset = fp.tell()
+            # Same up-front ZIP64 decision zipfile makes for unknown sizes.
+            self._zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+            fp.write(zinfo.FileHeader(self._zip64))
+        elif kind == 'chunk':
+            data = payload.result()
+            fp.write(data)
+            zinfo.compress_size += len(data)
+        else:
+            zinfo.CRC, zinfo.file_size = payload
+            if not self._zip64 and \
+               max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+                raise zipfile.LargeZipFile('Member %s needs ZIP64 extensions.' % zinfo.filename)
+            end_offset = fp.tell()
+            fp.seek(zinfo.header_offset)
+            fp.write(zinfo.FileHeader(self._zip64))
+            fp.seek(end_offset)
+            self.zf.filelist.append(zinfo)
+            self.zf.NameToInfo[zinfo.filename] = zinfo
+            self.zf.start_dir  = end_offset
+            self.zf._didModify = True
+
+
+def _deflate(chunk, history, last, compresslevel):
+    """Deflate one piece of a member as a raw deflate block sequence."""
+    if history:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zdict = history)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    if last:
+        flush_mode = zlib.Z_FINISH
+    else:
+        flush_mode = zlib.Z_SYNC_FLUSH
+    return compressor.compress(chunk) + compressor.flush(flush_mode)
+
+
+def make_archive(base_name, root_dir, workers = None):
+    """Zip the contents of root_dir to base_name.zip
+
+    This function lays out the archive as `shutil.make_archive(base_name,
+    'zip', root_dir)` does (directory entries included, paths relative to
+    root_dir) but deflates its members with ParallelZipFile. It returns
+    the path of the archive.
+    """
+    zip_path = os.path.abspath(base_name + '.zip')
+    with ParallelZipFile(zip_path, 'w', workers = workers) as zf:
+        for dirpath, dirnames, filenames in os.walk(root_dir):
+            dirnames.sort()
+            for name in dirnames:
+                path = os.path.join(dirpath, name)
+                zf.write(path, os.path.relpath(path, root_dir))
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                if os.path.isfile(path) and os.path.abspath(path) != zip_path:
+                    zf.write(path, os.path.relpath(path, root_dir))
+    return zip_path
@@ -0,0 +1,58 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+import zipfile
+from unittest import mock
+
+# Ensure that Python can find and load the GSLab libraries
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../..')
+
+import gslab_make.parallel_zip as parallel_zip
+
+
+class TestParallelZip(unittest.TestCase):
+
+    def setUp(self):
+        shutil.rmtree('./zip_test', ignore_errors = True)
+        os.makedirs('./zip_test')
+        with open('./zip_test/file1.txt', 'wb') as f:
+            f.write(b'THIS IS A TEST FILE.\n')
+
+    def test_round_trip(self):
+        '''
+        Test that members written by ParallelZipFile, in parallel or through the
+        serial fallback, read back intact and keep zipfile's timestamps.
+        '''
+        content = os.urandom(50000) + b'x' * 100000
+        stamped = zipfile.ZipInfo('stamped.bin', date_time = (2001, 2, 3, 4, 5, 6))
+        for internals in [True, False]:
+            with mock.patch.object(parallel_zip.ParallelZipFile, '_has_internals',
+                                   return_value = internals):
+                with parallel_zip.ParallelZipFile('./zip_test/round.zip', 'w', workers = 3,
+                                                  chunk_size = 40000) as zf:
+                    zf.write('./zip_test/file1.txt', 'file1.txt')
+                    zf.writestr('random.bin', content)
+                    zf.writestr(stamped, b'stamped')
+                    zf.writestr('folder/', b'')
+                    before = time.localtime(time.time())[:6]
+
+            with zipfile.ZipFile('./zip_test/round.zip', 'r') as zf:
+                self.assertIsNone(zf.testzip())
+                self.assertEqual(zf.namelist(),
+                                 ['file1.txt', 'random.bin', 'stamped.bin', 'folder/'])
+                self.assertEqual(zf.read('file1.txt'), b'THIS IS A TEST FILE.\n')
+                self.assertEqual(zf.read('random.bin'), content)
+                self.assertEqual(zf.getinfo('stamped.bin').date_time, (2001, 2, 3, 4, 5, 6))
+                self.assertLessEqual(zf.getinfo('random.bin').date_time, before)
+                self.assertTrue(zf.getinfo('folder/').is_dir())
+            os.remove('./zip_test/round.zip')
+
+    def tearDown(self):
+        shutil.rmtree('./zip_test', ignore_errors = True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,72 @@
 #!/usr/bin/env python
+import io
 import os
+import re
+import json
 import shutil
+import hashlib
+import time
 import zipfile
 import zlib
 from abc import ABCMeta, abstractmethod
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from gslab_make.parallel_zip import ParallelZipFile
+
+# One file stored in an input .zip: its name inside the archive, the path it is
+# extracted to under path_temp, its uncompressed size, its CRC-32 and the path
+# of the archive holding it.
+Member = namedtuple('Member', ['name', 'path', 'size', 'crc', 'archive'])
+
+
+class ConcatStream(io.TextIOBase):
+    '''
+    Read-only text stream over an iterable of string pieces, which are only 
+    produced as the stream is read. Used by gencat.streamConcats.
+    '''
+    def __init__(self, pieces):
+        self._pieces = iter(pieces)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def _fill(self, size = -1, stop = None):
+        '''
+        Pull pieces into the buffer until it holds size characters or the 
+        stop character, or the pieces run out. Return False once exhausted.
+        '''
+        while (size < 0 or len(self._buffer) < size) and \
+              (stop is None or stop not in self._buffer):
+            try:
+                self._buffer += next(self._pieces)
+            except StopIteration:
+                return False
+        return True
+
+    def read(self, size = -1):
+        if size is None:
+            size = -1
+        self._fill(size)
+        if size < 0:
+            size = len(self._buffer)
+        text, self._buffer = self._buffer[:size], self._buffer[size:]
+        return text
+
+    def readline(self, size = -1):
+        self._fill(stop = '\n')
+        end = self._buffer.find('\n') + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        text, self._buffer = self._buffer[:end], self._buffer[end:]
+        return text
+
+    def close(self):
+        if hasattr(self._pieces, 'close'):
+            self._pieces.close()
+        super(ConcatStream, self).close()
+
 
 class gencat(object):
     '''
@@ -20,33 +83,86 @@ class gencat(object):
             by the class's main method.
         - path_out: the path to the directory to which a gencat object will save
             its final output. 
+        - zip_workers: the number of threads used to compress the members of each
+            output .zip file. Defaults to the number of CPUs.
+        - unzip_workers: the number of threads used to extract the input .zip files.
+            Defaults to the ThreadPoolExecutor default.
+        - dedup: what to do with a raw file whose content is identical to a file 
+            already concatenated. None (the default) concatenates it again, 
+            'reference' writes its NEWFILE header followed by a DUPLICATE OF: line
+            naming the earlier file, and 'skip' leaves it out.
+        - progress: a function called as progress(stage, stats) each time an input 
+            archive is extracted (stage 'unzip'), a concatenation is written ('concat')
+            or an output .zip file is compressed ('compress'). stats is self.stats,
+            the running counters described in resetStats.
     '''
 
     __metaclass__ = ABCMeta
+
+    # Checkpoint journal kept in path_out while main() runs.
+    journal_name = 'gencat_journal.txt'
+    # Members at least this large are extracted by a task of their own; smaller 
+    # members are extracted in batches of about this many bytes.
+    unzip_batch_bytes = 32 * 1024 * 1024
     
-    def __init__(self, path_in, path_temp, path_out):
+    def __init__(self, path_in, path_temp, path_out, zip_workers = None, dedup = None,
+                 progress = None, unzip_workers = None):
+        if dedup not in [None, 'reference', 'skip']:
+            raise ValueError("dedup must be None, 'reference' or 'skip', not %s" % (dedup, ))
         self.path_in = os.path.join(path_in, '')
         self.path_temp = os.path.join(path_temp, '')
         self.path_out = os.path.join(path_out, '')
+        self.zip_workers = zip_workers
+        self.unzip_workers = unzip_workers
+        self.dedup = dedup
+        self.progress = progress
         self.concat_dict = {}
         self.zip_dict = {}
+        self.members = []
+        self.duplicates = {}
+        self.dedup_stats = {'files': 0, 'bytes': 0}
+        self.journaling = False
+        self.resuming = False
+        self.completed = {'unzip': False, 'concat': set(), 'zip': set()}
+        self.archive_seconds = {}
+        self.resetStats()
 
     
-    def main(self):
+    def main(self, resume = False):
         '''
         Run all methods in order to produce fresh output. 
         Begins by wiping the path_temp and path_out directories.
+        Progress is recorded in a checkpoint journal in path_out (see writeJournal).
+        If resume is True and path_out holds the journal of an unfinished run, that run 
+        is continued instead: extraction is skipped if it had finished, and 
+        concatenations and .zip files recorded as complete are not redone.
         '''
-        self.cleanDir(self.path_temp)
-        self.cleanDir(self.path_out)
-        self.unzipFiles()
+        self.journaling = True
+        self.resetStats()
+        self.resuming = resume and os.path.isfile(os.path.join(self.path_out, self.journal_name))
+        if self.resuming:
+            self.readJournal()
+        else:
+            self.completed = {'unzip': False, 'concat': set(), 'zip': set()}
+            self.cleanDir(self.path_out)
+        if not (self.completed['unzip'] and os.path.isdir(self.path_temp)):
+            self.cleanDir(self.path_temp)
+            self.unzipFiles()
+            self.writeJournal('unzip')
+        self.indexMembers()
         self.makeConcatDict()
         self.makeZipDict()
         self.checkDicts()
+        if self.dedup:
+            self.findDuplicates()
         self.writeDict(self.concat_dict, 'concatDict.txt', self.path_temp)
         self.writeDict(self.zip_dict, 'zipDict.txt', '.')
         self.zipFiles()
+        self.writeStats('gencatStats.json')
         self.cleanDir(self.path_temp, new_dir = False)
+        os.remove(os.path.join(self.path_out, self.journal_name))
+        self.journaling = False
+        self.resuming = False
     
 
     def cleanDir(self, path, new_dir = True):
@@ -61,22 +177,212 @@ class gencat(object):
     
     def unzipFiles(self):
         '''
-        Unzips files from path_in to path_temp
+        Unzips files from path_in to path_temp.
+        Extraction is split into tasks that unzip_workers threads run in parallel: 
+        each member of at least unzip_batch_bytes is a task of its own and the 
+        remaining members of an archive are grouped into tasks of about that size.
+        Directories are created before any task starts, and when several members 
+        extract to the same path only the one a serial extraction would leave there,
+        the last in sorted archive and member order, is extracted, so no two tasks 
+        write the same file.
+        A task opens its own handle on its archive, so at most unzip_workers 
+        archives are open at once. The seconds from the first task of each archive
+        starting to its last task finishing are stored in self.archive_seconds.
         '''
-        infilenames = os.listdir(self.path_in)
-        
-        for infilename in infilenames:
+        self.archive_seconds = {}
+        archive_infos = OrderedDict()
+        for infilename in sorted(os.listdir(self.path_in)):
             infile = os.path.join(self.path_in, infilename)
+            if not os.path.isfile(infile):
+                continue
+            with open(infile, 'rb') as fh:
+                if not zipfile.is_zipfile(fh):
+                    continue
+                with zipfile.ZipFile(fh, 'r') as zf:
+                    archive_infos[infile] = zf.infolist()
         
-            if zipfile.is_zipfile(infile):
-                with zipfile.ZipFile(infile, 'r') as zf:
-                    zf.extractall(self.path_temp)
+        winners = {}
+        for infile, infos in archive_infos.items():
+            for info in infos:
+                path = self._extractPath(info)
+                if info.is_dir():
+                    os.makedirs(path, exist_ok = True)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok = True)
+                    winners[path] = (infile, info)
+        
+        tasks = []
+        archives = {}
+        for infile, infos in archive_infos.items():
+            infos = [info for info in infos if winners.get(self._extractPath(info)) == (infile, info)]
+            archive_tasks = self._unzipTasks(infos)
+            archives[infile] = {'tasks': len(archive_tasks), 'start': None, 'end': None,
+                                'files': 0, 'bytes_written': 0}
+            tasks.extend((infile, task_infos) for task_infos in archive_tasks)
+        
+        last = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = self.unzip_workers) as pool:
+            futures = [pool.submit(self._extractMembers, infile, infos) 
+                       for infile, infos in tasks]
+            for future in as_completed(futures):
+                infile, start, end, files, bytes_written = future.result()
+                archive = archives[infile]
+                archive['tasks'] -= 1
+                archive['start'] = start if archive['start'] is None else min(archive['start'], start)
+                archive['end'] = end if archive['end'] is None else max(archive['end'], end)
+                archive['files'] += files
+                archive['bytes_written'] += bytes_written
+                if archive['tasks'] == 0:
+                    self.archive_seconds[infile] = archive['end'] - archive['start']
+                    now = time.perf_counter()
+                    self.recordStage('unzip', now - last,
+                                     archives = 1, files = archive['files'], 
+                                     bytes_read = os.path.getsize(infile),
+                                     bytes_written = archive['bytes_written'])
+                    last = now
+        # An archive without members has no task to report it.
+        for infile, archive in archives.items():
+            if infile not in self.archive_seconds:
+                self.archive_seconds[infile] = 0.0
+                self.recordStage('unzip', 0.0, archives = 1, files = 0, 
+                                 bytes_read = os.path.getsize(infile), bytes_written = 0)
+    
+    def _unzipTasks(self, infos):
+        '''
+        Split the ZipInfos of one archive into lists extracted by a single task.
+        '''
+        tasks = []
+        batch = []
+        batch_bytes = 0
+        for info in infos:
+            if info.file_size >= self.unzip_batch_bytes:
+                tasks.append([info])
+                continue
+            batch.append(info)
+            batch_bytes += info.file_size
+            if batch_bytes >= self.unzip_batch_bytes:
+                tasks.append(batch)
+                batch = []
+                batch_bytes = 0
+        if batch:
+            tasks.append(batch)
+        return tasks
+    
+    def _extractPath(self, info):
+        '''
+        Return the path under path_temp that zipfile extracts the member info to.
+        '''
+        arcname = os.path.splitdrive(info.filename.replace('/', os.path.sep))[1]
+        parts = [part for part in arcname.split(os.path.sep) 
+                 if part not in ('', os.path.curdir, os.path.pardir)]
+        return os.path.join(self.path_temp, *parts)
+    
+    def _extractMembers(self, infile, infos):
+        '''
+        Extract the file members described by infos from the archive infile to 
+        path_temp, whose directories unzipFiles has already created.
+        Returns (infile, start time, end time, files extracted, bytes written).
+        '''
+        start = time.perf_counter()
+        with zipfile.ZipFile(infile, 'r') as zf:
+            for info in infos:
+                zf.extract(info, self.path_temp)
+        return (infile, start, time.perf_counter(), len(infos), 
+                sum(info.file_size for info in infos))
+    
+    def indexMembers(self):
+        '''
+        Catalogue every file stored in the .zip files in path_in as a Member
+        (name, path, size, crc, archive), read from each archive's central directory.
+        Archives are indexed in sorted order and members in archive order.
+        Stores the catalogue as the list self.members and returns it.
+        '''
+        self.members = []
+        for infilename in sorted(os.listdir(self.path_in)):
+            infile = os.path.join(self.path_in, infilename)
+            if not os.path.isfile(infile):
+                continue
+            
+            with open(infile, 'rb') as fh:
+                if not zipfile.is_zipfile(fh):
+                    continue
+                with zipfile.ZipFile(fh, 'r') as zf:
+                    for info in zf.infolist():
+                        if not info.is_dir():
+                            path = os.path.join(self.path_temp, info.filename)
+                            self.members.append(Member(info.filename, path, info.file_size,
+                                                       info.CRC, infile))
+        return self.members
+    
+    def groupMembers(self, key, members = None):
+        '''
+        Group indexed members into a dictionary suitable for self.concat_dict. 
+        Each value is a tuple of member paths in index order.
+        See groupKeys for the forms key can take; a regular expression is 
+        searched for in each member's name.
+        '''
+        if members is None:
+            members = self.members
+        names = [member.name for member in members]
+        paths = [member.path for member in members]
+        if callable(key):
+            keys = [key(member) for member in members]
+        else:
+            keys = self.groupKeys(key, names)
+        return self._group(keys, paths)
+    
+    def groupConcats(self, key, concat_keys = None):
+        '''
+        Group concatenation keys into a dictionary suitable for self.zip_dict.
+        Each value is a sorted tuple of keys of self.concat_dict.
+        key is a regular expression or a function of a concatenation key (see groupKeys).
+        '''
+        if concat_keys is None:
+            concat_keys = sorted(self.concat_dict.keys())
+        if callable(key):
+            keys = [key(concat_key) for concat_key in concat_keys]
+        else:
+            keys = self.groupKeys(key, concat_keys)
+        return self._group(keys, concat_keys)
+    
+    def groupKeys(self, pattern, names):
+        '''
+        Return the group key of each string in names under the regular expression 
+        pattern, which is compiled once. The key is the text matched by the capture 
+        groups, joined by '_', or the whole match if pattern has no groups. 
+        Names that do not match get the key None and are left out of any group.
+        '''
+        regex = re.compile(pattern)
+        search = regex.search
+        if regex.groups == 0:
+            matches = [search(name) for name in names]
+            return [m.group(0) if m else None for m in matches]
+        keys = []
+        for name in names:
+            m = search(name)
+            if m is None or None in m.groups():
+                keys.append(None)
+            else:
+                keys.append('_'.join(m.groups()))
+        return keys
+    
+    def _group(self, keys, values):
+        '''
+        Collect values into tuples by their key, skipping values whose key is None.
+        '''
+        groups = OrderedDict()
+        for key, value in zip(keys, values):
+            if key is not None:
+                groups.setdefault(key, []).append(value)
+        return {key: tuple(group) for key, group in groups.items()}
     
     @abstractmethod
     def makeConcatDict(self):
         '''
         This method should assign a dictionary to self.concat_dict where each key is a distinct concatenated  
         filename and the values for the key are all raw files to be concatenated.
+        self.groupMembers can build this dictionary from self.members, e.g.
+            self.concat_dict = self.groupMembers(r'^(.+?)_[0-9]+[.]txt$')
         '''
         pass
     
@@ -85,6 +391,8 @@ class gencat(object):
         '''
         This method should assign a dictionary to self.zip_dict where each key is a distinct zipfile and the 
         values for the key are all concatenated files to be contained in the zipfile.
+        self.groupConcats can build this dictionary from self.concat_dict, e.g.
+            self.zip_dict = self.groupConcats(lambda concat_key: concat_key[:4])
         '''
         pass
         
@@ -101,6 +409,235 @@ class gencat(object):
                         raise TypeError('All keys in dictionary %s must be tuples. Check key %s, and try again.' % (d, key))
     
     
+    def streamConcats(self, make_dicts = True):
+        '''
+        Yield (concat_key, stream) pairs in self.concat_dict order without writing any 
+        temporary files or archives. Each stream is a read-only text file-like object
+        holding exactly what zipFiles would write for concat_key, with the 
+        NEWFILE\nFILENAME: headers injected as the stream is read. Raw files that exist
+        on disk are read from there; otherwise indexed members are read straight out of
+        their input archive. Each stream opens the archives it reads itself and closes
+        them once it is exhausted or closed, so streams can be kept and read in any
+        order, including after the iteration has finished.
+        If make_dicts is True, indexMembers and makeConcatDict are run first. If dedup
+        is set, findDuplicates is run over the concatenations in the order they are 
+        yielded.
+        '''
+        if make_dicts:
+            self.indexMembers()
+            self.makeConcatDict()
+        if self.dedup:
+            self.findDuplicates(list(self.concat_dict.keys()))
+        index = {member.path: member for member in self.members}
+        
+        def pieces(entries):
+            archives = {}
+            
+            def open_raw(concat_val):
+                member = index.get(concat_val)
+                if os.path.isfile(concat_val) or member is None:
+                    return open(concat_val, 'r')
+                if member.archive not in archives:
+                    archives[member.archive] = zipfile.ZipFile(member.archive, 'r')
+                return io.TextIOWrapper(archives[member.archive].open(member.name, 'r'))
+            
+            try:
+                for concat_val, original, duplicate in entries:
+                    if duplicate:
+                        if self.dedup == 'reference':
+                            yield '\nNEWFILE\nFILENAME: %s\nDUPLICATE OF: %s\n' \
+                                  % (os.path.basename(concat_val), os.path.basename(original))
+                        continue
+                    yield '\nNEWFILE\nFILENAME: %s\n\n' % (os.path.basename(concat_val))
+                    with open_raw(concat_val) as f:
+                        for line in f:
+                            yield line
+            finally:
+                for zf in archives.values():
+                    zf.close()
+        
+        concatenated = set()
+        self.dedup_stats = {'files': 0, 'bytes': 0}
+        for concat_key in self.concat_dict.keys():
+            entries = list(self.concatEntries(concat_key, concatenated, index))
+            yield concat_key, ConcatStream(pieces(entries))
+    
+    def findDuplicates(self, concat_keys = None):
+        '''
+        Map each raw file in self.concat_dict whose content repeats an earlier raw file
+        to that earlier file. Files are taken in the order of concat_keys, which defaults
+        to the order zipFiles concatenates them in, zip file by zip file.
+        Only indexed members (see indexMembers) with equal size and CRC-32 are 
+        compared, and a match is confirmed by SHA-256 before it is recorded. Members
+        that have not been extracted are read from their input archive.
+        Stores the {duplicate path: original path} mapping as self.duplicates.
+        '''
+        index = {member.path: member for member in self.members}
+        originals = {}
+        digests = {}
+        if concat_keys is None:
+            concat_keys = [concat_key for zip_key in self.zip_dict.keys()
+                           for concat_key in self.zip_dict[zip_key]]
+        
+        def update(sha, f):
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        
+        def digest(path):
+            if path not in digests:
+                sha = hashlib.sha256()
+                if os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        update(sha, f)
+                else:
+                    with zipfile.ZipFile(index[path].archive, 'r') as zf:
+                        with zf.open(index[path].name, 'r') as f:
+                            update(sha, f)
+                digests[path] = sha.digest()
+            return digests[path]
+        
+        self.duplicates = {}
+        for concat_key in concat_keys:
+            for concat_val in self.concat_dict[concat_key]:
+                member = index.get(concat_val)
+                if member is None or concat_val in self.duplicates:
+                    continue
+                candidates = originals.setdefault((member.size, member.crc), [])
+                if concat_val in candidates:
+                    continue
+                for original in candidates:
+                    if digest(original) == digest(concat_val):
+                        self.duplicates[concat_val] = original
+                        break
+                else:
+                    candidates.append(concat_val)
+        return self.duplicates
+    
+    def readJournal(self):
+        '''
+        Read the checkpoint journal in path_out into self.completed, a dictionary recording
+        whether extraction finished ('unzip'), the (zip_key, concat_key) pairs whose
+        concatenations were written ('concat') and the finished .zip files ('zip').
+        A torn last line, left by a crash mid-write, is ignored.
+        '''
+        self.completed = {'unzip': False, 'concat': set(), 'zip': set()}
+        journal_path = os.path.join(self.path_out, self.journal_name)
+        if os.path.isfile(journal_path):
+            with open(journal_path, 'r') as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record[0] == 'unzip':
+                        self.completed['unzip'] = True
+                    elif record[0] == 'concat':
+                        self.completed['concat'].add(tuple(record[1:]))
+                    elif record[0] == 'zip':
+                        self.completed['zip'].add(record[1])
+        return self.completed
+    
+    def writeJournal(self, *record):
+        '''
+        Append a record (a JSON list on its own line) to the checkpoint journal and fsync it.
+        Records are only kept while main() is running.
+        '''
+        if not self.journaling:
+            return
+        journal_path = os.path.join(self.path_out, self.journal_name)
+        with open(journal_path, 'a') as journal:
+            journal.write(json.dumps(list(record)) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+    
+    def commitFile(self, partial_path, final_path):
+        '''
+        Flush partial_path to disk and atomically rename it to final_path.
+        '''
+        with open(partial_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(partial_path, final_path)
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(final_path)), os.O_RDONLY)
+        except OSError:
+            # Directories cannot be opened on Windows; the rename is still atomic.
+            return
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
+    def concatEntries(self, concat_key, concatenated, index = None):
+        '''
+        Yield (raw file, original, is_duplicate) for each raw file of concat_key in order.
+        original is the file whose content the raw file repeats (see findDuplicates). 
+        When dedup is set, a raw file is a duplicate if its original is in the set 
+        concatenated; otherwise its original is added to concatenated. 
+        Duplicates are counted in self.dedup_stats, taking the size of a file that is
+        not on disk from index, a dictionary of Members keyed by path.
+        '''
+        for concat_val in self.concat_dict[concat_key]:
+            original = self.duplicates.get(concat_val, concat_val)
+            duplicate = bool(self.dedup) and original in concatenated
+            if duplicate:
+                self.dedup_stats['files'] += 1
+                if index is not None and not os.path.isfile(concat_val):
+                    self.dedup_stats['bytes'] += index[concat_val].size
+                else:
+                    self.dedup_stats['bytes'] += os.path.getsize(concat_val)
+            else:
+                concatenated.add(original)
+            yield concat_val, original, duplicate
+    
+    def resetStats(self):
+        '''
+        Zero self.stats, the throughput counters kept for each stage of a run:
+            - unzip: seconds, archives, files, bytes_read (compressed), bytes_written
+            - concat: seconds, concats, files, bytes_read, bytes_written
+            - compress: seconds, archives, members, bytes_uncompressed, bytes_compressed
+        '''
+        self.stats = {'unzip': {'seconds': 0.0, 'archives': 0, 'files': 0,
+                                'bytes_read': 0, 'bytes_written': 0},
+                      'concat': {'seconds': 0.0, 'concats': 0, 'files': 0,
+                                 'bytes_read': 0, 'bytes_written': 0},
+                      'compress': {'seconds': 0.0, 'archives': 0, 'members': 0,
+                                   'bytes_uncompressed': 0, 'bytes_compressed': 0}}
+    
+    def recordStage(self, stage, seconds, **counts):
+        '''
+        Add seconds and counts to the counters of stage in self.stats and 
+        pass the updated counters to the progress callback.
+        '''
+        stage_stats = self.stats[stage]
+        stage_stats['seconds'] += seconds
+        for key, value in counts.items():
+            stage_stats[key] += value
+        if self.progress is not None:
+            self.progress(stage, self.stats)
+    
+    def writeStats(self, name):
+        '''
+        Write self.stats to path_out as JSON, adding files (or members) per second and 
+        megabytes written per second for each stage, and the seconds spent 
+        extracting each input archive.
+        '''
+        summary = {}
+        for stage, stage_stats in self.stats.items():
+            summary[stage] = dict(stage_stats)
+            seconds = stage_stats['seconds']
+            files = stage_stats.get('files', stage_stats.get('members'))
+            written = stage_stats.get('bytes_written', stage_stats.get('bytes_compressed'))
+            summary[stage]['files_per_second'] = files / seconds if seconds else None
+            summary[stage]['mb_written_per_second'] = written / seconds / 1e6 if seconds else None
+        summary['unzip']['archive_seconds'] = dict((os.path.basename(infile), seconds) 
+                                                   for infile, seconds in self.archive_seconds.items())
+        if self.dedup:
+            summary['dedup'] = dict(self.dedup_stats)
+        outfile_path = os.path.join(self.path_out, name)
+        with open(outfile_path, 'w') as outfile:
+            json.dump(summary, outfile, indent = 4, sort_keys = True)
+        return summary
+    
     def writeDict(self, dict, name, rel_path):
         '''
         Write the dictionary to output as a |-delimited text file. The elements of each tuple are
@@ -125,30 +662,92 @@ class gencat(object):
         Files are concatenated in the order in which they appear in the dictionary value. 
         Places NEWFILE\nFILENAME: <original filename> before each new file in the concatenation.
         Stores all concatenated files to .zip file(s) with ZIP64 compression in path_out.
+        The members of each .zip file are compressed in parallel by zip_workers threads.
+        If dedup is set, a raw file whose content was already concatenated (the file itself,
+        or its original in self.duplicates) is referenced or skipped instead, and 
+        self.dedup_stats counts these files and the bytes they would have added.
+        Each .zip file is built under a .partial name and committed with commitFile. 
+        Finished concatenations and .zip files are recorded in the checkpoint journal, and
+        those listed in self.completed by a resumed run are reused rather than rebuilt.
         '''
+        concatenated = set()
+        self.dedup_stats = {'files': 0, 'bytes': 0}
         for zip_key in self.zip_dict.keys():
             catdirpath = os.path.join(self.path_temp, zip_key, '')
-            os.makedirs(catdirpath)
             inzippath = os.path.join('..', zip_key, '')
-            self.cleanDir(inzippath)
 
             outzipname = zip_key + '.zip'
             outzippath = os.path.join(self.path_out, outzipname)
-            zf         = zipfile.ZipFile(outzippath, 'a', zipfile.ZIP_DEFLATED, True)
+            # A resumed run cleaned path_out when it started, and .zip files are
+            # committed whole, so one that exists was finished even if the run
+            # stopped before journaling it.
+            committed = zip_key in self.completed['zip'] or self.resuming
+            if committed and os.path.isfile(outzippath):
+                for concat_key in self.zip_dict[zip_key]:
+                    for _ in self.concatEntries(concat_key, concatenated):
+                        pass
+                if zip_key not in self.completed['zip']:
+                    self.writeJournal('zip', zip_key)
+                continue
+
+            if not os.path.isdir(catdirpath):
+                os.makedirs(catdirpath)
+            partialpath = outzippath + '.partial'
+            if os.path.isfile(outzippath):
+                shutil.copyfile(outzippath, partialpath)
+            elif os.path.isfile(partialpath):
+                os.remove(partialpath)
+            zf         = ParallelZipFile(partialpath, 'a', workers = self.zip_workers)
             
             for zip_val in self.zip_dict[zip_key]:
                 catfilename = zip_val + '.txt'
                 catfilepath = os.path.join(catdirpath, catfilename)
-                with open(catfilepath, 'a') as catfile:
-                    concat_key = zip_val 
-                    for concat_val in self.concat_dict[concat_key]:
-                        catfile.write('\nNEWFILE\nFILENAME: %s\n\n' % (os.path.basename(concat_val)))
-                        with open(concat_val, 'r') as f:
-                            for line in f:
-                                catfile.write(line)
+                concat_key = zip_val 
+                entries = self.concatEntries(concat_key, concatenated)
+                if (zip_key, concat_key) in self.completed['concat'] and os.path.isfile(catfilepath):
+                    for _ in entries:
+                        pass
+                else:
+                    if self.resuming and os.path.isfile(catfilepath):
+                        os.remove(catfilepath)
+                    start = time.perf_counter()
+                    files_read = 0
+                    bytes_read = 0
+                    with open(catfilepath, 'a') as catfile:
+                        for concat_val, original, duplicate in entries:
+                            if duplicate:
+                                if self.dedup == 'reference':
+                                    catfile.write('\nNEWFILE\nFILENAME: %s\nDUPLICATE OF: %s\n' 
+                                                  % (os.path.basename(concat_val), os.path.basename(original)))
+                                continue
+                            catfile.write('\nNEWFILE\nFILENAME: %s\n\n' % (os.path.basename(concat_val)))
+                            with open(concat_val, 'r') as f:
+                                for line in f:
+                                    catfile.write(line)
+                            bytes_read += os.path.getsize(concat_val)
+                            files_read += 1
+                        if self.journaling:
+                            catfile.flush()
+                            os.fsync(catfile.fileno())
+                    self.recordStage('concat', time.perf_counter() - start, concats = 1,
+                                     files = files_read, bytes_read = bytes_read,
+                                     bytes_written = os.path.getsize(catfilepath))
+                    self.writeJournal('concat', zip_key, concat_key)
                 
                 inzipfile = os.path.join(inzippath, catfilename) 
-                shutil.copyfile(catfilepath, inzipfile)
-                zf.write(inzipfile)
+                zf.write(catfilepath, inzipfile)
+        
+            start = time.perf_counter()
+            members = len(zf.members)
+            uncompressed = sum(zinfo.file_size for zinfo, _ in zf.members)
+            zf.close()
+            self.recordStage('compress', time.perf_counter() - start, archives = 1,
+                             members = members, bytes_uncompressed = uncompressed,
+                             bytes_compressed = os.path.getsize(partialpath))
+            self.commitFile(partialpath, outzippath)
+            self.writeJournal('zip', zip_key)
         
-            self.cleanDir(inzippath, new_dir = False)
+        if self.dedup:
+            print('gencat dedup: %d duplicate files (%d bytes) %s' 
+                  % (self.dedup_stats['files'], self.dedup_stats['bytes'],
+                     'referenced' if self.dedup == 'reference' else 'skipped'))
@@ -0,0 +1,105 @@
+import unittest
+import os
+import shutil
+import zipfile
+import sys
+
+# Ensure that Python can find and load gencat.py
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../')
+
+from gencat import gencat, Member
+
+class MockCat(gencat):
+    def makeZipDict(self):
+        self.zip_dict = {'zip1': ('concat1', 'concat2')}
+    def makeConcatDict(self):
+        self.concat_dict = {'concat1': ('./test_temp/a.txt', './test_temp/b.txt'),
+                            'concat2': ('./test_temp/c.txt', './test_temp/a.txt')}
+
+
+class test_findDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        paths = ['./test_data', './test_temp', './test_out']
+        for path in paths:
+            try:
+                os.makedirs(path)
+            except:
+                shutil.rmtree(path, ignore_errors = True)
+                os.makedirs(path)
+        with zipfile.ZipFile('./test_data/in.zip', 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('a.txt', 'SAME TEXT.\n')
+            zf.writestr('b.txt', 'OTHER TEXT.\n')
+            zf.writestr('c.txt', 'SAME TEXT.\n')
+
+    def readConcats(self):
+        with zipfile.ZipFile('./test_out/zip1.zip', 'r') as zf:
+            zf.extractall('./test_out/')
+        texts = []
+        for concat in ['concat1', 'concat2']:
+            with open('./test_out/zip1/%s.txt' % concat, 'r') as f:
+                texts.append(f.read())
+        return texts
+
+    def test_findDuplicates(self):
+        '''
+        Test that a file is mapped to the first file with identical content in 
+        concatenation order.
+        '''
+        testcat = MockCat('./test_data', './test_temp', './test_out', dedup = 'skip')
+        testcat.unzipFiles()
+        testcat.indexMembers()
+        testcat.makeConcatDict()
+        testcat.makeZipDict()
+        self.assertEqual(testcat.findDuplicates(), {'./test_temp/c.txt': './test_temp/a.txt'})
+
+    def test_hashConfirmation(self):
+        '''
+        Test that files sharing size and CRC but not content are not duplicates.
+        '''
+        testcat = MockCat('./test_data', './test_temp', './test_out', dedup = 'skip')
+        testcat.unzipFiles()
+        testcat.members = [Member(name, './test_temp/%s' % name, 11, 0, './test_data/in.zip')
+                           for name in ['a.txt', 'b.txt', 'c.txt']]
+        testcat.makeConcatDict()
+        testcat.makeZipDict()
+        self.assertEqual(testcat.findDuplicates(), {'./test_temp/c.txt': './test_temp/a.txt'})
+
+    def test_skip(self):
+        '''
+        Test that duplicates are left out of concatenations and counted.
+        '''
+        testcat = MockCat('./test_data', './test_temp', './test_out', dedup = 'skip')
+        testcat.main()
+        concat1, concat2 = self.readConcats()
+        self.assertEqual(concat1, '\nNEWFILE\nFILENAME: a.txt\n\nSAME TEXT.\n' + 
+                                  '\nNEWFILE\nFILENAME: b.txt\n\nOTHER TEXT.\n')
+        self.assertEqual(concat2, '')
+        self.assertEqual(testcat.dedup_stats, {'files': 2, 'bytes': 22})
+
+    def test_reference(self):
+        '''
+        Test that duplicates are replaced by a reference to the earlier file.
+        '''
+        testcat = MockCat('./test_data', './test_temp', './test_out', dedup = 'reference')
+        testcat.main()
+        concat1, concat2 = self.readConcats()
+        self.assertEqual(concat2, '\nNEWFILE\nFILENAME: c.txt\nDUPLICATE OF: a.txt\n' + 
+                                  '\nNEWFILE\nFILENAME: a.txt\nDUPLICATE OF: a.txt\n')
+
+    def test_badOption(self):
+        '''
+        Test that an unknown dedup option raises a ValueError.
+        '''
+        with self.assertRaises(ValueError):
+            MockCat('./test_data', './test_temp', './test_out', dedup = 'drop')
+
+    def tearDown(self):
+        paths = ['./test_data', './test_temp', './test_out']
+        for path in paths:
+            shutil.rmtree(path, ignore_errors = True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import os
+import sys
+
+# Ensure that Python can find and load gencat.py
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../')
+
+from gencat import gencat, Member
+
+class MockCat(gencat):
+    def makeZipDict(self):
+        self.zip_dict = self.groupConcats(lambda concat_key: concat_key[:4])
+    def makeConcatDict(self):
+        self.concat_dict = self.groupMembers(r'^(\w+?)_\d+\.txt$')
+
+
+def member(name):
+    return Member(name, './test_temp/%s' % name, 1, 0, './test_data/in.zip')
+
+
+class test_groupMembers(unittest.TestCase):
+
+    def setUp(self):
+        self.testcat = MockCat('./test_data', './test_temp', './test_out')
+        self.testcat.members = [member(name) for name in 
+                                ['docA_2.txt', 'docA_1.txt', 'docB_1.txt', 'notes.csv']]
+
+    def test_regex(self):
+        '''
+        Test that members are grouped by their capture group in index order and that 
+        members which do not match are left out.
+        '''
+        self.testcat.makeConcatDict()
+        self.assertEqual(self.testcat.concat_dict,
+                         {'docA': ('./test_temp/docA_2.txt', './test_temp/docA_1.txt'),
+                          'docB': ('./test_temp/docB_1.txt', )})
+        self.testcat.makeZipDict()
+        self.assertEqual(self.testcat.zip_dict, {'docA': ('docA', ), 'docB': ('docB', )})
+        self.testcat.checkDicts()
+
+    def test_multipleGroups(self):
+        '''
+        Test that multiple capture groups are joined by underscores and that a pattern
+        without groups uses the whole match.
+        '''
+        groups = self.testcat.groupMembers(r'^doc(\w)_(\d)')
+        self.assertEqual(sorted(groups.keys()), ['A_1', 'A_2', 'B_1'])
+        groups = self.testcat.groupMembers(r'\.csv$')
+        self.assertEqual(groups, {'.csv': ('./test_temp/notes.csv', )})
+
+    def test_keyFunction(self):
+        '''
+        Test that a key function receives members and that a None key drops the member.
+        '''
+        key = lambda m: None if m.name.endswith('.csv') else m.name[3]
+        groups = self.testcat.groupMembers(key)
+        self.assertEqual(groups, {'A': ('./test_temp/docA_2.txt', './test_temp/docA_1.txt'),
+                                  'B': ('./test_temp/docB_1.txt', )})
+        zips = self.testcat.groupConcats(r'(\w)', concat_keys = ['a1', 'a2', 'b1'])
+        self.assertEqual(zips, {'a': ('a1', 'a2'), 'b': ('b1', )})
+
+
+if __name__ == '__main__':
+    unittest.main()
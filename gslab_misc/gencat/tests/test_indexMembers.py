@@ -0,0 +1,74 @@
+import unittest
+import os
+import shutil
+import zipfile
+import zlib
+import sys
+
+# Ensure that Python can find and load gencat.py
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../')
+
+from gencat import gencat
+
+class MockCat(gencat):
+    def makeZipDict(self):
+        pass
+    def makeConcatDict(self):
+        pass
+
+
+class test_indexMembers(unittest.TestCase):
+
+    def setUp(self):
+        paths = ['./test_data', './test_temp', './test_out']
+        for path in paths:
+            try:
+                os.makedirs(path)
+            except:
+                shutil.rmtree(path, ignore_errors = True)
+                os.makedirs(path)
+
+    def test_noZipFile(self):
+        '''
+        Test that the index is empty when there is no zip file in the input directory.
+        '''
+        with open('./test_data/test.txt', 'w') as f:
+            f.write('test')
+
+        testcat = MockCat('./test_data', './test_temp', './test_out')
+        self.assertEqual(testcat.indexMembers(), [])
+        self.assertEqual(testcat.members, [])
+
+    def test_twoZipFile(self):
+        '''
+        Test that members of every zip file are indexed with their name, extracted
+        path, size, CRC and archive, in sorted archive order.
+        '''
+        contents = {'b_zip.zip': {'b1.txt': 'test b1'},
+                    'a_zip.zip': {'a1.txt': 'test a1\n', 'a2.txt': 'a2'}}
+        for zipname in contents:
+            with zipfile.ZipFile('./test_data/%s' % zipname, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for name, text in sorted(contents[zipname].items()):
+                    zf.writestr(name, text)
+
+        testcat = MockCat('./test_data', './test_temp', './test_out')
+        testcat.indexMembers()
+
+        self.assertEqual([m.name for m in testcat.members], ['a1.txt', 'a2.txt', 'b1.txt'])
+        for member in testcat.members:
+            archive = os.path.basename(member.archive)
+            text    = contents[archive][member.name].encode()
+            self.assertEqual(member.path, os.path.join('./test_temp', member.name))
+            self.assertEqual(member.size, len(text))
+            self.assertEqual(member.crc, zlib.crc32(text))
+            self.assertEqual(member.archive, os.path.join('./test_data', archive))
+
+    def tearDown(self):
+        paths = ['./test_data', './test_temp', './test_out']
+        for path in paths:
+            shutil.rmtree(path, ignore_errors = True)
+
+
+if __name__ == '__main__':
+    unittest.main()
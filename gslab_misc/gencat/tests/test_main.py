@@ -2,7 +2,9 @@ import unittest
 import os
 import shutil
 import zipfile
+import json
 import sys
+from unittest import mock
 
 # Ensure that Python can find and load gencat.py
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
@@ -61,8 +63,91 @@ class test_main(unittest.TestCase):
                     '\n\nNEWFILE\nFILENAME: file2.txt\n\nTHIS IS TEST FILE 2.\n'
         self.assertEqual(text, test_text)
 
+    def test_stats(self):
+        '''
+        Test that the progress callback sees every stage and that a JSON summary
+        of the run's counters is written to the output directory.
+        '''
+        with zipfile.ZipFile('./test_data/in.zip', 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('file3.txt', 'THIS IS TEST FILE 3.\n')
+        calls = []
+        progress = lambda stage, stats: calls.append((stage, stats[stage]['seconds']))
+        testcat = MockCat('./test_data', './test_temp', './test_out', progress = progress)
+        testcat.main()
+
+        self.assertEqual([stage for stage, _ in calls], ['unzip', 'concat', 'compress'])
+        with open('./test_out/gencatStats.json', 'r') as f:
+            stats = json.load(f)
+        self.assertEqual(stats['unzip']['archives'], 1)
+        self.assertEqual(stats['unzip']['bytes_written'], 21)
+        self.assertEqual(stats['concat']['files'], 2)
+        self.assertEqual(stats['concat']['bytes_read'], 42)
+        self.assertEqual(stats['compress']['members'], 1)
+        self.assertEqual(stats['compress']['bytes_uncompressed'], stats['concat']['bytes_written'])
+        self.assertIn('files_per_second', stats['concat'])
+
+    def test_resume(self):
+        '''
+        Test that a run which stops partway can be resumed without redoing finished 
+        .zip files, and that the checkpoint journal is removed once the run completes.
+        '''
+        class TwoZipCat(gencat):
+            def makeZipDict(self):
+                self.zip_dict = {'zip1': ('concat1', ), 'zip2': ('concat2', )}
+            def makeConcatDict(self):
+                self.concat_dict = {'concat1': ('./test_data/file1.txt', ),
+                                    'concat2': ('./test_data/file3.txt', )}
+
+        testcat = TwoZipCat('./test_data', './test_temp', './test_out')
+        with self.assertRaises(IOError):
+            testcat.main()
+        
+        self.assertTrue(os.path.isfile('./test_out/zip1.zip'))
+        self.assertFalse(os.path.isfile('./test_out/zip2.zip'))
+        self.assertTrue(os.path.isfile('./test_out/gencat_journal.txt'))
+        zip1_stat = os.stat('./test_out/zip1.zip')
+
+        with open('./test_data/file3.txt', 'w') as f:
+            f.write('THIS IS TEST FILE 3.\n')
+        testcat = TwoZipCat('./test_data', './test_temp', './test_out')
+        testcat.main(resume = True)
+
+        self.assertEqual(os.stat('./test_out/zip1.zip').st_mtime_ns, zip1_stat.st_mtime_ns)
+        self.assertFalse(os.path.isfile('./test_out/gencat_journal.txt'))
+        self.assertFalse(os.path.isfile('./test_out/zip2.zip.partial'))
+        self.assertFalse(os.path.isdir('./test_temp'))
+        with zipfile.ZipFile('./test_out/zip2.zip', 'r') as zf:
+            text = zf.read(zf.namelist()[0]).decode()
+        self.assertEqual(text, '\nNEWFILE\nFILENAME: file3.txt\n\nTHIS IS TEST FILE 3.\n')
+
+    def test_resume_unjournaled_zip(self):
+        '''
+        Test that a .zip file committed just before a run stopped, but not yet
+        recorded in the journal, is kept as it is when the run is resumed.
+        '''
+        write_journal = gencat.writeJournal
+        def crash_on_zip(self, *record):
+            if record[0] == 'zip':
+                raise IOError('Stopped before journaling %s' % record[1])
+            return write_journal(self, *record)
+
+        testcat = MockCat('./test_data', './test_temp', './test_out')
+        with mock.patch.object(gencat, 'writeJournal', crash_on_zip):
+            with self.assertRaises(IOError):
+                testcat.main()
+        zip1_stat = os.stat('./test_out/zip1.zip')
+
+        testcat = MockCat('./test_data', './test_temp', './test_out')
+        testcat.main(resume = True)
+
+        self.assertEqual(os.stat('./test_out/zip1.zip').st_mtime_ns, zip1_stat.st_mtime_ns)
+        with zipfile.ZipFile('./test_out/zip1.zip', 'r') as zf:
+            self.assertEqual(zf.namelist(), ['../zip1/concat1.txt'])
+            self.assertIsNone(zf.testzip())
+        self.assertFalse(os.path.isfile('./test_out/gencat_journal.txt'))
+
     def tearDown(self):
-        paths = ['./test_data', './test_out']
+        paths = ['./test_data', './test_temp', './test_out']
         for path in paths:
             shutil.rmtree(path, ignore_errors = True)
 
@@ -0,0 +1,107 @@
+import unittest
+import os
+import shutil
+import zipfile
+import sys
+
+# Ensure that Python can find and load gencat.py
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../')
+
+from gencat import gencat
+
+class MockCat(gencat):
+    def makeZipDict(self):
+        self.zip_dict = {'zip1': ('concat1', 'concat2')}
+    def makeConcatDict(self):
+        self.concat_dict = self.groupMembers(r'^(concat\d)_')
+
+
+class test_streamConcats(unittest.TestCase):
+
+    def setUp(self):
+        paths = ['./test_data', './test_temp', './test_out']
+        for path in paths:
+            try:
+                os.makedirs(path)
+            except:
+                shutil.rmtree(path, ignore_errors = True)
+                os.makedirs(path)
+        with zipfile.ZipFile('./test_data/in.zip', 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('concat1_a.txt', 'LINE A1.\nLINE A2.\n')
+            zf.writestr('concat2_b.txt', 'LINE B1.\n')
+            zf.writestr('concat1_c.txt', 'LINE C1.')
+
+    def test_fromArchives(self):
+        '''
+        Test that streams are read straight from the input archives, in concat_dict 
+        order, without writing any files.
+        '''
+        testcat = MockCat('./test_data', './test_temp', './test_out')
+        streams = [(key, stream.read()) for key, stream in testcat.streamConcats()]
+        
+        self.assertEqual(streams, 
+                         [('concat1', '\nNEWFILE\nFILENAME: concat1_a.txt\n\nLINE A1.\nLINE A2.\n' + 
+                                      '\nNEWFILE\nFILENAME: concat1_c.txt\n\nLINE C1.'),
+                          ('concat2', '\nNEWFILE\nFILENAME: concat2_b.txt\n\nLINE B1.\n')])
+        self.assertEqual(os.listdir('./test_temp'), [])
+        self.assertEqual(os.listdir('./test_out'), [])
+
+    def test_matchesZipFiles(self):
+        '''
+        Test that streams hold the same text as the concatenations written by main(),
+        and that they can be read line by line or in small pieces.
+        '''
+        testcat = MockCat('./test_data', './test_temp', './test_out')
+        streams = testcat.streamConcats()
+        key, stream = next(streams)
+        lines = list(stream)
+        key, stream = next(streams)
+        pieces = iter(lambda: stream.read(3), '')
+        streamed = {'concat1': ''.join(lines), 'concat2': ''.join(pieces)}
+        streams.close()
+        
+        self.assertEqual(lines[1], 'NEWFILE\n')
+        testcat.main()
+        with zipfile.ZipFile('./test_out/zip1.zip', 'r') as zf:
+            for name in zf.namelist():
+                concat_key = os.path.splitext(os.path.basename(name))[0]
+                self.assertEqual(zf.read(name).decode(), streamed[concat_key])
+
+    def test_keptStreams(self):
+        '''
+        Test that streams collected from the iterator can be read afterwards, in 
+        any order, and closed before they are finished.
+        '''
+        testcat = MockCat('./test_data', './test_temp', './test_out')
+        streams = dict(testcat.streamConcats())
+        
+        self.assertEqual(streams['concat2'].read(), '\nNEWFILE\nFILENAME: concat2_b.txt\n\nLINE B1.\n')
+        self.assertEqual(streams['concat1'].readline(), '\n')
+        streams['concat1'].close()
+        self.assertEqual(streams['concat1'].closed, True)
+
+    def test_dedup(self):
+        '''
+        Test that members whose content repeats an earlier member are found in the
+        input archives and referenced rather than streamed again.
+        '''
+        with zipfile.ZipFile('./test_data/in.zip', 'a', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('concat2_d.txt', 'LINE A1.\nLINE A2.\n')
+        testcat = MockCat('./test_data', './test_temp', './test_out', dedup = 'reference')
+        streams = [(key, stream.read()) for key, stream in testcat.streamConcats()]
+        
+        self.assertEqual(streams[1],
+                         ('concat2', '\nNEWFILE\nFILENAME: concat2_b.txt\n\nLINE B1.\n' + 
+                                     '\nNEWFILE\nFILENAME: concat2_d.txt\nDUPLICATE OF: concat1_a.txt\n'))
+        self.assertEqual(testcat.dedup_stats, {'files': 1, 'bytes': 18})
+        self.assertEqual(os.listdir('./test_temp'), [])
+
+    def tearDown(self):
+        paths = ['./test_data', './test_temp', './test_out']
+        for path in paths:
+            shutil.rmtree(path, ignore_errors = True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ import os
 import shutil
 import zipfile
 import sys
+from unittest import mock
 
 # Ensure that Python can find and load gencat.py
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
@@ -184,6 +185,60 @@ class test_unzipFiles(unittest.TestCase):
                 count = count + 1
             self.assertEqual(count, 2)
 
+    def test_parallelUnzip(self):
+        '''
+        Test that archives and members split across several extraction tasks are 
+        all unzipped, that non-zip files are skipped and that each archive's time is reported.
+        '''
+        parcat = MockCat('./test_data', './test_temp', './test_out', unzip_workers = 4)
+        parcat.unzip_batch_bytes = 16
+        contents = {}
+        for i in range(3):
+            with zipfile.ZipFile('test_data/in%d.zip' % i, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for j in range(5):
+                    name = 'dir%d/file%d.txt' % (i, j)
+                    contents[name] = 'archive %d file %d\n' % (i, j) * (j + 1)
+                    zf.writestr(name, contents[name])
+        with open('test_data/notzip.zip', 'w') as f:
+            f.write('not a zip file')
+
+        parcat.unzipFiles()
+        for name, content in contents.items():
+            with open(os.path.join('test_temp', name), 'r') as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(sorted(os.path.basename(infile) for infile in parcat.archive_seconds),
+                         ['in0.zip', 'in1.zip', 'in2.zip'])
+        self.assertEqual(parcat.stats['unzip']['archives'], 3)
+        self.assertEqual(parcat.stats['unzip']['files'], 15)
+
+    def test_sharedPaths(self):
+        '''
+        Test that members of several archives sharing a path are extracted once,
+        leaving the member a serial extraction would leave: the last one in 
+        sorted archive and member order.
+        '''
+        parcat = MockCat('./test_data', './test_temp', './test_out', unzip_workers = 4)
+        parcat.unzip_batch_bytes = 1
+        for i in range(4):
+            with zipfile.ZipFile('test_data/in%d.zip' % i, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('shared/', '')
+                zf.writestr('shared/same.txt', 'archive %d\n' % i * 1000)
+                zf.writestr('shared/own%d.txt' % i, 'own %d\n' % i)
+
+        with mock.patch.object(zipfile.ZipFile, 'extract', autospec = True,
+                               side_effect = zipfile.ZipFile.extract) as mock_extract:
+            parcat.unzipFiles()
+        extracted = [call[0][1].filename for call in mock_extract.call_args_list]
+
+        self.assertEqual(extracted.count('shared/same.txt'), 1)
+        self.assertNotIn('shared/', extracted)
+        with open('test_temp/shared/same.txt', 'r') as f:
+            self.assertEqual(f.read(), 'archive 3\n' * 1000)
+        self.assertEqual(sorted(os.listdir('test_temp/shared')),
+                         ['own0.txt', 'own1.txt', 'own2.txt', 'own3.txt', 'same.txt'])
+        self.assertEqual(parcat.stats['unzip']['archives'], 4)
+        self.assertEqual(parcat.stats['unzip']['files'], 5)
+
     def tearDown(self):
         paths = ['./test_data', './test_temp', './test_out']
         for path in paths:
@@ -139,6 +139,36 @@ class test_zipFiles(unittest.TestCase):
         self.assertEqual(text1, '\nNEWFILE\nFILENAME: file1.txt\n\nTHIS IS A TEST FILE.\n')
         self.assertEqual(text2, '\nNEWFILE\nFILENAME: file2.txt\n\nTHIS IS A TEST FILE.\n')
     
+    def test_zipWorkers(self):
+        '''
+        Test that the number of compression threads does not change the members
+        of an output zip file, their order, or their content.
+        '''
+        archives = []
+        for workers in [1, 4]:
+            testcat = MockCat('./test_data', './test_temp', './test_out', zip_workers = workers)
+            testcat.zip_dict = {} 
+            testcat.zip_dict['zip1'] = ('concat1', ) + ('concat2', ) + ('concat3', )
+            testcat.concat_dict = {}
+            testcat.concat_dict['concat1'] = ('./test_data/file1.txt', ) + ('./test_data/file2.txt', )
+            testcat.concat_dict['concat2'] = ('./test_data/file2.txt', )
+            testcat.concat_dict['concat3'] = ('./test_data/file1.txt', )
+            
+            testcat.zipFiles()
+            
+            with zipfile.ZipFile('./test_out/zip1.zip', 'r') as zf:
+                self.assertIsNone(zf.testzip())
+                archives.append([(name, zf.read(name)) for name in zf.namelist()])
+            
+            shutil.rmtree('./test_temp', ignore_errors = True)
+            shutil.rmtree('./test_out', ignore_errors = True)
+            os.makedirs('./test_temp')
+            os.makedirs('./test_out')
+        
+        self.assertEqual([name for name, _ in archives[0]], 
+                         ['../zip1/concat1.txt', '../zip1/concat2.txt', '../zip1/concat3.txt'])
+        self.assertEqual(archives[0], archives[1])
+    
     def tearDown(self):
         paths = ['./test_data', './test_temp', './test_out']
         for path in paths:
@@ -15,6 +15,9 @@ from .log                      import start_log, end_log
 from .log_paths_dict           import log_paths_dict, record_dir
 from .scons_debrief            import scons_debrief
 from .check_prereq             import check_prereq
+from .file_signatures          import signature_decider
+from .scanners                 import add_scanners
+from .resource_pool            import schedule_resources
 from .builders.build_r         import build_r
 from .builders.build_latex     import build_latex
 from .builders.build_lyx       import build_lyx
@@ -15,4 +15,7 @@ class PrerequisiteError(Exception):
     pass
 
 class TargetNonexistenceError(Exception):
+    pass
+
+class CacheIntegrityError(Exception):
     pass
\ No newline at end of file
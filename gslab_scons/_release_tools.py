@@ -8,6 +8,7 @@ import sys
 import shutil
 import subprocess
 
+import gslab_make.parallel_zip as parallel_zip
 from ._exception_classes import ReleaseError
 
 def release(vers, org, repo,
@@ -117,7 +118,7 @@ def release(vers, org, repo,
             shutil.copy(path, os.path.join(destination, file_name))
         
         if zip_release:
-            shutil.make_archive(archive_files, 'zip', archive_files)
+            parallel_zip.make_archive(archive_files, archive_files)
             shutil.rmtree(archive_files)
             shutil.move(archive_files + '.zip', 
                         os.path.join(local_release, 'release.zip'))
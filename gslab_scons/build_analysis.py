@@ -0,0 +1,287 @@
+'''
+Critical-path and parallelism analysis of GSLab builds.
+
+The analysis combines the step durations recorded by build_metrics with the
+SCons dependency graph, as printed by `scons --tree=prune` (a dry run is
+enough: `scons -n --tree=prune > tree.txt`). For one build it reports the
+critical path, the makespan and speedup a greedy scheduler would reach at
+several -j values, and writes a Chrome trace (chrome://tracing or Perfetto)
+of when each step actually ran:
+    python -m gslab_scons.build_analysis metrics.db --tree tree.txt \\
+        --jobs 1 2 4 8 16 --trace build_trace.json
+'''
+import os
+import sys
+import json
+import heapq
+import sqlite3
+import argparse
+
+import gslab_scons.misc as misc
+import gslab_scons.build_metrics as build_metrics
+
+
+def parse_tree(lines):
+    '''
+    Parse the output of `scons --tree=all` or `--tree=prune` into a dictionary
+    mapping each node to the set of nodes it depends on.
+    '''
+    graph = {}
+    stack = []
+    for line in lines:
+        position = line.find('+-')
+        if position < 0:
+            continue
+        depth = position // 2
+        name  = line[position + 2:].strip()
+        if name.startswith('[') and name.endswith(']'):
+            name = name[1:-1]
+        name = os.path.normpath(name)
+        graph.setdefault(name, set())
+        del stack[depth:]
+        if stack:
+            graph[stack[-1]].add(name)
+        stack.append(name)
+    return graph
+
+
+def load_steps(database, build_id = None):
+    '''
+    Return the steps recorded in database for build_id (by default the most
+    recent build) as a list of dictionaries with keys name, builder, targets,
+    started and seconds.
+    '''
+    connection = build_metrics.connect(database)
+    try:
+        if build_id is None:
+            row = connection.execute('SELECT build_id FROM steps '
+                                     'ORDER BY rowid DESC LIMIT 1').fetchone()
+            if row is None:
+                return []
+            build_id = row[0]
+        rows = connection.execute('SELECT builder, target, targets, started, wall_seconds '
+                                  'FROM steps WHERE build_id = ? ORDER BY rowid',
+                                  (build_id, )).fetchall()
+    finally:
+        connection.close()
+    steps = []
+    for builder, target, targets, started, seconds in rows:
+        targets = json.loads(targets) if targets else [target]
+        steps.append({'name':    os.path.normpath(target),
+                      'builder': builder,
+                      'targets': [os.path.normpath(t) for t in targets],
+                      'started': started,
+                      'seconds': seconds or 0.0})
+    return steps
+
+
+def step_dependencies(steps, graph):
+    '''
+    Return a dictionary mapping each step's name to the names of the steps that
+    build something it depends on, directly or through nodes (such as aliases
+    or directories) that no step builds.
+    '''
+    owner = {}
+    for step in steps:
+        for target in step['targets']:
+            owner[target] = step['name']
+    reached = {}
+
+    def producers(node):
+        # Depth-first search, kept on an explicit stack so that long chains
+        # of nodes do not exhaust Python's recursion limit.
+        if node in reached:
+            return reached[node]
+        found = {node: set()}
+        stack = [(node, iter(graph.get(node, ())))]
+        while stack:
+            current, children = stack[-1]
+            for child in children:
+                if child in owner:
+                    found[current].add(owner[child])
+                elif child in reached:
+                    found[current] |= reached[child]
+                elif child not in found:
+                    found[child] = set()
+                    stack.append((child, iter(graph.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                reached[current] = found[current]
+                if stack:
+                    found[stack[-1][0]] |= found[current]
+        return reached[node]
+
+    dependencies = {}
+    for step in steps:
+        found = set()
+        for target in step['targets']:
+            for child in graph.get(target, ()):
+                if child in owner:
+                    found.add(owner[child])
+                else:
+                    found |= producers(child)
+        found.discard(step['name'])
+        dependencies[step['name']] = found
+    return dependencies
+
+
+def topological_order(dependencies):
+    '''
+    Return the step names in dependencies ordered so that each step comes
+    after the steps it depends on. Steps in a dependency cycle come last.
+    '''
+    dependents = dict((name, []) for name in dependencies)
+    waiting    = {}
+    for name, names in dependencies.items():
+        waiting[name] = len(names)
+        for dependency in names:
+            dependents[dependency].append(name)
+    order = [name for name, count in waiting.items() if count == 0]
+    for name in order:
+        for dependent in dependents[name]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                order.append(dependent)
+    ordered = set(order)
+    return order + [name for name in dependencies if name not in ordered]
+
+
+def critical_path(steps, dependencies):
+    '''
+    Return (length in seconds, list of step names) of the longest chain of
+    dependent steps.
+    '''
+    seconds = dict((step['name'], step['seconds']) for step in steps)
+    finish  = {}
+    before  = {}
+    for name in topological_order(dependencies):
+        start = 0.0
+        for dependency in dependencies[name]:
+            if finish.get(dependency, 0.0) > start:
+                start = finish[dependency]
+                before[name] = dependency
+        finish[name] = start + seconds[name]
+
+    if not steps:
+        return 0.0, []
+    last = max(seconds, key = finish.get)
+    path = [last]
+    while path[-1] in before:
+        path.append(before[path[-1]])
+    return finish[last], list(reversed(path))
+
+
+def simulate(steps, dependencies, jobs):
+    '''
+    Return the makespan of running the steps on `jobs` workers, starting
+    whenever a worker is free the ready step with the longest chain of
+    steps still to run after it.
+    '''
+    seconds    = dict((step['name'], step['seconds']) for step in steps)
+    dependents = dict((name, []) for name in seconds)
+    waiting    = {}
+    for name, names in dependencies.items():
+        waiting[name] = len(names)
+        for dependency in names:
+            dependents[dependency].append(name)
+    remaining = {}
+    for name in reversed(topological_order(dependencies)):
+        remaining[name] = seconds[name] + max([remaining.get(d, 0.0)
+                                               for d in dependents[name]] or [0.0])
+
+    ready   = [(-remaining[name], name) for name, count in waiting.items() if count == 0]
+    heapq.heapify(ready)
+    running = []
+    now     = 0.0
+    while ready or running:
+        while ready and len(running) < jobs:
+            _, name = heapq.heappop(ready)
+            heapq.heappush(running, (now + seconds[name], name))
+        now, name = heapq.heappop(running)
+        for dependent in dependents[name]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                heapq.heappush(ready, (-remaining[dependent], dependent))
+    return now
+
+
+def chrome_trace(steps):
+    '''
+    Return a Chrome trace_event document of when each step ran, with
+    overlapping steps placed on separate rows.
+    '''
+    timed  = sorted((step for step in steps if step['started'] is not None),
+                    key = lambda step: step['started'])
+    origin = timed[0]['started'] if timed else 0.0
+    lanes  = []
+    events = []
+    for step in timed:
+        end = step['started'] + step['seconds']
+        for lane, free_at in enumerate(lanes):
+            if free_at <= step['started']:
+                break
+        else:
+            lane = len(lanes)
+            lanes.append(0.0)
+        lanes[lane] = end
+        events.append({'name': step['name'],
+                       'cat':  step['builder'],
+                       'ph':   'X',
+                       'ts':   (step['started'] - origin) * 1e6,
+                       'dur':  step['seconds'] * 1e6,
+                       'pid':  1,
+                       'tid':  lane + 1,
+                       'args': {'targets': step['targets']}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def analyse(database, tree = None, jobs = (1, 2, 4, 8, 16), build_id = None):
+    '''
+    Return a text report of the critical path and the simulated speedup at
+    each number of jobs for one build recorded in database. tree is the path
+    to saved `scons --tree` output; without it steps are taken as independent.
+    '''
+    steps = load_steps(database, build_id)
+    graph = {}
+    if tree is not None:
+        with open(tree, 'r') as f:
+            graph = parse_tree(f)
+    dependencies = step_dependencies(steps, graph)
+    total = sum(step['seconds'] for step in steps)
+    length, path = critical_path(steps, dependencies)
+
+    lines = [misc.make_heading('Critical path')]
+    lines.append('%d steps taking %.1f s in total; critical path %.1f s:'
+                 % (len(steps), total, length))
+    seconds = dict((step['name'], step['seconds']) for step in steps)
+    for name in path:
+        lines.append('%10.1f  %s' % (seconds[name], name))
+    lines.append('')
+    lines.append(misc.make_heading('Speedup by number of jobs'))
+    lines.append('%6s %12s %9s' % ('-j', 'makespan s', 'speedup'))
+    for count in jobs:
+        makespan = simulate(steps, dependencies, count)
+        lines.append('%6d %12.1f %9.2f' % (count, makespan, total / makespan if makespan else 1.0))
+    if length:
+        lines.append('No number of jobs can do better than a speedup of %.2f.' % (total / length))
+    return '\n'.join(lines)
+
+
+def main(argv = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description = 'Analyse parallelism of a GSLab build')
+    parser.add_argument('database', help = 'path to the build metrics database')
+    parser.add_argument('--tree', help = 'file holding `scons --tree=prune` output')
+    parser.add_argument('--jobs', type = int, nargs = '+', default = [1, 2, 4, 8, 16])
+    parser.add_argument('--build', help = 'build id to analyse (default: the last build)')
+    parser.add_argument('--trace', help = 'write a Chrome trace of the build to this path')
+    args = parser.parse_args(argv)
+    print(analyse(args.database, args.tree, args.jobs, args.build))
+    if args.trace:
+        with open(args.trace, 'w') as f:
+            json.dump(chrome_trace(load_steps(args.database, args.build)), f)
+    return None
+
+
+if __name__ == '__main__':
+    main()
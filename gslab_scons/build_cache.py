@@ -0,0 +1,440 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from urllib.request import Request, urlopen
+from http.client import HTTPException
+
+import gslab_scons.misc as misc
+from gslab_scons._exception_classes import CacheIntegrityError
+
+# Bytes read at a time when hashing or copying files.
+BLOCK_SIZE = 1024 * 1024
+# Default limit on the total size of a cache directory.
+DEFAULT_MAX_MB = 10 * 1024
+
+_caches      = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(env):
+    '''
+    Return the BuildCache configured by env, or None if caching is off.
+
+    The cache is opt-in. It is turned on by setting env['build_cache'] to
+    the path of a cache directory. Optional settings:
+        build_cache_max_mb: the total size above which least recently used
+            entries are evicted (default 10240).
+        build_cache_hardlink: if True, targets are restored as hard links
+            to the cached files where possible instead of as copies.
+        build_cache_url: the address of a shared HTTP cache (see 
+            gslab_scons.cache_server). Entries missing locally are fetched
+            from it and new entries are uploaded to it.
+        build_cache_timeout: seconds to wait on the shared cache (default 30).
+    Builders sharing a cache directory share one BuildCache, so its
+    statistics cover the whole build.
+    '''
+    try:
+        directory = env['build_cache']
+    except (KeyError, TypeError):
+        return None
+    if not directory:
+        return None
+    try:
+        max_mb = float(env['build_cache_max_mb'])
+    except KeyError:
+        max_mb = DEFAULT_MAX_MB
+    try:
+        hardlink = bool(env['build_cache_hardlink'])
+    except KeyError:
+        hardlink = False
+    try:
+        url = env['build_cache_url']
+    except KeyError:
+        url = None
+    try:
+        timeout = float(env['build_cache_timeout'])
+    except KeyError:
+        timeout = 30
+    directory = os.path.abspath(str(directory))
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = BuildCache(directory)
+        cache = _caches[directory]
+    cache.max_bytes = int(max_mb * 1024 * 1024)
+    cache.hardlink  = hardlink
+    cache.remote    = RemoteCache(url, timeout) if url else None
+    return cache
+
+
+def hash_file(path, hasher = None):
+    '''
+    Feed the content of the file at path to hasher (a new sha256 by default)
+    and return the hasher.
+    '''
+    if hasher is None:
+        hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher
+
+
+def copy_and_hash(source, destination):
+    '''
+    Copy the file at source to destination and return the SHA-256 digest of its content.
+    '''
+    hasher = hashlib.sha256()
+    with open(source, 'rb') as infile:
+        with open(destination, 'wb') as outfile:
+            for block in iter(lambda: infile.read(BLOCK_SIZE), b''):
+                hasher.update(block)
+                outfile.write(block)
+    return hasher.hexdigest()
+
+
+def make_key(name, executable, system_call, cl_arg, source_file, sources, targets):
+    '''
+    Return the hex digest identifying a build step. It covers the builder name,
+    the executable's identity (its name and, if it is on the path, the size of
+    the program it resolves to), the system call, the command line arguments,
+    the content of the script and of every declared source that is a file,
+    and the target paths.
+    '''
+    hasher = hashlib.sha256()
+    program = misc.is_in_path(executable) if executable else False
+    if program:
+        executable = '%s:%d' % (executable, os.path.getsize(program))
+    fields = [name, executable, system_call, cl_arg, source_file] + \
+             sorted(set(sources)) + ['->'] + list(targets)
+    for field in fields:
+        hasher.update(('%s\0' % field).encode('utf-8'))
+    for path in [source_file] + sorted(set(sources)):
+        if os.path.isfile(path):
+            hasher.update(path.encode('utf-8'))
+            hash_file(path, hasher)
+    return hasher.hexdigest()
+
+
+class BuildCache(object):
+    '''
+    Content-addressed store of build step outputs kept in a local directory.
+
+    Each entry lives in <directory>/<key[:2]>/<key>/ and holds the step's
+    targets, its builder log and a manifest.json listing them. The
+    manifest's modification time is refreshed on every hit and the least
+    recently used entries are evicted once the cache grows past max_bytes.
+    Hits, misses, stores and evictions are counted in self.stats and
+    accumulated across builds in <directory>/stats.json.
+
+    If self.remote is a RemoteCache, local misses are looked up in it and
+    new entries are uploaded to it. Any failure to reach it, or a download
+    that does not match its digest, is reported and treated as a miss, so 
+    the step is built locally.
+    '''
+    def __init__(self, directory, max_bytes = DEFAULT_MAX_MB * 1024 * 1024,
+                 hardlink = False, remote = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hardlink  = hardlink
+        self.remote    = remote
+        self.stats     = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                          'bytes_restored': 0, 'bytes_stored': 0,
+                          'remote_hits': 0, 'uploads': 0, 'remote_errors': 0}
+        self.lock      = threading.Lock()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def restore(self, key, targets, log_path):
+        '''
+        Restore targets and the builder log stored under key.
+        Return True on a hit and False on a miss. If the entry cannot be read
+        in full, for example because another build evicted it meanwhile, the 
+        files already placed are removed and the restore counts as a miss.
+        '''
+        entry = self.entry_path(key)
+        manifest = self.read_manifest(key)
+        if manifest is None and self.remote is not None and self.fetch(key, targets):
+            manifest = self.read_manifest(key)
+        if manifest is None or manifest['targets'] != list(targets):
+            self.count(misses = 1)
+            return False
+        restored = 0
+        placed   = []
+        try:
+            for index, target in enumerate(targets):
+                placed.append(target)
+                restored += self.place(os.path.join(entry, 'target_%d' % index), target)
+            placed.append(log_path)
+            restored += self.place(os.path.join(entry, 'log'), log_path, link = False)
+            os.utime(os.path.join(entry, 'manifest.json'), None)
+        except (IOError, OSError) as error:
+            for path in placed:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            print('Warning: could not restore %s from build cache %s (%s). '
+                  'Building locally.' % (key, self.directory, error))
+            self.count(misses = 1)
+            return False
+        self.count(hits = 1, bytes_restored = restored)
+        return True
+
+    def read_manifest(self, key):
+        '''
+        Return the manifest of the local entry for key, or None if there is none.
+        '''
+        try:
+            with open(os.path.join(self.entry_path(key), 'manifest.json'), 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def fetch(self, key, targets):
+        '''
+        Download the entry for key from the remote cache into the local cache.
+        Return True if it was found and every file matched its digest. A
+        manifest that does not list exactly the files of an entry for targets
+        is rejected, so that file names from the remote cannot point outside
+        the entry.
+        '''
+        entry   = self.entry_path(key)
+        parent  = os.path.dirname(entry)
+        staging = None
+        try:
+            manifest = self.remote.get_manifest(key)
+            if manifest is None:
+                return False
+            names = ['target_%d' % index for index in range(len(targets))] + ['log']
+            if manifest['targets'] != list(targets) or \
+               sorted(manifest['digests']) != sorted(names):
+                raise CacheIntegrityError('the manifest does not list the files of %s' % key)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            staging = tempfile.mkdtemp(prefix = '.%s.' % key, dir = parent)
+            for name, digest in sorted(manifest['digests'].items()):
+                self.remote.get_file(digest, os.path.join(staging, name))
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f)
+            os.rename(staging, entry)
+        except (OSError, HTTPException, ValueError, KeyError, CacheIntegrityError) as error:
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors = True)
+            if os.path.isdir(entry):
+                # Another build fetched or stored the same entry first.
+                return True
+            print('Warning: could not fetch %s from build cache %s (%s). '
+                  'Building locally.' % (key, self.remote.url, error))
+            self.count(remote_errors = 1)
+            return False
+        self.count(remote_hits = 1)
+        return True
+
+    def upload(self, key):
+        '''
+        Upload the local entry for key to the remote cache: first any file 
+        the remote does not already hold, then the manifest.
+        '''
+        entry = self.entry_path(key)
+        try:
+            manifest = self.read_manifest(key)
+            if manifest is None:
+                return None
+            for name, digest in sorted(manifest['digests'].items()):
+                if not self.remote.has_file(digest):
+                    self.remote.put_file(digest, os.path.join(entry, name))
+            self.remote.put_manifest(key, manifest)
+        except (OSError, HTTPException) as error:
+            print('Warning: could not upload %s to build cache %s (%s).' 
+                  % (key, self.remote.url, error))
+            self.count(remote_errors = 1)
+            return None
+        self.count(uploads = 1)
+        return None
+
+    def place(self, cached, path, link = None):
+        '''
+        Put the cached file at path, as a hard link if requested and possible.
+        Return the number of bytes placed.
+        '''
+        if link is None:
+            link = self.hardlink
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.lexists(path):
+            os.remove(path)
+        if link:
+            try:
+                os.link(cached, path)
+                return os.path.getsize(path)
+            except (OSError, AttributeError):
+                pass
+        shutil.copyfile(cached, path)
+        return os.path.getsize(path)
+
+    def store(self, key, targets, log_path):
+        '''
+        Copy targets and the builder log into the cache under key,
+        then evict entries if the cache is over its size limit.
+        '''
+        entry = self.entry_path(key)
+        if os.path.isdir(entry):
+            return None
+        parent = os.path.dirname(entry)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                pass
+        staging = tempfile.mkdtemp(prefix = '.%s.' % key, dir = parent)
+        try:
+            files = [('target_%d' % index, target) for index, target in enumerate(targets)]
+            files.append(('log', log_path))
+            size    = 0
+            digests = {}
+            for name, path in files:
+                digests[name] = copy_and_hash(path, os.path.join(staging, name))
+                size += os.path.getsize(path)
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump({'targets': list(targets), 'size': size, 'digests': digests}, f)
+            os.rename(staging, entry)
+        except OSError:
+            # Another build stored the same entry first, or the copy failed;
+            # either way the build itself has succeeded.
+            shutil.rmtree(staging, ignore_errors = True)
+            return None
+        self.count(stores = 1, bytes_stored = size)
+        if self.remote is not None:
+            self.upload(key)
+        self.evict()
+        return None
+
+    def evict(self):
+        '''
+        Remove least recently used entries until the cache fits in max_bytes.
+        '''
+        with self.lock:
+            entries = []
+            total   = 0
+            for prefix in os.listdir(self.directory):
+                prefix_dir = os.path.join(self.directory, prefix)
+                if not os.path.isdir(prefix_dir):
+                    continue
+                for key in os.listdir(prefix_dir):
+                    manifest = os.path.join(prefix_dir, key, 'manifest.json')
+                    try:
+                        used = os.path.getmtime(manifest)
+                        with open(manifest, 'r') as f:
+                            size = json.load(f)['size']
+                    except (IOError, OSError, ValueError, KeyError):
+                        continue
+                    entries.append((used, size, os.path.join(prefix_dir, key)))
+                    total += size
+            evicted = 0
+            for used, size, entry in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors = True)
+                total   -= size
+                evicted += 1
+        if evicted:
+            self.count(evictions = evicted)
+        return None
+
+    def count(self, **counts):
+        '''
+        Add counts to self.stats and to the totals kept in stats.json.
+        '''
+        with self.lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+            stats_path = os.path.join(self.directory, 'stats.json')
+            try:
+                with open(stats_path, 'r') as f:
+                    totals = json.load(f)
+            except (IOError, OSError, ValueError):
+                totals = {}
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            partial = '%s.%d.partial' % (stats_path, os.getpid())
+            with open(partial, 'w') as f:
+                json.dump(totals, f, indent = 4, sort_keys = True)
+            os.replace(partial, stats_path)
+        return None
+
+
+class RemoteCache(object):
+    '''
+    Client for a shared build cache speaking the HTTP protocol of 
+    gslab_scons.cache_server: file content under /cas/<sha256> and entry 
+    manifests under /ac/<key>. Files are streamed in both directions and 
+    every download is checked against its digest.
+    '''
+    def __init__(self, url, timeout = 30):
+        self.url     = str(url).rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, data = None, headers = {}):
+        request = Request('%s%s' % (self.url, path), data = data, headers = headers)
+        request.get_method = lambda: method
+        return urlopen(request, timeout = self.timeout)
+
+    def get_manifest(self, key):
+        '''
+        Return the manifest stored for key, or None if the remote has none.
+        '''
+        try:
+            with self.request('GET', '/ac/%s' % key) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except IOError as error:
+            if getattr(error, 'code', None) == 404:
+                return None
+            raise
+
+    def put_manifest(self, key, manifest):
+        data = json.dumps(manifest).encode('utf-8')
+        self.request('PUT', '/ac/%s' % key, data, 
+                     {'Content-Length': str(len(data))}).close()
+        return None
+
+    def has_file(self, digest):
+        try:
+            self.request('HEAD', '/cas/%s' % digest).close()
+        except IOError as error:
+            if getattr(error, 'code', None) == 404:
+                return False
+            raise
+        return True
+
+    def get_file(self, digest, path):
+        '''
+        Stream the file with the given digest to path, raising 
+        CacheIntegrityError if what arrives does not hash to digest.
+        '''
+        hasher = hashlib.sha256()
+        with self.request('GET', '/cas/%s' % digest) as response:
+            with open(path, 'wb') as f:
+                for block in iter(lambda: response.read(BLOCK_SIZE), b''):
+                    hasher.update(block)
+                    f.write(block)
+        if hasher.hexdigest() != digest:
+            os.remove(path)
+            raise CacheIntegrityError('%s does not match its digest %s' % (path, digest))
+        return None
+
+    def put_file(self, digest, path):
+        '''
+        Stream the file at path to the remote under its digest.
+        '''
+        with open(path, 'rb') as f:
+            self.request('PUT', '/cas/%s' % digest, f, 
+                         {'Content-Length': str(os.path.getsize(path)),
+                          'Content-Type': 'application/octet-stream'}).close()
+        return None
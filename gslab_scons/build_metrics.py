@@ -0,0 +1,169 @@
+'''
+Resource telemetry for GSLab builders.
+
+When env['build_metrics'] is set to the path of an SQLite database, every
+GSLabBuilder step appends a row to its `steps` table: its start time, wall 
+time, user and system CPU seconds and peak resident memory of the system 
+call, its exit status, its targets and their total size and whether it was 
+restored from the build cache. List the slowest and hungriest steps across builds with
+    python -m gslab_scons.build_metrics <database> [--limit 10]
+'''
+import os
+import sys
+import time
+import json
+import sqlite3
+import argparse
+import threading
+import subprocess
+
+import gslab_scons.misc as misc
+
+# Identifies the rows written by this SCons process.
+BUILD_ID = '%s-%d' % (time.strftime('%Y%m%d%H%M%S'), os.getpid())
+
+_COLUMNS = [('build_id',       'TEXT'),
+            ('recorded',       'TEXT'),
+            ('builder',        'TEXT'),
+            ('source',         'TEXT'),
+            ('target',         'TEXT'),
+            ('targets',        'TEXT'),
+            ('command',        'TEXT'),
+            ('log',            'TEXT'),
+            ('started',        'REAL'),
+            ('wall_seconds',   'REAL'),
+            ('user_seconds',   'REAL'),
+            ('system_seconds', 'REAL'),
+            ('peak_rss_kb',    'INTEGER'),
+            ('exit_status',    'INTEGER'),
+            ('target_bytes',   'INTEGER'),
+            ('cached',         'INTEGER')]
+
+_write_lock = threading.Lock()
+
+
+def get_database(env):
+    '''
+    Return the path of the metrics database named by env['build_metrics'],
+    or None if metrics are not recorded.
+    '''
+    try:
+        path = env['build_metrics']
+    except (KeyError, TypeError):
+        return None
+    if not path:
+        return None
+    return os.path.abspath(str(path))
+
+
+def call_with_usage(command, stdout, cwd = None):
+    '''
+    Run command in a shell, in the directory cwd if given, with its output
+    and errors going to stdout.
+    Return its exit status and a dictionary of the user and system CPU
+    seconds and peak resident memory (KB) of the shell and everything it
+    waited for. The dictionary is empty on platforms without os.wait4.
+    '''
+    if not hasattr(os, 'wait4'):
+        return subprocess.call(command, shell = True, cwd = cwd, stdout = stdout,
+                               stderr = subprocess.STDOUT), {}
+    process = subprocess.Popen(command, shell = True, cwd = cwd, stdout = stdout,
+                               stderr = subprocess.STDOUT)
+    _, status, usage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    peak_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return process.returncode, {'user_seconds':   usage.ru_utime,
+                                'system_seconds': usage.ru_stime,
+                                'peak_rss_kb':    peak_rss}
+
+
+def connect(path):
+    '''
+    Open the database at path, creating the steps table if needed and
+    adding any columns that a database made by an older version lacks.
+    '''
+    connection = sqlite3.connect(path, timeout = 30)
+    columns = ', '.join('%s %s' % column for column in _COLUMNS)
+    connection.execute('CREATE TABLE IF NOT EXISTS steps (%s)' % columns)
+    existing = set(row[1] for row in connection.execute('PRAGMA table_info(steps)'))
+    for name, kind in _COLUMNS:
+        if name not in existing:
+            connection.execute('ALTER TABLE steps ADD COLUMN %s %s' % (name, kind))
+    return connection
+
+
+def record(path, **fields):
+    '''
+    Append one step to the database at path. Missing fields are stored as NULL.
+    '''
+    names = [name for name, _ in _COLUMNS]
+    fields.setdefault('build_id', BUILD_ID)
+    fields.setdefault('recorded', misc.current_time())
+    if isinstance(fields.get('targets'), list):
+        fields['targets'] = json.dumps(fields['targets'])
+    values = [fields.get(name) for name in names]
+    with _write_lock:
+        connection = connect(path)
+        try:
+            with connection:
+                connection.execute('INSERT INTO steps (%s) VALUES (%s)'
+                                   % (', '.join(names), ', '.join('?' * len(names))),
+                                   values)
+        finally:
+            connection.close()
+    return None
+
+
+def report(path, limit = 10):
+    '''
+    Return a text report of the steps in the database at path with the longest
+    mean wall time and the largest peak memory, over all builds. Steps are
+    identified by builder, source and first target; cache hits are left out.
+    '''
+    connection = connect(path)
+    try:
+        slowest = connection.execute(
+            'SELECT builder, source, target, COUNT(*), AVG(wall_seconds), '
+            'MAX(wall_seconds), AVG(user_seconds + system_seconds) '
+            'FROM steps WHERE NOT cached GROUP BY builder, source, target '
+            'ORDER BY AVG(wall_seconds) DESC LIMIT ?', (limit, )).fetchall()
+        hungriest = connection.execute(
+            'SELECT builder, source, target, COUNT(*), MAX(peak_rss_kb), '
+            'AVG(peak_rss_kb) FROM steps WHERE NOT cached AND peak_rss_kb IS NOT NULL '
+            'GROUP BY builder, source, target '
+            'ORDER BY MAX(peak_rss_kb) DESC LIMIT ?', (limit, )).fetchall()
+        builds = connection.execute('SELECT COUNT(DISTINCT build_id) FROM steps').fetchone()[0]
+    finally:
+        connection.close()
+
+    lines = [misc.make_heading('Slowest steps over %d builds' % builds)]
+    lines.append('%10s %10s %10s %5s  %s' % ('mean s', 'max s', 'cpu s', 'runs', 'step'))
+    for builder, source, target, runs, mean, longest, cpu in slowest:
+        cpu = '' if cpu is None else '%.1f' % cpu
+        lines.append('%10.1f %10.1f %10s %5d  %s: %s -> %s'
+                     % (mean, longest, cpu, runs, builder, source, target))
+    lines.append('')
+    lines.append(misc.make_heading('Hungriest steps over %d builds' % builds))
+    lines.append('%10s %10s %5s  %s' % ('peak MB', 'mean MB', 'runs', 'step'))
+    for builder, source, target, runs, peak, mean in hungriest:
+        lines.append('%10.1f %10.1f %5d  %s: %s -> %s'
+                     % (peak / 1024.0, mean / 1024.0, runs, builder, source, target))
+    return '\n'.join(lines)
+
+
+def main(argv = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description = 'Report GSLab builder metrics')
+    parser.add_argument('database', help = 'path to the build metrics database')
+    parser.add_argument('--limit', type = int, default = 10,
+                        help = 'number of steps to list in each table')
+    args = parser.parse_args(argv)
+    print(report(args.database, args.limit))
+    return None
+
+
+if __name__ == '__main__':
+    main()
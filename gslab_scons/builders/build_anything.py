@@ -4,6 +4,12 @@ import warnings
 
 from .gslab_builder import GSLabBuilder
 import gslab_scons.misc as misc
+import gslab_scons.resource_pool as resource_pool
+
+# Values of env that a step reads when it runs rather than when it is declared.
+BUILD_TIME_KEYS = ('resources', 'resource_limits', 'build_cache', 'build_cache_url',
+                   'build_cache_max_mb', 'build_cache_timeout', 'build_cache_hardlink',
+                   'build_metrics', 'live_output', 'output_tail_kb')
 
 
 def build_anything(target, source, action, env, warning = True, **kw):
@@ -35,24 +41,62 @@ def build_anything(target, source, action, env, warning = True, **kw):
             The builder will crash if this file doesn't exist at the end of the command.
         warning: Boolean
             Turns off warnings if warning = False. 
+    Any other keyword arguments override the values in env for this step only.
+    They are laid over env without copying it, so a step reads later
+    changes to env's other values, as SCons's own builder overrides do,
+    except for those in BUILD_TIME_KEYS: the step reads these when it runs,
+    so their values when build_anything is called are kept for the step.
     '''
-    import SCons.Builder
+    import SCons.Environment
     builder_attributes = {
         'name': 'Anything Builder'
     }
     target = [t for t in misc.make_list_if_string(target) if t]
     source = [s for s in misc.make_list_if_string(source) if s]
-    local_env = env.Clone()
-    for k, v in kw.items():
-        local_env[k] = v
+    overrides = dict(kw)
+    for key in BUILD_TIME_KEYS:
+        if key not in overrides:
+            try:
+                overrides[key] = copy.copy(env[key])
+            except KeyError:
+                pass
+    local_env = SCons.Environment.OverrideEnvironment(env, overrides)
     builder = AnythingBuilder(target, source, action, local_env, warning, **builder_attributes)
-    bkw = {
-        'action': builder.build_anything,
-        'target_factory' : local_env.fs.Entry,
-        'source_factory':  local_env.fs.Entry,
-    }
-    bld = SCons.Builder.Builder(**bkw)
-    return bld(local_env, target, source)
+    # The shared SCons builder finds this step's builder in its environment and
+    # rebuilds the targets when the system call changes.
+    local_env['gslab_anything_builder'] = builder
+    local_env['gslab_anything_call']    = builder.system_call.replace('$', '$$')
+    nodes = get_scons_builder()(local_env, target, source)
+    resource_pool.schedule(local_env, nodes)
+    return nodes
+
+
+_scons_builder = None
+
+
+def get_scons_builder():
+    '''
+    Return the SCons builder shared by all build_anything steps. Making one
+    per step made SCons serialise each step's builder to sign its action,
+    which cost more than the rest of reading the step.
+    '''
+    global _scons_builder
+    if _scons_builder is None:
+        import SCons.Action
+        import SCons.Builder
+        import SCons.Node.FS
+        action = SCons.Action.Action(build_anything_step, varlist = ['gslab_anything_call'])
+        _scons_builder = SCons.Builder.Builder(action = action,
+                                               target_factory = SCons.Node.FS.Entry,
+                                               source_factory = SCons.Node.FS.Entry)
+    return _scons_builder
+
+
+def build_anything_step(target, source, env):
+    '''
+    Run the build_anything step whose AnythingBuilder is stored in env.
+    '''
+    return env['gslab_anything_builder'].build_anything()
 
 
 class AnythingBuilder(GSLabBuilder):
@@ -92,7 +136,7 @@ class AnythingBuilder(GSLabBuilder):
     def add_call_args(self):
         '''
         '''
-        args = '%s > %s 2>&1' % (self.action, os.path.normpath(self.log_file))
+        args = '%s >> %s 2>&1' % (self.action, os.path.normpath(self.log_file))
         self.call_args = args
         return None
 
@@ -109,3 +153,4 @@ class AnythingBuilder(GSLabBuilder):
                     sconscript_log.write(origin_log.read())
             os.remove(origin_log_file)
         return None
+
@@ -1,6 +1,15 @@
 import os
+import re
+import shutil
+import hashlib
+import threading
 import subprocess
 from .gslab_builder import GSLabBuilder
+from gslab_scons._exception_classes import TargetNonexistenceError
+
+# Serialises building each preamble format across the threads of a build.
+_format_locks      = {}
+_format_locks_lock = threading.Lock()
 
 
 def build_latex(target, source, env):
@@ -19,6 +28,14 @@ def build_latex(target, source, env):
         The source of the SCons command. This should
         be the .tex file that the function will compile as a PDF.
     env: SCons construction environment, see SCons user guide 7.2
+        If env['latex_build_dir'] is set, latexmk writes each target's 
+        auxiliary and output files to its own directory under it, which is
+        kept between builds so that latexmk only reruns the passes it needs.
+        If env['latex_preamble_format'] is also True, the preamble (everything
+        before \\begin{document} or a %endofdump line) is compiled once into a
+        format with mylatexformat, keyed by a hash of the preamble, and loaded
+        instead of being processed on every pass. Files the preamble inputs
+        are not part of the hash. These options do not apply with env['rel_path'].
     '''
     builder_attributes = {
         'name': 'LaTeX',
@@ -37,11 +54,16 @@ class LatexBuilder(GSLabBuilder):
     def add_call_args(self):
         """"""
         target_name = os.path.splitext(self.target[0])[0]
+        self.build_dir = None
+        self.format_file = None
 
-        if self.env['rel_path'] is True:
+        if self.get_build_root() is not None and not self.relative_to_source():
+            self.add_persistent_args(target_name)
+            return None
+        if self.relative_to_source():
             # Hack so I can use Texifier when writing, and SCons for real builds
             # The assumption here is that the chdir attribute is set to the source dir.
-            args = '%s -output-directory=%s -bibtex -jobname=%s %s > %s' % (
+            args = '%s -output-directory=%s -bibtex -jobname=%s %s >> %s' % (
                 self.cl_arg,
                 os.path.relpath(
                     path=os.path.dirname(target_name),
@@ -56,17 +78,137 @@ class LatexBuilder(GSLabBuilder):
             )
         else:
             target_name = os.path.splitext(self.target[0])[0]
-            args = '%s %s %s > %s' % (self.cl_arg, target_name, os.path.normpath(self.source_file), os.path.normpath(self.log_file))
+            args = '%s %s %s >> %s' % (self.cl_arg, target_name, os.path.normpath(self.source_file), os.path.normpath(self.log_file))
         self.call_args = args
         return None
 
+    def relative_to_source(self):
+        '''
+        Return whether the builder runs from the source directory (env['rel_path']).
+        '''
+        try:
+            return self.env['rel_path'] is True
+        except KeyError:
+            return False
+
+    def get_build_root(self):
+        '''
+        Return the directory holding persistent build directories, or None.
+        '''
+        try:
+            return self.env['latex_build_dir'] or None
+        except KeyError:
+            return None
+
+    def add_persistent_args(self, target_name):
+        '''
+        Store call arguments that build the target in its persistent build
+        directory, loading the preamble format if one is requested.
+        '''
+        relative_target = os.path.splitdrive(os.path.normpath(target_name))[1].lstrip(os.sep)
+        self.build_dir = os.path.join(self.get_build_root(), relative_target)
+        self.jobname   = os.path.basename(target_name)
+        try:
+            use_format = bool(self.env['latex_preamble_format'])
+        except KeyError:
+            use_format = False
+        if use_format:
+            preamble = self.read_preamble()
+            if preamble is not None:
+                digest = hashlib.sha256(('%s\n%s' % (self.executable, preamble)).encode('utf-8'))
+                self.format_file = os.path.join(self.get_build_root(), '.formats', 
+                                                'preamble_%s' % digest.hexdigest()[:16])
+        self.call_args = self.persistent_args(use_format = self.format_file is not None)
+        return None
+
+    def persistent_args(self, use_format):
+        '''
+        Return call arguments for a build in the persistent build directory.
+        '''
+        format_option = ''
+        if use_format:
+            format_option = '-pdflatex="pdflatex -fmt=%s %%O %%S" ' % os.path.abspath(self.format_file)
+        return '%s %s-outdir=%s -auxdir=%s -jobname=%s %s >> %s' % (
+            self.cl_arg, format_option, self.build_dir, self.build_dir, self.jobname,
+            os.path.normpath(self.source_file), os.path.normpath(self.log_file))
+
+    def read_preamble(self):
+        '''
+        Return the preamble of the source file, or None if it cannot be found.
+        '''
+        try:
+            with open(self.source_file, 'r', errors = 'replace') as f:
+                text = f.read()
+        except (IOError, OSError):
+            return None
+        match = re.search(r'^%\s*endofdump|\\begin\s*\{document\}', text, flags = re.M)
+        if match is None:
+            return None
+        return text[:match.start()]
+
+    def do_call(self):
+        '''
+        Build the preamble format if needed before compiling, and copy the 
+        pdf from the persistent build directory to the target afterwards.
+        '''
+        self.format_ready = self.format_file is None or self.make_preamble_format()
+        if self.build_dir is not None and not os.path.isdir(self.build_dir):
+            os.makedirs(self.build_dir)
+        super(LatexBuilder, self).do_call()
+        if self.build_dir is not None:
+            built = os.path.join(self.build_dir, '%s.pdf' % self.jobname)
+            if os.path.isfile(built):
+                shutil.copy2(built, self.target[0])
+        return None
+
+    def get_call(self):
+        '''
+        Compile without the preamble format if it could not be built.
+        '''
+        if self.format_file is not None and not self.format_ready:
+            return '%s %s %s' % (self.executable, self.exec_opts, 
+                                 self.persistent_args(use_format = False)), None
+        return super(LatexBuilder, self).get_call()
+
+    def make_preamble_format(self):
+        '''
+        Dump the preamble to a format with mylatexformat unless a format for 
+        the same preamble exists. Return whether the format is available.
+        '''
+        fmt = '%s.fmt' % self.format_file
+        with _format_locks_lock:
+            lock = _format_locks.setdefault(fmt, threading.Lock())
+        with lock:
+            if os.path.isfile(fmt):
+                return True
+            directory = os.path.dirname(self.format_file)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            jobname = '%s_%d' % (os.path.basename(self.format_file), os.getpid())
+            command = 'pdftex -ini -interaction=nonstopmode -output-directory=%s ' \
+                      '-jobname=%s "&pdflatex" mylatexformat.ltx "%s" >> %s' % (
+                          directory, jobname, os.path.normpath(self.source_file), 
+                          os.path.normpath(self.log_file))
+            print('Building preamble format: {}'.format(command))
+            try:
+                subprocess.check_call(command, shell = True, stderr = subprocess.STDOUT)
+                os.replace(os.path.join(directory, '%s.fmt' % jobname), fmt)
+            except (subprocess.CalledProcessError, OSError):
+                print('Could not build preamble format; compiling without it.')
+                return False
+            finally:
+                dump_log = os.path.join(directory, '%s.log' % jobname)
+                if os.path.isfile(dump_log):
+                    os.remove(dump_log)
+        return True
+
     def check_targets(self):
         '''
         Check that all elements of the target attribute after executing system call.
 
         Redefined here to manage the different approach to paths.
         '''
-        if self.env['rel_path'] is True:
+        if self.relative_to_source():
             missing_targets = [t for t in self.target if not os.path.isfile(os.path.relpath(path=t, start=os.path.dirname(self.source_file)))]
         else:
             missing_targets = [t for t in self.target if not os.path.isfile(t)]
@@ -76,21 +218,21 @@ class LatexBuilder(GSLabBuilder):
             raise TargetNonexistenceError(message)
         return None
 
-    def timestamp_log(self, start_time, end_time):
+    def get_log_path(self):
         '''
-        Adds beginning and ending times to a log file made for system call.
+        Return the path of the log file, relative to the source directory when 
+        env['rel_path'] is True.
         '''
-        if self.env['rel_path'] is True:
-            log_path = os.path.relpath(path=self.log_file, start=os.path.dirname(self.source_file))
-        else:
-            log_path = self.log_file
-        with open(log_path, mode = 'r') as f:
-            content = f.read()
-            f.seek(0, 0)
-            builder_log_msg = '*** Builder log created: {%s}\n' \
-                              '\n' \
-                              '*** Builder log completed: {%s}\n%s' \
-                              % (start_time, end_time, content)
-        with open(log_path, mode = 'w') as f:
-            f.write(builder_log_msg)
-        return None
+        if self.relative_to_source():
+            return os.path.relpath(path=self.log_file, start=os.path.dirname(self.source_file))
+        return self.log_file
+
+    def get_target_paths(self):
+        '''
+        Return the paths of the targets, relative to the source directory when 
+        env['rel_path'] is True.
+        '''
+        if self.relative_to_source():
+            return [os.path.relpath(path=t, start=os.path.dirname(self.source_file)) 
+                    for t in self.target]
+        return self.target
@@ -35,7 +35,7 @@ class LyxBuilder(GSLabBuilder):
     def add_call_args(self):
         '''
         '''
-        args = '%s %s > %s' % (self.cl_arg, os.path.normpath(self.source_file), os.path.normpath(self.log_file))
+        args = '%s %s >> %s' % (self.cl_arg, os.path.normpath(self.source_file), os.path.normpath(self.log_file))
         self.call_args = args
         return None
 
@@ -56,20 +56,38 @@ class MatlabBuilder(GSLabBuilder):
     def add_call_args(self):
         '''
         '''
-        source_hash = hashlib.sha1(self.source_file).hexdigest()
-        source_exec = 'source_%s' % source_hash
-        exec_file   = source_exec + '.m'
-        shutil.copy(self.source_file, exec_file)
-        args = '%s > %s' % (os.path.normpath(source_exec), os.path.normpath(self.log_file))
+        source_hash = hashlib.sha1(self.source_file.encode('utf-8')).hexdigest()
+        self.source_exec = 'source_%s' % source_hash
+        args = '%s >> %s' % (self.source_exec, os.path.normpath(self.log_file))
         self.call_args = args
-        self.exec_file = os.path.normpath(exec_file)
         return None
 
 
     def execute_system_call(self):
         '''
+        Copy the script to a private scratch directory inside the target 
+        directory and run it from there, so that concurrent steps never 
+        share or remove each other's copies.
         '''
         os.environ['CL_ARG'] = self.cl_arg
-        super(MatlabBuilder, self).execute_system_call()
-        os.remove(self.exec_file)
+        self.open_scratch_dir()
+        self.exec_file = os.path.join(self.scratch_dir, self.source_exec + '.m')
+        shutil.copy(self.source_file, self.exec_file)
+        try:
+            super(MatlabBuilder, self).execute_system_call()
+        finally:
+            if os.path.isfile(self.exec_file):
+                os.remove(self.exec_file)
+            self.close_scratch_dir()
         return None
+
+
+    def get_call(self):
+        '''
+        Add the scratch directory to MATLAB's path before calling the copy.
+        '''
+        command = '%s %s "addpath(\'%s\'); %s" >> %s' % (self.executable, self.exec_opts, 
+                                                       os.path.abspath(self.scratch_dir), 
+                                                       self.source_exec, 
+                                                       os.path.normpath(self.log_file))
+        return command, None
@@ -1,5 +1,6 @@
 import os
 import subprocess
+import gslab_scons.python_workers as python_workers
 from .gslab_builder import GSLabBuilder
 
 def build_python(target, source, env):
@@ -32,6 +33,19 @@ class PythonBuilder(GSLabBuilder):
     def add_call_args(self):
         '''
         '''
-        args = '-u %s %s > %s' % (os.path.normpath(self.source_file), self.cl_arg, os.path.normpath(self.log_file))
+        args = '-u %s %s >> %s' % (os.path.normpath(self.source_file), self.cl_arg, os.path.normpath(self.log_file))
         self.call_args = args
         return None
+
+
+    def run_system_call(self, stdout):
+        '''
+        Run the script in the warm worker pool if env['python_workers'] is set
+        (see python_workers), and as a new interpreter otherwise.
+        '''
+        pool = python_workers.get_pool(self.env, self.executable)
+        if pool is None:
+            return super(PythonBuilder, self).run_system_call(stdout)
+        status, self.usage = pool.run(self.source_file, self.cl_arg, 
+                                      os.curdir, self.get_log_path(), stdout)
+        return status
@@ -3,6 +3,8 @@ import shutil
 import sys
 import subprocess
 import gslab_scons.misc as misc
+import gslab_scons.resource_pool as resource_pool
+import gslab_scons.stata_sessions as stata_sessions
 from .gslab_builder import GSLabBuilder
 
 def build_stata(target, source, env):
@@ -29,6 +31,10 @@ def build_stata(target, source, env):
     builder.execute_system_call()
     return None
 
+# Steps run in shared sessions reserve resources per session, not per step,
+# so resource_pool.schedule_resources leaves them to stata_sessions.
+build_stata.batched = lambda env: stata_sessions.get_options(env) is not None
+
 class StataBuilder(GSLabBuilder):
     '''
     '''
@@ -41,6 +47,69 @@ class StataBuilder(GSLabBuilder):
                                            valid_extensions = valid_extensions)
 
 
+    def execute_system_call(self):
+        '''
+        Run Stata in a private scratch directory inside the target directory, 
+        so that concurrent steps running scripts with the same name do not
+        write to the same Stata log. A driver do-file in the scratch directory
+        changes back to the working directory of the build and runs the 
+        script, so paths used by the script resolve as before.
+        '''
+        self.open_scratch_dir()
+        script_name = os.path.basename(self.source_file)
+        self.driver_file = os.path.join(self.scratch_dir, script_name)
+        self.log_file = os.path.normpath(os.path.splitext(self.driver_file)[0] + '.log')
+        with open(self.driver_file, 'w') as driver:
+            driver.write('cd "%s"\n' % os.getcwd())
+            driver.write('do "%s" `0\'\n' % os.path.abspath(self.source_file))
+        try:
+            super(StataBuilder, self).execute_system_call()
+        finally:
+            os.remove(self.driver_file)
+            self.close_scratch_dir()
+        return None
+
+
+    def get_call(self):
+        '''
+        Run the driver do-file from the scratch directory.
+        '''
+        command = '%s %s %s %s' % (self.executable, self.exec_opts, 
+                                   os.path.basename(self.driver_file), self.cl_arg)
+        return command, self.scratch_dir
+
+
+    def run_system_call(self, stdout):
+        '''
+        Run the script in a Stata session shared with other steps if 
+        env['stata_batch'] is set (see stata_sessions), and on its own otherwise.
+        '''
+        options = stata_sessions.get_options(self.env)
+        if options is None:
+            return super(StataBuilder, self).run_system_call(stdout)
+        return stata_sessions.submit(self, stdout, *options)
+
+
+    def reserve_resources(self):
+        '''
+        Hold the step's resources while it runs, unless it runs in a shared
+        session, whose first step holds them for the session (see stata_sessions).
+        '''
+        if stata_sessions.get_options(self.env) is None:
+            return super(StataBuilder, self).reserve_resources()
+        return resource_pool.reserve({})
+
+
+    def raise_system_call_exception(self, command = '', traceback = ''):
+        '''
+        Point the error message at the Stata log's place in the target 
+        directory, where it is moved when the scratch directory is closed.
+        '''
+        self.log_file = os.path.join(self.target_dir, os.path.basename(self.log_file))
+        super(StataBuilder, self).raise_system_call_exception(command, traceback)
+        return None
+
+
     def add_log_file(self):
         super(StataBuilder, self).add_log_file()
         self.final_sconscript_log = os.path.normpath(self.log_file)
@@ -73,10 +142,27 @@ class StataBuilder(GSLabBuilder):
         return None
 
 
-    def execute_system_call(self):
+    def get_final_log_path(self):
+        '''
+        Stata's own log is appended to the sconscript log once the step completes.
+        '''
+        return self.final_sconscript_log
+
+    def begin_log(self, start_time):
         '''
+        Stata writes its own log, so the start time is written straight 
+        to the sconscript log.
         '''
-        super(StataBuilder, self).execute_system_call()
-        shutil.move(self.log_file, self.final_sconscript_log)
+        super(StataBuilder, self).begin_log(start_time, self.final_sconscript_log)
         return None
 
+    def timestamp_log(self, start_time, end_time):
+        '''
+        Append Stata's log to the sconscript log, then record the end time.
+        '''
+        with open(self.log_file, 'rb') as stata_log:
+            with open(self.final_sconscript_log, 'ab') as sconscript_log:
+                shutil.copyfileobj(stata_log, sconscript_log)
+        os.remove(self.log_file)
+        super(StataBuilder, self).timestamp_log(start_time, end_time, self.final_sconscript_log)
+        return None
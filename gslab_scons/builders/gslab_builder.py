@@ -1,9 +1,20 @@
 import abc
+import codecs
+import json
 import os
 import subprocess
 import sys
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 
 import gslab_scons.misc as misc
+import gslab_scons.log as log
+import gslab_scons.build_cache as build_cache
+import gslab_scons.build_metrics as build_metrics
+import gslab_scons.resource_pool as resource_pool
 from gslab_scons._exception_classes import ExecCallError, TargetNonexistenceError, BadExtensionError
 
 class GSLabBuilder(object):
@@ -43,9 +54,11 @@ class GSLabBuilder(object):
         self.add_source_file(source)
         self.target           = [str(t) for t in misc.make_list_if_string(target)]
         self.target_dir       = misc.get_directory(self.target[0])
-        if 'executable_names' not in env:
-            env['executable_names'] = {}
-        self.executable       = misc.get_executable(name, env['executable_names'])
+        try:
+            executable_names = env['executable_names']
+        except KeyError:
+            executable_names = {}
+        self.executable       = misc.get_executable(name, executable_names)
         self.env              = env
         self.add_command_line_arg()
         self.add_log_file()
@@ -62,8 +75,10 @@ class GSLabBuilder(object):
             sources = misc.make_list_if_string(source)
             source_file = str(sources[0])
         else:
+            sources = []
             source_file = ''
         self.source_file = os.path.normpath("%s" % source_file)
+        self.sources     = [os.path.normpath(str(s)) for s in sources]
         return None
 
 
@@ -112,17 +127,103 @@ class GSLabBuilder(object):
         Execute the system call attribute.
         Log the execution.
         Check that expected targets exist after execution.
+        If env['build_cache'] is set (see build_cache.get_cache), targets and
+        the log are restored from the cache when an identical step has been 
+        built before, and stored in it after a successful run otherwise.
+        If env['build_metrics'] is set, the step's resource use is recorded
+        in that database whether or not it succeeds (see build_metrics).
+        If env['resources'] is set, the step waits until the resources it 
+        declares are free before running; steps scheduled by resource_pool 
+        find them free (see resource_pool).
         '''
         self.check_code_extension()
-        start_time = misc.current_time()
-        print('Running: {}'.format(self.system_call))
-        self.do_call()
-        self.check_targets()
+        self.exit_status = None
+        self.usage       = {}
+        cache = build_cache.get_cache(self.env)
+        if cache is not None:
+            key = self.cache_key()
+            if cache.restore(key, self.get_target_paths(), self.get_final_log_path()):
+                print('Restored from build cache: {}'.format(self.system_call))
+                now = misc.current_time()
+                self.start_clock = time.time()
+                self.write_log_sidecar(self.get_final_log_path(), now, now, cached = True)
+                self.record_metrics(cached = True)
+                return None
+        with self.reserve_resources():
+            start_time = misc.current_time()
+            self.begin_log(start_time)
+            print('Running: {}'.format(self.system_call))
+            try:
+                self.do_call()
+                self.check_targets()
+            finally:
+                self.record_metrics()
         end_time =  misc.current_time()    
         self.timestamp_log(start_time, end_time)
+        if cache is not None:
+            cache.store(key, self.get_target_paths(), self.get_final_log_path())
+        return None
+
+
+    def reserve_resources(self):
+        '''
+        Return a context manager that holds the resources the step declares
+        while it runs (see resource_pool.reserve).
+        '''
+        return resource_pool.reserve(self.env)
+
+
+    def record_metrics(self, cached = False):
+        '''
+        Record the step's wall time, CPU time, peak memory, exit status and
+        target sizes in the database named by env['build_metrics'], if any.
+        A failure to record them is reported as a warning, so that it never 
+        hides the outcome of the step.
+        '''
+        database = build_metrics.get_database(self.env)
+        if database is None:
+            return None
+        try:
+            self.write_metrics(database, cached)
+        except (sqlite3.Error, OSError, ValueError) as error:
+            print('Warning: could not record build metrics for %s in %s (%s).'
+                  % (self.target[0], database, error))
         return None
 
 
+    def write_metrics(self, database, cached):
+        '''
+        Append the step's metrics to the database at path database.
+        '''
+        targets = self.get_target_paths()
+        target_bytes = sum(os.path.getsize(t) for t in targets if os.path.isfile(t))
+        build_metrics.record(database, 
+                             builder        = self.name,
+                             source         = self.source_file,
+                             target         = targets[0],
+                             targets        = list(targets),
+                             command        = self.system_call,
+                             log            = self.get_final_log_path(),
+                             started        = self.start_clock,
+                             wall_seconds   = time.time() - self.start_clock,
+                             user_seconds   = self.usage.get('user_seconds'),
+                             system_seconds = self.usage.get('system_seconds'),
+                             peak_rss_kb    = self.usage.get('peak_rss_kb'),
+                             exit_status    = self.exit_status,
+                             target_bytes   = target_bytes,
+                             cached         = int(cached))
+        return None
+
+
+    def cache_key(self):
+        '''
+        Return the build cache key of this step.
+        '''
+        return build_cache.make_key(self.name, self.executable, self.system_call, 
+                                    self.cl_arg, self.source_file, self.sources, 
+                                    self.get_target_paths())
+
+
     def check_code_extension(self):
         '''
         Raise an exception if the extension in executing script
@@ -142,15 +243,185 @@ class GSLabBuilder(object):
     def do_call(self):
         '''
         Acutally execute the system call attribute.
+        Output that the call does not redirect itself is read from a pipe in chunks:
+        it is spooled to a temporary file, appended to the log file once the call 
+        finishes and only its last env['output_tail_kb'] kilobytes (default 64) 
+        are held in memory for the error message. If env['live_output'] is True, 
+        that output and the growth of the log file are also echoed to the console.
         Raise an informative exception on error.
         '''
         try:
-            subprocess.check_output(self.system_call, shell = True, stderr = subprocess.STDOUT)
+            tail_size = int(self.env['output_tail_kb']) * 1024
+        except KeyError:
+            tail_size = 64 * 1024
+        try:
+            live = bool(self.env['live_output'])
+        except KeyError:
+            live = False
+        tail = OutputTail(tail_size)
+        read_fd, write_fd = os.pipe()
+        with tempfile.TemporaryFile() as spool:
+            stop = threading.Event()
+            threads = [threading.Thread(target = self.read_output, 
+                                        args = (read_fd, spool, tail, live))]
+            if live:
+                threads.append(threading.Thread(target = self.follow_log, args = (stop, )))
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            try:
+                self.exit_status = self.run_system_call(write_fd)
+            finally:
+                os.close(write_fd)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+            self.append_output(spool)
+        if self.exit_status != 0:
+            self.raise_system_call_exception(traceback = tail.getvalue())
+        return None
+
+
+    def run_system_call(self, stdout):
+        '''
+        Run the system call attribute with its output and errors going to stdout
+        and return its exit status. When build metrics are recorded, the CPU time
+        and peak memory of the call are stored in the usage attribute.
+        '''
+        command, cwd = self.get_call()
+        if build_metrics.get_database(self.env) is not None:
+            status, self.usage = build_metrics.call_with_usage(command, stdout, cwd)
+            return status
+        try:
+            subprocess.check_call(command, shell = True, cwd = cwd,
+                                  stdout = stdout, stderr = subprocess.STDOUT)
         except subprocess.CalledProcessError as ex:
-            self.raise_system_call_exception(traceback = ex.output)
+            return ex.returncode
+        return 0
+
+
+    def get_call(self):
+        '''
+        Return the command that run_system_call runs and the directory to run
+        it in (None for the current directory). By default this is the system 
+        call attribute, run where SCons runs.
+        '''
+        return self.system_call, None
+
+
+    def open_scratch_dir(self):
+        '''
+        Create a private scratch directory for this step inside the target
+        directory and store its path in the scratch_dir attribute. Executables 
+        that write logs or side outputs to their working directory can be run
+        there so that concurrent steps never write to the same paths.
+        '''
+        self.scratch_dir = tempfile.mkdtemp(prefix = '.gslab_scratch_', 
+                                            dir = self.target_dir or os.curdir)
+        return self.scratch_dir
+
+
+    def close_scratch_dir(self):
+        '''
+        Move whatever is left in the scratch directory to the target directory,
+        each file with a single rename, and remove the scratch directory.
+        Directories are merged into directories of the same name. Anything that 
+        cannot be moved is reported and left in the scratch directory.
+        '''
+        unmoved = merge_into(self.scratch_dir, self.target_dir or os.curdir)
+        if unmoved:
+            print('Warning: could not move %s from %s to %s; they were left there.'
+                  % (', '.join(unmoved), self.scratch_dir, self.target_dir or os.curdir))
+        else:
+            shutil.rmtree(self.scratch_dir, ignore_errors = True)
+        return None
+
+
+    def read_output(self, read_fd, spool, tail, live):
+        '''
+        Copy everything written to the pipe read_fd to spool and tail,
+        and to the console if live is True, then close read_fd. Console
+        lines are tagged with the step's first target.
+        '''
+        log.set_job(self.target[0])
+        console = ConsoleStream()
+        with os.fdopen(read_fd, 'rb', 0) as pipe:
+            while True:
+                chunk = pipe.read(64 * 1024)
+                if not chunk:
+                    break
+                spool.write(chunk)
+                tail.write(chunk)
+                if live:
+                    console.write(chunk)
+        console.close()
+        return None
+
+
+    def follow_log(self, stop, interval = 0.5):
+        '''
+        Echo what is written to the log file to the console until stop is set,
+        tagging lines with the step's first target. The line begin_log starts
+        the log with is not echoed.
+        '''
+        log.set_job(self.target[0])
+        log_path = self.get_log_path()
+        position = 0
+        console  = ConsoleStream()
+        while True:
+            stopped = stop.wait(interval)
+            try:
+                if os.path.getsize(log_path) < position:
+                    position = 0
+                with open(log_path, 'rb') as f:
+                    f.seek(position)
+                    chunk = f.read()
+            except (IOError, OSError):
+                chunk = b''
+            if position == 0 and chunk.startswith(b'*** Builder log created'):
+                console.write(chunk[chunk.find(b'\n') + 1:])
+            else:
+                console.write(chunk)
+            position += len(chunk)
+            if stopped:
+                break
+        console.close()
         return None
 
 
+    def append_output(self, spool):
+        '''
+        Append the output spooled by do_call to the log file.
+        '''
+        if not spool.tell():
+            return None
+        spool.seek(0)
+        with open(self.get_log_path(), 'ab') as f:
+            shutil.copyfileobj(spool, f)
+        return None
+
+
+    def get_log_path(self):
+        '''
+        Return the path at which the log file can be opened during the build.
+        '''
+        return self.log_file
+
+
+    def get_final_log_path(self):
+        '''
+        Return the path of the log file once the build step has completed.
+        '''
+        return self.get_log_path()
+
+
+    def get_target_paths(self):
+        '''
+        Return the paths at which the targets can be opened.
+        '''
+        return self.target
+
+
     def raise_system_call_exception(self, command = '', traceback = ''):
         '''
         Create and raise an informative error message from failed system call.
@@ -179,17 +450,133 @@ class GSLabBuilder(object):
         return None
 
 
-    def timestamp_log(self, start_time, end_time):
+    def begin_log(self, start_time, log_path = None):
+        '''
+        Start the log file with the time the build step began. 
+        The system call appends its output after this line.
+        Any JSON sidecar left by an earlier build is removed, and the log is
+        registered with the build's log manifest (see log.end_log).
+        '''
+        if log_path is None:
+            log_path = self.get_log_path()
+        self.start_clock = time.time()
+        with open(log_path, mode = 'w') as f:
+            f.write('*** Builder log created: {%s}\n' % start_time)
+        sidecar = '%s.json' % log_path
+        if os.path.isfile(sidecar):
+            os.remove(sidecar)
+        log.register_builder_log(log_path)
+        return None
+
+
+    def timestamp_log(self, start_time, end_time, log_path = None):
+        '''
+        Append the time the build step completed to the log file and record 
+        the timing in a JSON sidecar, log_path + '.json', that 
+        log.collect_builder_logs reads instead of the log itself.
+        '''
+        if log_path is None:
+            log_path = self.get_log_path()
+        with open(log_path, mode = 'a') as f:
+            f.write('\n*** Builder log completed: {%s}\n' % end_time)
+        self.write_log_sidecar(log_path, start_time, end_time)
+        return None
+
+
+    def write_log_sidecar(self, log_path, start_time, end_time, **extra):
         '''
-        Adds beginning and ending times to a log file made for system call.
+        Write the JSON sidecar of the log file at log_path and register the
+        log's completion with the build's log manifest.
         '''
-        with open(self.log_file, mode = 'r') as f:
-            content = f.read()
-            f.seek(0, 0)
-            builder_log_msg = '*** Builder log created: {%s}\n' \
-                              '\n' \
-                              '*** Builder log completed: {%s}\n%s' \
-                              % (start_time, end_time, content)
-        with open(self.log_file, mode = 'w') as f:
-            f.write(builder_log_msg)
+        timing = {'builder':   self.name,
+                  'command':   self.system_call,
+                  'created':   start_time,
+                  'completed': end_time,
+                  'seconds':   round(time.time() - self.start_clock, 3)}
+        timing.update(extra)
+        with open('%s.json' % log_path, mode = 'w') as f:
+            json.dump(timing, f, indent = 4, sort_keys = True)
+        log.register_builder_log(log_path, end_time)
+        return None
+
+
+class OutputTail(object):
+    '''
+    Ring buffer keeping the last `size` bytes written to it.
+    '''
+    def __init__(self, size):
+        self.size    = size
+        self.buffer  = bytearray()
+        self.dropped = 0
+
+    def write(self, data):
+        self.buffer.extend(data)
+        excess = len(self.buffer) - self.size
+        if excess > 0:
+            del self.buffer[:excess]
+            self.dropped += excess
         return None
+
+    def getvalue(self):
+        '''
+        Return the kept bytes as text, noting how many earlier bytes were dropped.
+        '''
+        text = bytes(self.buffer).decode('utf-8', 'replace')
+        if self.dropped:
+            text = '[%d earlier bytes omitted]\n%s' % (self.dropped, text)
+        return text
+
+
+def merge_into(source, destination):
+    '''
+    Move the contents of the directory source into the directory destination,
+    replacing files and merging directories of the same name recursively.
+    Return the paths under source that could not be moved.
+    '''
+    unmoved = []
+    for name in sorted(os.listdir(source)):
+        moved  = os.path.join(source, name)
+        target = os.path.join(destination, name)
+        if os.path.isdir(moved) and not os.path.islink(moved) and \
+           os.path.isdir(target) and not os.path.islink(target):
+            unmoved += merge_into(moved, target)
+            continue
+        try:
+            os.replace(moved, target)
+        except OSError:
+            unmoved.append(moved)
+    return unmoved
+
+
+class ConsoleStream(object):
+    '''
+    Echo a stream of UTF-8 bytes to the console in chunks. Characters split
+    between chunks are decoded whole, and the stream ends with a newline.
+    '''
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors = 'replace')
+        self.ended   = True
+
+    def write(self, chunk, final = False):
+        text = self.decoder.decode(chunk, final)
+        if text:
+            write_console(text)
+            self.ended = text.endswith('\n')
+        return None
+
+    def close(self):
+        self.write(b'', final = True)
+        if not self.ended:
+            write_console('\n')
+        return None
+
+
+def write_console(text):
+    '''
+    Write text to the console. A LogMultiplexer is left to write it out
+    with the next batch of lines; other streams are flushed.
+    '''
+    sys.stdout.write(text)
+    if not isinstance(sys.stdout, log.LogMultiplexer):
+        sys.stdout.flush()
+    return None
@@ -0,0 +1,149 @@
+'''
+Minimal reference server for the GSLab remote build cache.
+
+The protocol is plain HTTP on two namespaces:
+    /cas/<sha256>   file content, addressed by its SHA-256 digest
+    /ac/<key>       the JSON manifest of a cached build step
+GET returns an object (404 if absent), HEAD reports whether it exists and
+PUT stores it. A PUT to /cas/ is rejected with 400 unless the body hashes to
+the digest in its path. Bodies are streamed to and from disk in blocks.
+
+Run it on localhost with
+    python -m gslab_scons.cache_server <directory> [--port 8765]
+and point builders at it with env['build_cache_url'] = 'http://localhost:8765'.
+'''
+import os
+import re
+import sys
+import hashlib
+import argparse
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bytes read or written at a time when streaming a body.
+BLOCK_SIZE = 1024 * 1024
+
+_path_pattern = re.compile(r'^/(?P<namespace>cas|ac)/(?P<name>[0-9a-f]{64})$')
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Serve GET, HEAD and PUT for the objects stored under self.server.directory.
+    '''
+    def object_path(self):
+        match = _path_pattern.match(self.path)
+        if not match:
+            self.send_error(404)
+            return None
+        return os.path.join(self.server.directory, match.group('namespace'),
+                            match.group('name'))
+
+    def do_HEAD(self):
+        self.send_object(body = False)
+
+    def do_GET(self):
+        self.send_object(body = True)
+
+    def send_object(self, body):
+        path = self.object_path()
+        if path is None:
+            return None
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        if body:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    self.wfile.write(block)
+        return None
+
+    def do_PUT(self):
+        path = self.object_path()
+        if path is None:
+            return None
+        try:
+            remaining = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.send_error(411)
+            return None
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass
+        hasher = hashlib.sha256()
+        handle, partial = tempfile.mkstemp(dir = directory, suffix = '.partial')
+        with os.fdopen(handle, 'wb') as f:
+            while remaining > 0:
+                block = self.rfile.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                f.write(block)
+                remaining -= len(block)
+        is_content = _path_pattern.match(self.path).group('namespace') == 'cas'
+        if remaining > 0 or (is_content and hasher.hexdigest() != os.path.basename(path)):
+            os.remove(partial)
+            self.send_error(400, 'Body does not match its digest')
+            return None
+        os.replace(partial, path)
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return None
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def make_server(directory, host = '127.0.0.1', port = 0, verbose = False):
+    '''
+    Return a threaded HTTP cache server storing objects under directory.
+    Port 0 picks a free port, available afterwards as server.server_port.
+    '''
+    server = ThreadingHTTPServer((host, port), CacheRequestHandler)
+    server.directory = os.path.abspath(directory)
+    server.verbose   = verbose
+    return server
+
+
+def start_server(directory, host = '127.0.0.1', port = 0):
+    '''
+    Start a cache server on a background thread and return it.
+    Stop it with server.shutdown() and server.server_close().
+    '''
+    server = make_server(directory, host, port)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main(argv = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description = 'GSLab build cache server')
+    parser.add_argument('directory', help = 'directory in which objects are stored')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8765)
+    args = parser.parse_args(argv)
+    server = make_server(args.directory, args.host, args.port, verbose = True)
+    print('Serving build cache %s at http://%s:%d' % (server.directory, args.host,
+                                                       server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return None
+
+
+if __name__ == '__main__':
+    main()
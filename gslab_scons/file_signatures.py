@@ -0,0 +1,197 @@
+'''
+Fast file signatures for deciding whether SCons targets are out of date.
+
+SCons's content Decider reads every dependency in full on each build that
+does not already know its signature, which for multi-GB data files costs far
+more than the build itself when nothing has changed. The Decider returned by
+signature_decider() keeps a persistent cache of each file's inode, size,
+mtime_ns and BLAKE2b digest, and only hashes a file again when its stat
+changes, so a no-op rebuild costs one stat per dependency:
+    env.Decider(gs.signature_decider())
+
+The digest is used as the file's content signature, so a file that is
+touched or rewritten with the same content does not cause a rebuild. With
+sample_mb set, files larger than three samples are hashed from their size
+and sample_mb megabytes at their head, middle and tail; that is much faster
+for huge files but misses edits outside the samples that keep the size.
+The first build after switching Deciders rebuilds everything once, as the
+stored signatures change.
+
+Compare hashing a tree in full with the cached signatures with
+    python -m gslab_scons.file_signatures <directory> [--sample-mb N]
+'''
+import os
+import sys
+import json
+import time
+import atexit
+import hashlib
+import argparse
+import threading
+
+# Bytes read at a time when hashing a file.
+CHUNK_SIZE = 1024 * 1024
+
+_caches      = {}
+_caches_lock = threading.Lock()
+
+
+def fast_hash(path, sample_bytes = None):
+    '''
+    Return the BLAKE2b digest of the file at path, read in chunks. If
+    sample_bytes is given and the file is larger than three samples, hash
+    only its size and the samples at its head, middle and tail.
+    '''
+    digest = hashlib.blake2b(digest_size = 20)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if sample_bytes and size > 3 * sample_bytes:
+            digest.update(('sampled %d %d\n' % (size, sample_bytes)).encode('ascii'))
+            for offset in [0, (size - sample_bytes) // 2, size - sample_bytes]:
+                f.seek(offset)
+                digest.update(f.read(sample_bytes))
+        else:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SignatureCache(object):
+    '''
+    Persistent map from file paths to their stat and digest.
+    '''
+    def __init__(self, path, sample_bytes = None):
+        self.path         = path
+        self.sample_bytes = sample_bytes
+        self.lock         = threading.Lock()
+        self.entries      = {}
+        self.changed      = False
+        self.hashed       = 0
+        try:
+            with open(path, 'r') as f:
+                stored = json.load(f)
+            if stored.get('sample_bytes') == sample_bytes:
+                self.entries = stored['entries']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def signature(self, path):
+        '''
+        Return the digest of the file at path, hashing it only if its inode,
+        size or modification time differ from the cached ones.
+        '''
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key  = [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is not None and entry[:3] == key:
+            return entry[3]
+        digest = fast_hash(path, self.sample_bytes)
+        with self.lock:
+            self.entries[path] = key + [digest]
+            self.changed = True
+            self.hashed += 1
+        return digest
+
+    def save(self):
+        '''
+        Write the cache to its path if it has changed, replacing the old copy
+        in one rename.
+        '''
+        with self.lock:
+            if not self.changed:
+                return None
+            temp = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(temp, 'w') as f:
+                json.dump({'sample_bytes': self.sample_bytes, 'entries': self.entries}, f)
+            os.replace(temp, self.path)
+            self.changed = False
+        return None
+
+
+def get_signature_cache(path = '.gslab_signatures.json', sample_mb = None):
+    '''
+    Return the SignatureCache stored at path, saved when the build exits.
+    '''
+    sample_bytes = int(sample_mb * 1024 * 1024) if sample_mb else None
+    path = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None or cache.sample_bytes != sample_bytes:
+            cache = _caches[path] = SignatureCache(path, sample_bytes)
+            atexit.register(cache.save)
+    return cache
+
+
+def signature_decider(cache = '.gslab_signatures.json', sample_mb = None):
+    '''
+    Return a function for env.Decider() that treats a file as changed when
+    its cached fast signature differs from the one stored when the target was
+    last built. Nodes that are not existing files are left to SCons's own
+    content Decider.
+    '''
+    signatures = get_signature_cache(cache, sample_mb)
+
+    def decide_if_changed(dependency, target, prev_ni, repo_node = None):
+        path = dependency.get_abspath() if hasattr(dependency, 'get_abspath') else None
+        if path is None or not os.path.isfile(path):
+            return dependency.changed_content(target, prev_ni)
+        csig = signatures.signature(path)
+        # SCons stores this signature for the next build instead of reading
+        # the file to compute its own.
+        dependency.get_ninfo().csig = csig
+        try:
+            return csig != prev_ni.csig
+        except AttributeError:
+            return True
+
+    return decide_if_changed
+
+
+def benchmark(directory, sample_mb = None):
+    '''
+    Return a text report of the time taken to hash every file under
+    directory in full with MD5, as SCons does, and with the signature cache
+    when it is cold and when it is warm, as on a no-op rebuild.
+    '''
+    paths = [os.path.join(root, name) for root, _, names in os.walk(directory)
+             for name in names]
+    total = sum(os.path.getsize(path) for path in paths)
+    started = time.time()
+    for path in paths:
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    full = time.time() - started
+
+    # A cache that starts empty and is never saved.
+    signatures = SignatureCache(os.devnull, int(sample_mb * 1024 * 1024) if sample_mb else None)
+    times = []
+    for _ in range(2):
+        started = time.time()
+        for path in paths:
+            signatures.signature(path)
+        times.append(time.time() - started)
+    lines = ['%d files, %.1f MB' % (len(paths), total / 1e6),
+             '%-34s %10.3f s' % ('MD5 of every file (SCons content)', full),
+             '%-34s %10.3f s' % ('signature cache, cold', times[0]),
+             '%-34s %10.3f s' % ('signature cache, warm (no-op)', times[1])]
+    if times[1]:
+        lines.append('No-op speedup over full hashing: %.0fx' % (full / times[1]))
+    return '\n'.join(lines)
+
+
+def main(argv = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description = 'Benchmark GSLab file signatures')
+    parser.add_argument('directory', help = 'directory tree to hash')
+    parser.add_argument('--sample-mb', type = float, default = None,
+                        help = 'hash only head, middle and tail samples of this size')
+    args = parser.parse_args(argv)
+    print(benchmark(args.directory, args.sample_mb))
+    return None
+
+
+if __name__ == '__main__':
+    main()
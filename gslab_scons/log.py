@@ -1,11 +1,22 @@
+import io
 import os
 import sys
 import glob
+import json
+import atexit
+import threading
 from datetime import datetime
 import subprocess
 import shutil
 import gslab_scons.misc as misc
 
+# Manifest of the builder logs written during this build, set by start_log.
+_manifest      = None
+_manifest_lock = threading.Lock()
+
+# Label of the build step whose output each thread writes, set by set_job.
+_jobs = threading.local()
+
 
 def start_log(mode, cl_args_list = sys.argv, log = 'sconstruct.log'):
     '''Begins logging a build process'''
@@ -18,23 +29,172 @@ def start_log(mode, cl_args_list = sys.argv, log = 'sconstruct.log'):
     start_message = "*** New build: {%s} ***\n" % misc.current_time()
     with open(log, "w") as f:
         f.write(start_message)
+    start_manifest(log)
 
-    if misc.is_unix():
-        sys.stdout = os.popen('tee -a %s' % log, 'w')
-    elif sys.platform == 'win32':
-        sys.stdout = open(log, 'a')
+    if misc.is_unix() or sys.platform == 'win32':
+        sys.stdout = LogMultiplexer(sys.stdout, log)
+        atexit.register(sys.stdout.close)
 
     sys.stderr = sys.stdout
 
     return None
 
 
+def set_job(label):
+    '''
+    Tag the lines the calling thread writes to a LogMultiplexer with label,
+    such as the target of the build step whose output it copies. None
+    removes the tag.
+    '''
+    _jobs.label = label
+    return None
+
+
+class LogMultiplexer(io.TextIOBase):
+    '''
+    Text stream that copies what is written to it to the console and to a
+    log file, in place of piping the output through `tee`.
+
+    Threads write whole lines: text is held per thread until it ends a line,
+    and lines written by a thread that called set_job(), such as the builders
+    copying the output of their steps under `scons -j`, are tagged with its
+    label. Complete lines are batched and written out when buffer_size
+    characters are waiting, every flush_interval seconds, or when flush() is
+    called. flush() from the main thread also writes out its unfinished line,
+    as input() prompts need; other threads' lines are only written once whole.
+    '''
+    def __init__(self, console, log, buffer_size = 64 * 1024, flush_interval = 0.2):
+        self.console     = console
+        self.log         = open(log, 'a')
+        self.buffer_size = buffer_size
+        self.lock        = threading.Lock()
+        self.partial     = {}
+        self.midline     = set()
+        self.tags        = {}
+        self.pending     = []
+        self.pending_size = 0
+        self.stopped     = threading.Event()
+        self.flusher     = threading.Thread(target = self.flush_periodically,
+                                            args = (flush_interval, ))
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def writable(self):
+        return True
+
+    @property
+    def encoding(self):
+        return getattr(self.console, 'encoding', 'utf-8')
+
+    def tag(self, ident):
+        '''
+        Return the prefix of lines written by the thread ident.
+        '''
+        label = self.tags.get(ident)
+        if label is None:
+            return ''
+        return '[%s] ' % label
+
+    def queue(self, ident, text):
+        '''
+        Queue text from thread ident, tagging each line it starts.
+        '''
+        lines = text.splitlines(True)
+        tag = self.tag(ident)
+        for index, line in enumerate(lines):
+            if index > 0 or ident not in self.midline:
+                line = tag + line
+            self.pending.append(line)
+            self.pending_size += len(line)
+        if text.endswith('\n'):
+            self.midline.discard(ident)
+        else:
+            self.midline.add(ident)
+        return None
+
+    def write(self, text):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', 'replace')
+        ident = threading.get_ident()
+        label = getattr(_jobs, 'label', None)
+        with self.lock:
+            self.tags[ident] = label
+            text_so_far = self.partial.pop(ident, '') + text
+            end = text_so_far.rfind('\n') + 1
+            if end:
+                self.queue(ident, text_so_far[:end])
+            if text_so_far[end:]:
+                self.partial[ident] = text_so_far[end:]
+            else:
+                del self.tags[ident]
+            if self.pending_size >= self.buffer_size:
+                self.write_pending()
+        return len(text)
+
+    def write_pending(self):
+        '''
+        Write the queued lines to the console and the log. Call with the lock held.
+        '''
+        if not self.pending:
+            return None
+        text = ''.join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        for stream in [self.console, self.log]:
+            try:
+                stream.write(text)
+                stream.flush()
+            except (IOError, OSError, ValueError):
+                pass
+        return None
+
+    def flush(self):
+        if self.closed:
+            return None
+        ident = threading.get_ident()
+        with self.lock:
+            if ident == threading.main_thread().ident and ident in self.partial:
+                self.queue(ident, self.partial.pop(ident))
+            self.write_pending()
+        return None
+
+    def flush_periodically(self, interval):
+        while not self.stopped.wait(interval):
+            with self.lock:
+                self.write_pending()
+        return None
+
+    def close(self):
+        '''
+        Write out everything held, including unfinished lines, and close the log.
+        The console is left open.
+        '''
+        if self.closed:
+            return None
+        self.stopped.set()
+        with self.lock:
+            for ident in list(self.partial):
+                self.queue(ident, self.partial.pop(ident))
+            self.write_pending()
+            self.log.close()
+        super(LogMultiplexer, self).close()
+        return None
+
+
 def end_log(cl_args_list = sys.argv, log = 'sconstruct.log', excluded_dirs = [],
             release_dir = './release/'):
-    '''Complete the log of a build process.'''
+    '''
+    Complete the log of a build process, appending the logs of the builders
+    that ran. These are read from the manifest the builders registered their
+    logs in if start_log began one, and found by searching the directory tree
+    otherwise.
+    '''
     if misc.is_scons_dry_run(cl_args_list = cl_args_list):
         return None
 
+    sys.stdout.flush()
     end_message = "*** Build completed: {%s} ***\n \n \n" % misc.current_time()
     with open(log, "a") as f:
         f.write(end_message)
@@ -45,24 +205,33 @@ def end_log(cl_args_list = sys.argv, log = 'sconstruct.log', excluded_dirs = [],
         s = s[s.find('{') + 1: s.find('}')]
         start_time = datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
 
-    # gather all sconscript logs
-    parent_dir = os.getcwd()
-    builder_logs = collect_builder_logs(parent_dir, excluded_dirs = excluded_dirs)
-
-    # keep only builder logs from this run OR is broken (value == beginning_of_time)
+    # gather the builder logs of this run from the manifest written by
+    # start_log and the builders, or by searching for sconscript logs
     beginning_of_time    = datetime.min # to catch broken logs (see collect_builder_logs)
-    this_run_dict = {key:value for key, value in builder_logs.items() if (value > start_time) or value == beginning_of_time}
+    manifest = manifest_path(log)
+    if os.path.isfile(manifest):
+        this_run_dict = read_manifest(manifest, excluded_dirs)
+    else:
+        parent_dir = os.getcwd()
+        builder_logs = collect_builder_logs(parent_dir, excluded_dirs = excluded_dirs)
+        # keep only builder logs from this run OR is broken (value == beginning_of_time)
+        this_run_dict = {key:value for key, value in builder_logs.items() if (value > start_time) or value == beginning_of_time}
     this_run_list = sorted(this_run_dict, key=this_run_dict.get, reverse=True)
 
-    with open(log, "a") as sconstruct:
+    with open(log, "r+b") as sconstruct:
+        sconstruct.seek(0, os.SEEK_END)
         for f in this_run_list:
-            with open(f, 'r') as sconscript:
-                if this_run_dict[f] == beginning_of_time:
-                    warning_string = "*** Warning!!! The log below does not have timestamps," + \
-                                     " the Sconscript may not have finished.\n"
-                    sconstruct.write(warning_string)
-                sconstruct.write(f + '\n')
-                sconstruct.write(sconscript.read())
+            if not os.path.isfile(f):
+                continue
+            if this_run_dict[f] == beginning_of_time:
+                warning_string = "*** Warning!!! The log below does not have timestamps," + \
+                                 " the Sconscript may not have finished.\n"
+                sconstruct.write(warning_string.encode('utf-8'))
+            sconstruct.write((f + '\n').encode('utf-8'))
+            append_file(f, sconstruct)
+    if os.path.isfile(manifest):
+        os.remove(manifest)
+    stop_manifest()
 
     # move top level logs to /release/ directory.
     if not os.path.exists(release_dir):
@@ -72,12 +241,112 @@ def end_log(cl_args_list = sys.argv, log = 'sconstruct.log', excluded_dirs = [],
     return None
 
 
+def manifest_path(log):
+    '''Return the path of the builder-log manifest of the build logged in log.'''
+    return '%s.manifest' % log
+
+
+def start_manifest(log):
+    '''
+    Start an empty manifest for the build logged in log, to which builders
+    register their logs with register_builder_log.
+    '''
+    global _manifest
+    with _manifest_lock:
+        _manifest = os.path.abspath(manifest_path(log))
+        open(_manifest, 'w').close()
+    return None
+
+
+def stop_manifest():
+    global _manifest
+    with _manifest_lock:
+        _manifest = None
+    return None
+
+
+def register_builder_log(log_path, completed = None):
+    '''
+    Record in the manifest of the current build, if start_log began one, that
+    a builder writes its log to log_path and, once it has finished, the time
+    it completed.
+    '''
+    with _manifest_lock:
+        if _manifest is None:
+            return None
+        entry = {'log': os.path.abspath(log_path), 'completed': completed}
+        with open(_manifest, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+    return None
+
+
+def read_manifest(manifest, excluded_dirs = []):
+    '''
+    Return a dictionary mapping the builder logs registered in manifest,
+    relative to the current directory, to their completion times, or to 
+    datetime.min for logs that were not completed. Logs whose paths contain 
+    one of excluded_dirs are left out.
+    '''
+    excluded_dirs = [os.path.normpath(x) for x in misc.make_list_if_string(excluded_dirs)]
+    logs = {}
+    with open(manifest, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            log_path = os.path.relpath(entry['log'])
+            if any(x in log_path for x in excluded_dirs):
+                continue
+            try:
+                logs[log_path] = datetime.strptime(entry['completed'], "%Y-%m-%d %H:%M:%S")
+            except (TypeError, ValueError):
+                logs[log_path] = datetime.min
+    return logs
+
+
+def append_file(source, destination):
+    '''
+    Append the file at path source to the binary file object destination,
+    which must not be open in append mode. The kernel copies the data 
+    (os.copy_file_range or os.sendfile) where the platform allows it.
+    '''
+    destination.flush()
+    out_fd = destination.fileno()
+    with open(source, 'rb') as f:
+        in_fd = f.fileno()
+        remaining = os.fstat(in_fd).st_size
+        copies = []
+        if hasattr(os, 'copy_file_range'):
+            copies.append(lambda count: os.copy_file_range(in_fd, out_fd, count))
+        if hasattr(os, 'sendfile'):
+            copies.append(lambda count: os.sendfile(out_fd, in_fd, None, count))
+        for copy in copies:
+            try:
+                while remaining > 0:
+                    copied = copy(remaining)
+                    if not copied:
+                        break
+                    remaining -= copied
+                break
+            except OSError:
+                continue
+        # Copy whatever the kernel did not, e.g. on file systems without support.
+        destination.seek(0, os.SEEK_END)
+        shutil.copyfileobj(f, destination)
+    return None
+
+
 def collect_builder_logs(parent_dir, excluded_dirs = []):
     ''' Recursively return dictionary of files named sconscript*.log
         in parent_dir and nested directories.
         Also return timestamp from those sconscript.log
         (snippet from SO 3964681)
 
+        The completion time is read from the JSON sidecar (log path + '.json') 
+        that builders write next to each finished log. Logs without a sidecar 
+        are read only for the second line, where older builders put it.
+
         excluded_dirs (str or list of str):
             list of directories to be excluded from the search
         '''
@@ -90,20 +359,42 @@ def collect_builder_logs(parent_dir, excluded_dirs = []):
 
     log_paths = misc.finder(rel_parent_dir, log_name, excluded_dirs)
 
-    # Read the file at each path to a log and store output complete-time in a dict at filename
+    # Store each log's complete-time in a dict at filename
     for log_path in log_paths:
-        with open(log_path, 'r') as f:
-            try:
-                s = f.readlines()[1] # line 0 = log start time, line 1 = log end time
-            except IndexError:
-                s = ''
-            s = s[s.find('{') + 1: s.find('}')] # find {} time identifier
-            try:
-                builder_log_end_time = datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
-            except ValueError: # if the code breaks, there's no time identifier
-                beginning_of_time    = datetime.min
-                builder_log_end_time = beginning_of_time
-        builder_log_collect[log_path]  = builder_log_end_time
+        builder_log_collect[log_path] = builder_log_end_time(log_path)
 
     return builder_log_collect
 
+
+def builder_log_end_time(log_path):
+    '''
+    Return the time at which the builder log at log_path was completed,
+    or datetime.min if the log was not completed. The time is read from the
+    log's JSON sidecar or, for logs without one, from the completion line in
+    the header that older builders wrote, or at the end of the log.
+    '''
+    try:
+        with open('%s.json' % log_path, 'r') as f:
+            s = json.load(f)['completed']
+    except (IOError, OSError, ValueError, KeyError):
+        s = ''
+        with open(log_path, 'r', errors = 'replace') as f:
+            # The header is made of blank lines and *** Builder log lines.
+            for line in f:
+                if line.startswith('*** Builder log completed'):
+                    s = line
+                    break
+                if line.strip() and not line.startswith('*** Builder log'):
+                    break
+        if not s:
+            with open(log_path, 'rb') as f:
+                f.seek(max(0, os.path.getsize(log_path) - 4096))
+                tail = f.read().decode('utf-8', 'replace')
+            lines = [line for line in tail.splitlines() if line.strip()]
+            if lines and lines[-1].startswith('*** Builder log completed'):
+                s = lines[-1]
+        s = s[s.find('{') + 1: s.find('}')] # find {} time identifier
+    try:
+        return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+    except ValueError: # if the code breaks, there's no time identifier
+        return datetime.min
@@ -2,12 +2,15 @@ import os
 import re
 import sys
 import subprocess
+import functools
+import concurrent.futures
 import datetime
 import yaml
 import getpass
 import fnmatch
 # Import gslab_scons modules
 from . import _exception_classes
+from . import scan_cache
 
 def make_heading(s):
     '''
@@ -83,16 +86,30 @@ def current_time():
     return datetime.datetime.strftime(now, '%Y-%m-%d %H:%M:%S')
 
 
+_lyx_patterns = {}
+
+
 def lyx_scan(node, env, path):
-    contents = node.get_contents()
-    SOURCE = []
-    for ext in env.EXTENSIONS:
-        src_find = re.compile(r'filename\s(\S+%s)' % ext, re.M)
+    '''
+    Return the files with an extension in env.EXTENSIONS that the LyX file
+    node includes. The contents are searched once with a single pattern per
+    set of extensions, and results are memoised across builds by the file's
+    path, size and modification time (see scan_cache).
+    '''
+    extensions = tuple(env.EXTENSIONS)
+    try:
+        src_find = _lyx_patterns[extensions]
+    except KeyError:
+        alternatives = '|'.join(re.escape(ext) for ext in extensions)
+        src_find = re.compile(r'filename\s(\S+(?:%s))' % alternatives, re.M)
+        _lyx_patterns[extensions] = src_find
 
-        SOURCE = SOURCE + [source.replace('"', '')
-                           for source in src_find.findall(contents)]
+    def scan():
+        contents = scan_cache.node_text(node)
+        return [source.replace('"', '') for source in src_find.findall(contents)]
 
-    return SOURCE
+    key = 'lyx:%s:%s' % ('|'.join(extensions), scan_cache.content_key(node))
+    return scan_cache.get_scan_cache().scan(key, scan)
 
 
 def load_yaml_value(path, key):
@@ -168,6 +185,26 @@ def get_directory(path):
     return directory
 
 
+def normalise_executables(manual_executables):
+    '''
+    Return manual_executables with lower-case, stripped names and executables,
+    dropping entries that are empty or switched off. Results are memoised by
+    the mapping's items, as every builder resolves its executable this way.
+    '''
+    try:
+        items = tuple(manual_executables.items())
+        return dict(_normalise_executables(items))
+    except TypeError:
+        return dict(_normalise_executables.__wrapped__(manual_executables.items()))
+
+
+@functools.lru_cache(maxsize = 64)
+def _normalise_executables(items):
+    normalised = [(str(k).lower().strip(), str(v).lower().strip()) for k, v in items]
+    return tuple((k, v) for k, v in normalised
+                 if k and v and v not in ['none', 'no', 'false', 'n', 'f'])
+
+
 def get_executable(language_name, manual_executables = {}):
     '''
     Get executable stored at language_name of dictionary manual_executables.
@@ -184,10 +221,7 @@ def get_executable(language_name, manual_executables = {}):
         'anything builder': ''
     }
     lower_name = language_name.lower().strip()
-    manual_executables = {str(k).lower().strip(): str(v).lower().strip() 
-                          for k, v in manual_executables.items()}
-    manual_executables = {k: v for k, v in manual_executables.items() 
-                          if k and v and v not in ['none', 'no', 'false', 'n', 'f']}
+    manual_executables = normalise_executables(manual_executables)
     try:
         executable = manual_executables[lower_name]
     except KeyError:
@@ -208,39 +242,61 @@ def get_executable(language_name, manual_executables = {}):
     return executable
 
 
-def finder(rel_parent_dir, pattern, excluded_dirs=[]):
+def finder(rel_parent_dir, pattern, excluded_dirs=[], workers=None):
     '''
-    A nice wrapper for the commands `find` (MacOS) and `dir` (Windows)
-    that allow excluded directories.
+    Return the paths, sorted, of the files under rel_parent_dir whose names
+    match the glob pattern, skipping every path that contains one of
+    excluded_dirs (as `find -path "*<dir>*" -prune` does).
+
+    Directories are read with os.scandir and excluded ones are pruned without
+    being entered. The subdirectories of rel_parent_dir are walked in up to
+    `workers` threads (by default, the number of CPUs up to 8); pass 1 to walk
+    in the calling thread. Symbolic links are neither followed nor returned.
     '''
-
-    if is_unix():
-        command = 'find %s' % (rel_parent_dir)
-        exclude_opt = ''
-        if len(excluded_dirs) > 0:
-            for x in excluded_dirs:  # add in args to exclude folders from search
-                # see https://stackoverflow.com/questions/4210042/exclude-directory-from-find-command/16595367
-                exclude_opt = '%s -path "*%s*" -prune -o ' % (
-                    exclude_opt, os.path.normpath(x))
-        command = '%s %s -name "%s" -type f' % (command, exclude_opt, pattern)
-
+    name_match = re.compile(fnmatch.translate(pattern)).match
+    if excluded_dirs:
+        excluded = '|'.join(fnmatch.translate('*%s*' % os.path.normpath(x))
+                            for x in excluded_dirs)
+        exclude_match = re.compile(excluded).match
     else:
-        command = 'dir "%s" /b/s' % os.path.join(rel_parent_dir, pattern)
-        for x in excluded_dirs:
-            command = '%s | find ^"%s^" /v /i ' % (
-                command, os.path.normpath(x))
+        exclude_match = lambda path: None
 
-    try:
-        out_paths = subprocess.check_output(
-            command, shell=True).decode().replace('\r\n', '\n')
-        out_paths = out_paths.split('\n')
-        # Strip paths and keep non-empty
-        out_paths = filter(bool, map(str.strip, out_paths))
-        out_paths = fnmatch.filter(out_paths, pattern)
-    except subprocess.CalledProcessError:
-        out_paths = []
-
-    return out_paths
+    def scan(directory):
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not exclude_match(entry.path):
+                            subdirs.append(entry.path)
+                    elif name_match(entry.name) and entry.is_file(follow_symlinks=False) \
+                            and not exclude_match(entry.path):
+                        files.append(entry.path)
+        except OSError:
+            pass
+        return files, subdirs
+
+    def walk(directory):
+        found = []
+        stack = [directory]
+        while stack:
+            files, subdirs = scan(stack.pop())
+            found.extend(files)
+            stack.extend(subdirs)
+        return found
+
+    out_paths, subdirs = scan(rel_parent_dir)
+    if workers is None:
+        workers = min(8, os.cpu_count() or 1)
+    if workers > 1 and len(subdirs) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            for found in pool.map(walk, subdirs):
+                out_paths.extend(found)
+    else:
+        for subdir in subdirs:
+            out_paths.extend(walk(subdir))
+    return sorted(out_paths)
 
 
 def add_two_dict_keys(d = {}, common_key = '', key1 = 'global', key2 = 'user'):
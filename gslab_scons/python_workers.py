@@ -0,0 +1,264 @@
+'''
+Warm worker pool for the GSLab Python builder.
+
+Starting a fresh interpreter for each script and re-importing heavy modules
+such as pandas and numpy can take longer than the script itself. With
+    env['python_workers'] = ['numpy', 'pandas']
+build_python sends each script to a server process that has imported those
+modules once. The server forks a copy of itself per script, which runs the
+script as __main__ with its own sys.argv, working directory and environment.
+As with `python -u script.py >> log`, its output is appended to the builder
+log and its errors are passed back to the builder. Set the key to True to
+fork from a plain interpreter. The pool is only used on platforms with
+os.fork; elsewhere scripts run as usual.
+
+When the build exits, the number of scripts run in the pool and the start-up
+time they saved are printed. The saving is estimated from how long the
+server took to start and import the warm modules.
+
+This module only uses the standard library, as the server is run by path
+with the builder's Python executable:
+    python python_workers.py <socket> [module ...]
+'''
+import os
+import sys
+import json
+import array
+import time
+import atexit
+import shlex
+import shutil
+import socket
+import tempfile
+import threading
+import traceback
+import subprocess
+import socketserver
+
+_pools      = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(env, executable):
+    '''
+    Return the WorkerPool configured by env for executable, or None if
+    env['python_workers'] is unset or false or the platform cannot fork.
+    '''
+    try:
+        warm = env['python_workers']
+    except (KeyError, TypeError):
+        warm = None
+    if not warm or not hasattr(os, 'fork') or not hasattr(socket, 'AF_UNIX'):
+        return None
+    modules = () if warm is True else tuple(sorted(str(m) for m in warm))
+    key = (executable, modules)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = WorkerPool(executable, modules)
+        return _pools[key]
+
+
+class WorkerPool(object):
+    '''
+    Client side of a worker server, started on first use and stopped when
+    the build exits.
+    '''
+    def __init__(self, executable, modules = ()):
+        self.executable = executable
+        self.modules    = list(modules)
+        self.process    = None
+        self.server_pid = None
+        self.directory  = None
+        self.lock       = threading.Lock()
+        self.runs       = 0
+        self.startup_seconds = 0.0
+
+    def start(self):
+        '''
+        Start the server and wait until it has imported the warm modules.
+        '''
+        with self.lock:
+            if self.process is not None:
+                return None
+            self.directory = tempfile.mkdtemp(prefix = 'gslab_workers_')
+            self.socket_path = os.path.join(self.directory, 'workers.sock')
+            started = time.time()
+            # The server is run without a shell, so that stop() stops the
+            # server itself rather than a shell that leaves it running.
+            command = shlex.split(self.executable) + \
+                      [os.path.abspath(__file__), self.socket_path] + self.modules
+            self.process = subprocess.Popen(command, stdout = subprocess.PIPE)
+            ready = self.process.stdout.readline()
+            if not ready.startswith(b'ready'):
+                self.process.wait()
+                self.process = None
+                shutil.rmtree(self.directory, ignore_errors = True)
+                raise RuntimeError('Python worker server did not start: %s' %
+                                   ready.decode('utf-8', 'replace').strip())
+            self.server_pid = int(ready.split()[1])
+            self.startup_seconds = time.time() - started
+            atexit.register(self.stop)
+        return None
+
+    def run(self, script, args, cwd, log, stderr = None):
+        '''
+        Run script with the command line arguments in the string args from the
+        directory cwd, appending its output to log. Errors go to the file
+        descriptor stderr if given, and to log otherwise. Return the exit
+        status and a dictionary of the CPU seconds and peak memory it used.
+        '''
+        self.start()
+        request = {'script': os.path.abspath(script),
+                   'argv':   [script] + shlex.split(args),
+                   'cwd':    os.path.abspath(cwd or os.curdir),
+                   'log':    os.path.abspath(log),
+                   'env':    dict(os.environ)}
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.socket_path)
+            message = json.dumps(request).encode('utf-8') + b'\n'
+            send_fds(connection, message, [] if stderr is None else [stderr])
+            with connection.makefile('rb') as reply:
+                result = json.loads(reply.readline().decode('utf-8'))
+        finally:
+            connection.close()
+        with self.lock:
+            self.runs += 1
+        return result['status'], result['usage']
+
+    def stop(self):
+        '''
+        Stop the server and report the start-up time the pool saved.
+        '''
+        with self.lock:
+            if self.process is None:
+                return None
+            self.process.terminate()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+            shutil.rmtree(self.directory, ignore_errors = True)
+            if self.runs:
+                print('Python workers ran %d scripts, saving about %.1f s of start-up '
+                      '(%.2f s each).' % (self.runs, self.runs * self.startup_seconds,
+                                          self.startup_seconds))
+        return None
+
+
+def send_fds(connection, message, fds):
+    '''
+    Send message and the file descriptors fds over the Unix socket connection.
+    socket.send_fds is only available from Python 3.9, so SCM_RIGHTS is 
+    used directly.
+    '''
+    if not fds:
+        connection.sendall(message)
+        return None
+    sent = connection.sendmsg([message], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                                           array.array('i', fds))])
+    if sent < len(message):
+        connection.sendall(message[sent:])
+    return None
+
+
+def recv_fds(connection, size, max_fds):
+    '''
+    Receive up to size bytes and max_fds file descriptors from the Unix socket
+    connection. Return the bytes and a list of the descriptors.
+    '''
+    fds = array.array('i')
+    message, ancillary, _, _ = connection.recvmsg(size, socket.CMSG_LEN(max_fds * fds.itemsize))
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    return message, list(fds)
+
+
+class WorkerHandler(socketserver.StreamRequestHandler):
+    '''
+    Run the script described by one JSON request line in a forked child
+    and reply with its exit status and resource use.
+    '''
+    def handle(self):
+        message, fds = recv_fds(self.connection, 1024 * 1024, 1)
+        stderr = fds[0] if fds else None
+        while not message.endswith(b'\n'):
+            message += self.connection.recv(1024 * 1024)
+        request = json.loads(message.decode('utf-8'))
+        pid = os.fork()
+        if pid == 0:
+            os._exit(run_script(request, stderr))
+        if stderr is not None:
+            os.close(stderr)
+        _, status, usage = os.wait4(pid, 0)
+        if os.WIFSIGNALED(status):
+            status = -os.WTERMSIG(status)
+        else:
+            status = os.WEXITSTATUS(status)
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        peak_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        reply = {'status': status,
+                 'usage':  {'user_seconds':   usage.ru_utime,
+                            'system_seconds': usage.ru_stime,
+                            'peak_rss_kb':    peak_rss}}
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+def run_script(request, stderr = None):
+    '''
+    Run a script as python -u would, in the forked child, and return
+    its exit status.
+    '''
+    log = os.open(request['log'], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    null = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null, 0)
+    os.dup2(log, 1)
+    os.dup2(log if stderr is None else stderr, 2)
+    sys.stdout = open(1, 'w', buffering = 1, closefd = False)
+    sys.stderr = open(2, 'w', buffering = 1, closefd = False)
+    os.environ.clear()
+    os.environ.update(request['env'])
+    os.chdir(request['cwd'])
+    sys.argv = request['argv']
+    sys.path[0] = os.path.dirname(request['script'])
+    status = 0
+    try:
+        import runpy
+        runpy.run_path(request['script'], run_name = '__main__')
+    except SystemExit as ex:
+        if ex.code is None:
+            status = 0
+        elif isinstance(ex.code, int):
+            status = ex.code
+        else:
+            sys.stderr.write('%s\n' % ex.code)
+            status = 1
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return status
+
+
+class WorkerServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    max_children = 1024
+
+
+def main(argv = sys.argv[1:]):
+    socket_path, modules = argv[0], argv[1:]
+    sys.path[0] = os.getcwd()
+    for module in modules:
+        __import__(module)
+    server = WorkerServer(socket_path, WorkerHandler)
+    sys.stdout.write('ready %d\n' % os.getpid())
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+    return None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+'''
+Resource-aware concurrency limits for GSLab builders.
+
+A builder declares what its step needs in env['resources'], e.g.
+    env['resources'] = {'stata': 1, 'cores': 8, 'mem_gb': 32}
+and the totals available to the build go in env['resource_limits'], e.g.
+    env['resource_limits'] = {'stata': 2, 'mem_gb': 64}
+'cores' defaults to the number of CPUs; any other resource without a limit
+is not throttled. The limits are set once per build, by the first step that
+gives them; later steps giving different limits are warned about and
+ignored, so set them on the environment that every builder is called with.
+
+Steps are throttled when SCons schedules them. Calling
+    gs.schedule_resources(env)
+in an SConstruct, after the builders are added to env, gives each step of
+those builders that declares resources a share of SideEffect nodes standing
+for the units of each limited resource; build_anything steps get theirs
+without it. SCons never runs two steps sharing a side effect at once, so a
+step whose resources are taken is passed over without using a `-j N` job
+slot, and steps that declare nothing keep running beside it. Units are
+handed out in turn, so two steps may share one while another is free.
+Stata steps run in shared sessions (env['stata_batch']) are not scheduled;
+each session holds its resources once instead (see stata_sessions).
+
+A step also waits inside execute_system_call until everything it declares
+is free at once. This only waits for steps that were not scheduled, since
+scheduled steps never exceed the limits; such a step holds its job slot
+while it waits.
+'''
+import os
+import math
+import threading
+import contextlib
+
+
+class ResourcePool(object):
+    '''
+    Counting pool of named resources shared by the threads of a build.
+    A request is granted all at once or not at all, so steps holding part
+    of what they need never block one another.
+    '''
+    def __init__(self, limits = {}):
+        self.condition = threading.Condition()
+        self.limits    = {'cores': os.cpu_count() or 1}
+        self.in_use    = {}
+        self.configure(limits)
+
+    def configure(self, limits):
+        '''
+        Set the totals available for the resources named in limits.
+        '''
+        with self.condition:
+            for name, limit in limits.items():
+                self.limits[str(name)] = float(limit)
+            self.condition.notify_all()
+        return None
+
+    def clamp(self, request):
+        '''
+        Return request limited to the resources the pool throttles, each
+        capped at its total so that no request can wait forever.
+        '''
+        clamped = {}
+        for name, amount in request.items():
+            name = str(name)
+            if name in self.limits and float(amount) > 0:
+                clamped[name] = min(float(amount), self.limits[name])
+        return clamped
+
+    def available(self, request):
+        return all(self.in_use.get(name, 0) + amount <= self.limits[name]
+                   for name, amount in request.items())
+
+    def acquire(self, request):
+        '''
+        Block until every resource in request is free, then take it.
+        Return the request as granted, for release().
+        '''
+        request = self.clamp(request)
+        with self.condition:
+            while not self.available(request):
+                self.condition.wait()
+            for name, amount in request.items():
+                self.in_use[name] = self.in_use.get(name, 0) + amount
+        return request
+
+    def release(self, granted):
+        with self.condition:
+            for name, amount in granted.items():
+                self.in_use[name] -= amount
+            self.condition.notify_all()
+        return None
+
+
+_pool = ResourcePool()
+_limits      = None
+_limits_lock = threading.Lock()
+# Next unit of each resource to hand to a scheduled step.
+_next_unit   = {}
+
+
+def configure(limits):
+    '''
+    Set the pool's limits to limits if no step has set them in this build.
+    Return the limits in force.
+    '''
+    global _limits
+    limits = dict((str(name), float(limit)) for name, limit in limits.items())
+    with _limits_lock:
+        if _limits is None:
+            _limits = limits
+            _pool.configure(limits)
+        elif limits != _limits:
+            print('Warning: ignoring resource_limits %s; this build uses %s.'
+                  % (limits, _limits))
+    return _limits
+
+
+@contextlib.contextmanager
+def reserve(env):
+    '''
+    Hold the resources declared in env['resources'] for the duration of the
+    with block. The build's limits are taken from env['resource_limits'] if 
+    no earlier step set them (see configure).
+    '''
+    try:
+        request = env['resources']
+    except (KeyError, TypeError):
+        request = None
+    if not request:
+        yield {}
+        return
+    try:
+        configure(env['resource_limits'])
+    except KeyError:
+        pass
+    granted = _pool.acquire(request)
+    try:
+        yield granted
+    finally:
+        _pool.release(granted)
+
+
+def schedule(env, targets):
+    '''
+    Give the step building targets a SideEffect node for each unit of each
+    resource it declares in env['resources'], out of the limits in 
+    env['resource_limits'], so that SCons only starts it when they are free.
+    '''
+    try:
+        request = env['resources']
+    except (KeyError, TypeError):
+        request = None
+    if not request:
+        return []
+    try:
+        limits = dict(env['resource_limits'])
+    except KeyError:
+        limits = {}
+    pool = ResourcePool(limits)
+    units = []
+    with _limits_lock:
+        for name, amount in sorted(pool.clamp(request).items()):
+            total = max(int(pool.limits[name]), 1)
+            for _ in range(min(int(math.ceil(amount)), total)):
+                index = _next_unit.get(name, 0)
+                _next_unit[name] = (index + 1) % total
+                units.append('#.gslab_resources/%s_%d' % (name, index))
+    return env.SideEffect(units, targets) if units else []
+
+
+def schedule_resources(env):
+    '''
+    Schedule the steps of every builder in env['BUILDERS'] by the resources
+    they declare (see schedule).
+    '''
+    import SCons.Builder
+
+    def make_emitter(batched):
+        def emitter(target, source, env):
+            if not batched(env):
+                schedule(env, target)
+            return target, source
+        return emitter
+
+    for builder in env['BUILDERS'].values():
+        if not hasattr(builder, 'emitter') or getattr(builder, 'gslab_scheduled', False):
+            continue
+        # Builders whose steps share sessions, such as build_stata with
+        # env['stata_batch'], reserve resources per session instead.
+        function = getattr(getattr(builder, 'action', None), 'execfunction', None)
+        emitter  = make_emitter(getattr(function, 'batched', lambda env: False))
+        if builder.emitter:
+            builder.emitter = SCons.Builder.ListEmitter([builder.emitter, emitter])
+        else:
+            builder.emitter = emitter
+        builder.gslab_scheduled = True
+    return None
@@ -0,0 +1,122 @@
+'''
+Persistent memo of dependency scans for GSLab scanners.
+
+A scan only depends on the contents of the file scanned, so its result is
+stored under a key for those contents, together with the name of the
+scanner and anything else that changes its result. For a file on disk the
+key is its path, inode, size and modification time, so a file that has not
+changed is neither read nor scanned again; other nodes are keyed by a hash
+of their contents. The memo is kept in .gslab_scan_cache.json in the
+directory SCons runs from and saved when the build exits, so unchanged
+files are not scanned again on later runs. It holds at most max_entries
+results and drops the least recently used ones first, so the keys of old
+versions of files do not accumulate.
+'''
+import os
+import json
+import stat
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Default number of scan results kept in a memo.
+MAX_ENTRIES = 20000
+
+_caches      = {}
+_caches_lock = threading.Lock()
+
+
+def content_key(node, contents = None):
+    '''
+    Return a key for the contents of node: the path, inode, size and
+    modification time of the file it stands for if that file exists, and a
+    hash of contents otherwise.
+    '''
+    try:
+        path = node.get_abspath()
+        info = os.stat(path)
+    except (AttributeError, TypeError, OSError):
+        info = None
+    if info is not None and stat.S_ISREG(info.st_mode):
+        return 'stat:%s:%d:%d:%d' % (path, info.st_ino, info.st_size, info.st_mtime_ns)
+    if contents is None:
+        contents = node.get_contents()
+    if not isinstance(contents, bytes):
+        contents = contents.encode('utf-8')
+    return hashlib.sha256(contents).hexdigest()
+
+
+def node_text(node):
+    '''
+    Return the contents of node as text.
+    '''
+    contents = node.get_contents()
+    if isinstance(contents, bytes):
+        contents = contents.decode('utf-8', 'replace')
+    return contents
+
+
+class ScanCache(object):
+    '''
+    Map from scanner, options and content key to the dependencies found,
+    holding at most max_entries results in least recently used order.
+    '''
+    def __init__(self, path, max_entries = MAX_ENTRIES):
+        self.path        = path
+        self.max_entries = max_entries
+        self.lock        = threading.Lock()
+        self.entries     = OrderedDict()
+        self.changed     = False
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f, object_pairs_hook = OrderedDict)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def scan(self, key, scan):
+        '''
+        Return the result stored under key, calling scan() to compute and
+        store it if there is none.
+        '''
+        with self.lock:
+            if key in self.entries:
+                # The order is saved with the next change, so a build that
+                # only finds stored results does not rewrite the memo.
+                self.entries.move_to_end(key)
+                return list(self.entries[key])
+        found = list(scan())
+        with self.lock:
+            self.entries[key] = found
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+            self.changed = True
+        return list(found)
+
+    def save(self):
+        '''
+        Write the memo to its path if it has changed, replacing the old copy
+        in one rename.
+        '''
+        with self.lock:
+            if not self.changed:
+                return None
+            temp = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(temp, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(temp, self.path)
+            self.changed = False
+        return None
+
+
+def get_scan_cache(path = '.gslab_scan_cache.json', max_entries = MAX_ENTRIES):
+    '''
+    Return the ScanCache stored at path, saved when the build exits.
+    '''
+    path = os.path.abspath(path)
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = ScanCache(path, max_entries)
+            atexit.register(_caches[path].save)
+        return _caches[path]
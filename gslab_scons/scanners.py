@@ -0,0 +1,160 @@
+'''
+Implicit-dependency scanners for Stata, R and Python scripts.
+
+Calling
+    gs.add_scanners(env)
+in an SConstruct makes SCons read each .do, .R and .py source for the files
+it loads, so that a step is rebuilt when a file its script reads changes,
+without listing every input by hand:
+    Stata   use, merge/append/joinby/cross/cf ... using, do, run, include
+            and file open ... using ..., read
+    R       read.csv and friends, readRDS, load, source, fread, read_dta
+    Python  open() for reading, pd.read_*, np.load and np.loadtxt
+Only literal paths are found; paths built from macros or variables are not.
+Paths are taken relative to the directory SCons runs from, which is where
+the GSLab builders run scripts, and a path is only added if the file exists
+or is built by the SConstruct. Do-files, R scripts and Python scripts that
+are found are scanned in turn.
+
+The paths found in a file are memoised across builds by its path, size and
+modification time (see scan_cache), so an unchanged script is neither read
+nor scanned again. The memo keeps the most recently used results only.
+'''
+import os
+import re
+
+from . import scan_cache
+
+# Version of the rules below, part of each memo key so that results found by
+# older rules are not reused.
+SCAN_VERSION = 2
+
+_quoted = r'''["']([^"'\n]+)["']'''
+_stata_path = r'(?:"([^"\n]+)"|([^",\s]+))'
+_stata_prefix = r'^\s*(?:(?:qui(?:etly)?|cap(?:ture)?|noi(?:sily)?)\s*:?\s*)*'
+# Commands that load a file, and those that read the file after `using`.
+# Commands that write to a file after `using`, such as log, esttab, export
+# and outsheet, are left out so that a step's outputs are not its inputs.
+_stata_patterns = [
+    re.compile(_stata_prefix + r'(use|do|run|include)\s+(?!.*\busing\b)' + _stata_path),
+    re.compile(_stata_prefix + r'(use|merge|append|joinby|cross|cf)\b.*?\busing\s+' +
+               _stata_path),
+]
+_stata_file_open = re.compile(_stata_prefix + r'file\s+open\s+\w+\s+using\s+' +
+                              _stata_path + r'(.*)')
+_r_patterns = [
+    re.compile(r'\b(?:read\.csv2?|read\.table|read\.delim|read\.dta|read_csv|read_dta|'
+               r'read_rds|readRDS|load|source|fread)\s*\(\s*(?:file\s*=\s*)?' + _quoted),
+]
+_python_patterns = [
+    re.compile(r'\b(?:pd|pandas)\.read_\w+\s*\(\s*[rRbBuU]*' + _quoted),
+    re.compile(r'\b(?:np|numpy)\.(?:load|loadtxt|genfromtxt)\s*\(\s*[rRbBuU]*' + _quoted),
+]
+_python_open = re.compile(r'''\bopen\s*\(\s*[rRbBuU]*["']([^"'\n]+)["']'''
+                          r'''(?:\s*,\s*(?:mode\s*=\s*)?["']([^"']*)["'])?''')
+
+# Stata adds a default extension to paths given without one.
+_stata_extensions = {'use': '.dta', 'do': '.do', 'run': '.do', 'include': '.do'}
+
+
+def strip_comments(text, markers):
+    '''
+    Return text without the lines that start with one of markers.
+    '''
+    return '\n'.join(line for line in text.splitlines()
+                     if not line.lstrip().startswith(markers))
+
+
+def is_literal(path):
+    '''
+    Return whether path is a plain path rather than one built from macros,
+    variables or format strings.
+    '''
+    return not re.search(r'[`$%{}()]', path)
+
+
+def find_stata(text):
+    '''
+    Return the paths of the files a Stata script loads.
+    '''
+    found = []
+    for line in strip_comments(text, ('*', '//')).splitlines():
+        for pattern in _stata_patterns:
+            for command, quoted, bare in pattern.findall(line):
+                path = quoted or bare
+                if not os.path.splitext(path)[1]:
+                    extension = '.dta' if pattern is _stata_patterns[1] else \
+                                _stata_extensions.get(command, '')
+                    path += extension
+                found.append(path)
+        # file open reads its file only when opened for reading alone.
+        for quoted, bare, options in _stata_file_open.findall(line):
+            if re.search(r',.*\bread\b', options) and \
+               not re.search(r'\b(?:write|append|replace)\b', options):
+                found.append(quoted or bare)
+    return [path for path in found if is_literal(path)]
+
+
+def find_r(text):
+    '''
+    Return the paths of the files an R script loads.
+    '''
+    text = strip_comments(text, ('#', ))
+    return [path for pattern in _r_patterns for path in pattern.findall(text)
+            if is_literal(path)]
+
+
+def find_python(text):
+    '''
+    Return the paths of the files a Python script reads.
+    '''
+    text = strip_comments(text, ('#', ))
+    found = [path for path, mode in _python_open.findall(text)
+             if not re.search('[wax+]', mode)]
+    found += [path for pattern in _python_patterns for path in pattern.findall(text)]
+    return [path for path in found if is_literal(path)]
+
+
+def make_scan(name, find):
+    '''
+    Return an SCons scanner function that applies find to a node's contents,
+    memoised by the node's scan_cache.content_key, and keeps the files that
+    exist or are built.
+    '''
+    def scan(node, env, path):
+        key = '%s:%d:%s' % (name, SCAN_VERSION, scan_cache.content_key(node))
+        paths = scan_cache.get_scan_cache().scan(key, lambda: find(scan_cache.node_text(node)))
+        top = env.Dir('#')
+        dependencies = []
+        for found in paths:
+            dependency = env.File(found) if os.path.isabs(found) else top.File(found)
+            if dependency.exists() or dependency.has_builder():
+                dependencies.append(dependency)
+        return dependencies
+
+    return scan
+
+
+scan_stata  = make_scan('stata',  find_stata)
+scan_r      = make_scan('r',      find_r)
+scan_python = make_scan('python', find_python)
+
+
+def add_scanners(env):
+    '''
+    Add the Stata, R and Python scanners to env.
+    '''
+    from SCons.Script import Scanner
+
+    def scripts(extensions):
+        return lambda nodes: [n for n in nodes if str(n).lower().endswith(extensions)]
+
+    env.Append(SCANNERS = [
+        Scanner(function = scan_stata,  skeys = ['.do', '.ado'],
+                recursive = scripts(('.do', '.ado')), name = 'GSLabStata'),
+        Scanner(function = scan_r,      skeys = ['.R', '.r'],
+                recursive = scripts(('.r', )), name = 'GSLabR'),
+        Scanner(function = scan_python, skeys = ['.py'],
+                recursive = scripts(('.py', )), name = 'GSLabPython'),
+    ])
+    return None
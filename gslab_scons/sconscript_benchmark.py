@@ -0,0 +1,85 @@
+'''
+Benchmark of the time SCons takes to read SConscripts with many
+build_anything steps.
+
+build_anything used to copy the environment with env.Clone() and make a new
+SCons builder for every step, and SCons signs a builder's action by
+serialising it, which for thousands of generated targets made reading the
+SConscripts take minutes. Steps now lay their keyword arguments over env and
+share one SCons builder. Compare the two with
+    python -m gslab_scons.sconscript_benchmark [targets]
+which writes an SConstruct with that many steps (default 50,000) to a
+temporary directory and times `scons -h`, which reads it without building.
+'''
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sconstruct = '''
+import sys
+sys.path.insert(0, %r)
+import gslab_scons as gs
+from gslab_scons.builders.build_anything import AnythingBuilder
+
+def previous_build_anything(target, source, action, env, **kw):
+    local_env = env.Clone()
+    for k, v in kw.items():
+        local_env[k] = v
+    builder = AnythingBuilder([target], [source], action, local_env, False,
+                              name = 'Anything Builder')
+    bld = Builder(action = builder.build_anything, target_factory = local_env.fs.Entry,
+                  source_factory = local_env.fs.Entry)
+    return bld(local_env, target, source)
+
+build_anything = previous_build_anything if ARGUMENTS.get('previous') == '1' \\
+                 else gs.build_anything
+env = Environment()
+for i in range(%d):
+    build_anything('out/%%d.txt' %% i, 'input.txt', 'cp input.txt out/%%d.txt' %% i,
+                   env = env, warning = False, CL_ARG = i)
+'''
+
+
+def benchmark(targets):
+    '''
+    Return a text report of the time SCons takes to read an SConstruct with
+    `targets` build_anything steps, as build_anything now makes them and as
+    it made them with a Clone and a builder per step.
+    '''
+    directory = tempfile.mkdtemp(prefix = 'gslab_sconscript_')
+    package   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        with open(os.path.join(directory, 'SConstruct'), 'w') as f:
+            f.write(sconstruct % (package, targets))
+        open(os.path.join(directory, 'input.txt'), 'w').close()
+        lines = ['%d build_anything steps, time to read the SConstruct' % targets]
+        times = []
+        for label, previous in [('Clone and builder per step', '1'),
+                                ('override, shared builder', '0')]:
+            started = time.time()
+            subprocess.check_call(['scons', '-Q', '-h', 'previous=%s' % previous],
+                                  cwd = directory, stdout = subprocess.DEVNULL)
+            times.append(time.time() - started)
+            lines.append('%-28s %10.2f s' % (label, times[-1]))
+        if times[1]:
+            lines.append('Speedup: %.1fx' % (times[0] / times[1]))
+    finally:
+        shutil.rmtree(directory)
+    return '\n'.join(lines)
+
+
+def main(argv = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description = 'Benchmark reading build_anything steps')
+    parser.add_argument('targets', type = int, nargs = '?', default = 50000,
+                        help = 'number of build_anything steps')
+    args = parser.parse_args(argv)
+    print(benchmark(args.targets))
+    return None
+
+
+if __name__ == '__main__':
+    main()
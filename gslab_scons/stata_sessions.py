@@ -0,0 +1,199 @@
+'''
+Fused Stata sessions for the GSLab Stata builder.
+
+Each Stata step normally pays for starting Stata and checking out a licence.
+With env['stata_batch'] set to a number of seconds (True means one second),
+Stata steps that start within that window of each other under `scons -j N`
+are queued and run one after another in a single Stata session. The first
+step in a batch waits out the window, writes a driver do-file that runs
+each script from the build directory with
+    capture noisily do "<script>" <arguments>
+and runs Stata once. The session log is split back into one Stata log per
+step, so each target's sconscript.log holds only its own script's output,
+and each step fails or succeeds with its own script's return code.
+env['stata_batch_size'] (default 20) caps the number of scripts in a session.
+The resources declared in env['resources'] (see resource_pool) are held by
+the session, once, as its first step declares them, rather than by each step,
+so a limit of one Stata licence still lets the steps share a session.
+
+Data, programs and macros are cleared between scripts, but settings made
+with `set` persist through the session, so only batch scripts that do not
+depend on Stata's defaults.
+'''
+import os
+import re
+import threading
+import subprocess
+
+import gslab_scons.build_metrics as build_metrics
+import gslab_scons.resource_pool as resource_pool
+from gslab_scons._exception_classes import ExecCallError
+
+_marker = re.compile(r'^@@gslab_batch (?P<index>\d+) (?P<event>begin|end)(?: (?P<rc>-?\d+))?\s*$')
+
+_condition = threading.Condition()
+_open      = {}
+
+
+def get_options(env):
+    '''
+    Return (window in seconds, batch size) configured by env, or None if
+    batching is off.
+    '''
+    try:
+        window = env['stata_batch']
+    except (KeyError, TypeError):
+        window = None
+    if window is None or window is False:
+        return None
+    window = 1.0 if window is True else float(window)
+    try:
+        size = int(env['stata_batch_size'])
+    except KeyError:
+        size = 20
+    return window, size
+
+
+def submit(builder, stdout, window, size):
+    '''
+    Run the step described by builder, a StataBuilder whose scratch directory
+    is open, in a shared Stata session and return the script's return code.
+    The first step of each session reserves the session's resources, waits
+    for other steps to join and runs it, writing Stata's output to stdout.
+    If the first step fails before the session has run, it raises its error
+    and the other steps raise an ExecCallError naming it.
+    '''
+    key = (builder.executable, builder.exec_opts)
+    with _condition:
+        session = _open.get(key)
+        leader = session is None
+        if leader:
+            session = _open[key] = Session(builder.executable, builder.exec_opts)
+        job = session.add(builder)
+        if len(session.jobs) >= size:
+            del _open[key]
+            _condition.notify_all()
+    if not leader:
+        session.done.wait()
+        if session.error is not None:
+            raise ExecCallError('The Stata session for %s failed before it ran: %s'
+                                % (builder.source_file, session.error))
+        return job['status']
+    try:
+        with resource_pool.reserve(builder.env):
+            with _condition:
+                _condition.wait_for(lambda: _open.get(key) is not session, timeout = window)
+                if _open.get(key) is session:
+                    del _open[key]
+            session.run(builder, stdout)
+    except BaseException as error:
+        session.error = error
+        raise
+    finally:
+        with _condition:
+            if _open.get(key) is session:
+                del _open[key]
+        session.finish()
+    return job['status']
+
+
+class Session(object):
+    '''
+    The Stata steps run together in one session.
+    '''
+    driver_name = 'gslab_session.do'
+
+    def __init__(self, executable, exec_opts):
+        self.executable = executable
+        self.exec_opts  = exec_opts
+        self.jobs       = []
+        self.done       = threading.Event()
+        self.error      = None
+
+    def add(self, builder):
+        job = {'script': os.path.abspath(builder.source_file),
+               'args':   builder.cl_arg,
+               'cwd':    os.getcwd(),
+               'log':    builder.log_file,
+               'status': None}
+        self.jobs.append(job)
+        return job
+
+    def write_driver(self, path):
+        with open(path, 'w') as driver:
+            driver.write('* Stata session generated by gslab_scons for %d scripts\n'
+                         % len(self.jobs))
+            for index, job in enumerate(self.jobs):
+                driver.write('display "@@gslab" "_batch %d begin"\n' % index)
+                driver.write('cd "%s"\n' % job['cwd'])
+                driver.write('capture noisily do "%s" %s\n' % (job['script'], job['args']))
+                driver.write('display "@@gslab" "_batch %d end " _rc\n' % index)
+                driver.write('capture log close _all\n')
+                driver.write('clear all\n')
+                driver.write('macro drop _all\n')
+        return None
+
+    def run(self, leader, stdout):
+        '''
+        Run the session from the leader's scratch directory, then split its
+        log into each job's Stata log and record each job's return code.
+        Resource use is attributed to the leader.
+        '''
+        directory = leader.scratch_dir
+        driver    = os.path.join(directory, self.driver_name)
+        log       = os.path.splitext(driver)[0] + '.log'
+        try:
+            self.write_driver(driver)
+            command = '%s %s %s' % (self.executable, self.exec_opts, self.driver_name)
+            print('Running %d Stata scripts in one session: %s' % (len(self.jobs), command))
+            if build_metrics.get_database(leader.env) is not None:
+                status, leader.usage = build_metrics.call_with_usage(command, stdout, directory)
+            else:
+                status = subprocess.call(command, shell = True, cwd = directory,
+                                         stdout = stdout, stderr = subprocess.STDOUT)
+            self.split_log(log, status)
+        finally:
+            for path in [driver, log]:
+                if os.path.isfile(path):
+                    os.remove(path)
+        return None
+
+    def finish(self):
+        '''
+        Fail the jobs that have no return code and release the waiting steps.
+        '''
+        for job in self.jobs:
+            if job['status'] is None:
+                job['status'] = 1
+        self.done.set()
+        return None
+
+    def split_log(self, log, status):
+        '''
+        Write the lines of the session log between each job's markers to the
+        job's Stata log. A job whose end marker is missing gets the rest of the
+        log and fails with the session's exit status.
+        '''
+        parts   = dict((index, []) for index in range(len(self.jobs)))
+        current = None
+        lines   = []
+        if os.path.isfile(log):
+            with open(log, 'r', errors = 'replace') as f:
+                lines = f.readlines()
+        for line in lines:
+            match = _marker.match(line)
+            if match:
+                index = int(match.group('index'))
+                if match.group('event') == 'begin':
+                    current = index
+                else:
+                    self.jobs[index]['status'] = int(match.group('rc'))
+                    current = None
+            elif current is not None and '"@@gslab" "_batch' not in line:
+                parts[current].append(line)
+        for index, job in enumerate(self.jobs):
+            if job['status'] is None:
+                job['status'] = status or 1
+            with open(job['log'], 'w') as f:
+                f.writelines(parts[index])
+        return None
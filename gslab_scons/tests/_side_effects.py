@@ -8,14 +8,14 @@ import gslab_scons.tests._test_helpers as helpers
 
 def make_r_side_effect(recognized = True):
     '''
-    Make a mock of mocks subprocess.check_output() for R CMD BATCH commands
+    Make a mock of mocks subprocess.check_call() for R CMD BATCH commands
 
     The executable_recognized argument determines whether "R"
     is a recognized executable on the mock platform.   
     '''
     def side_effect(*args, **kwargs):
         '''
-        This side effect mocks the behaviour of a subprocess.check_output()
+        This side effect mocks the behaviour of a subprocess.check_call()
         call on a machine with R set up for command-line use.
         '''
         # Get and parse the command passed to os.system()
@@ -36,7 +36,7 @@ def make_r_side_effect(recognized = True):
             log    = '%s.log' % re.sub('\.R', '', source)
     
         if executable == 'Rscript' and log and append == '2>&1':
-            with open(log.replace('>', '').strip(), 'w') as log_file:
+            with open(log.replace('>', '').strip(), 'a') as log_file:
                 log_file.write('Test log\n')
             with open('./test_output.txt', 'w') as target:
                 target.write('Test target')
@@ -45,13 +45,13 @@ def make_r_side_effect(recognized = True):
 
 
 def python_side_effect(*args, **kwargs):
-    '''    Mock subprocess.check_output for testing build_python()'''
+    '''    Mock subprocess.check_call for testing build_python()'''
     command = args[0]
     match   = helpers.command_match(command, 'python')
 
     if match.group('log'):
         log_path = re.sub(r'(\s|>)', '', match.group('log'))
-        with open(log_path, 'w') as log_file:
+        with open(log_path, 'a') as log_file:
             log_file.write('Test log')
         with open('./test_output.txt', 'w') as target:
             target.write('Test target')
@@ -59,7 +59,7 @@ def python_side_effect(*args, **kwargs):
 
 def make_matlab_side_effect(recognized = True):
     '''
-    Make a mock of subprocess.check_output() for Matlab commands
+    Make a mock of subprocess.check_call() for Matlab commands
 
     The recognized argument determines whether "matlab"
     is a recognized executable on the mock platform.
@@ -77,7 +77,7 @@ def make_matlab_side_effect(recognized = True):
     
         if log_match:
             log_path = log_match.group('log')
-            with open(log_path, 'w') as log_file:
+            with open(log_path, 'a') as log_file:
                 log_file.write('Test log')
             with open('./test_output.txt', 'w') as target:
                 target.write('Test target')
@@ -95,7 +95,7 @@ def matlab_copy_effect(*args, **kwargs):
 def make_stata_side_effect(recognized = True):
     '''
     Make a side effect mocking the behaviour of 
-    subprocess.check_output() when `recognized` is
+    subprocess.check_call() when `recognized` is
     the only recognised system command. 
     '''
     def stata_side_effect(*args, **kwargs):
@@ -106,6 +106,7 @@ def make_stata_side_effect(recognized = True):
             # Find the Stata script's name
             script_name = match.group('source')
             stata_log   = os.path.basename(script_name).replace('.do', '.log')
+            stata_log   = os.path.join(kwargs.get('cwd') or '.', stata_log)
             
             # Write a log
             with open(stata_log, 'w') as logfile:
@@ -130,7 +131,7 @@ def make_stata_path_effect(executable):
 
 def lyx_side_effect(*args, **kwargs):
     '''
-    This side effect mocks the behaviour of a subprocess.check_output call.
+    This side effect mocks the behaviour of a subprocess.check_call call.
     The mocked machine has lyx set up as a command-line executable
     and can export .lyx files to .pdf files only using 
     the "-e pdf2" option.
@@ -151,8 +152,8 @@ def lyx_side_effect(*args, **kwargs):
 
     # As long as output is redirected, create a log
     if log_redirect:
-        log_path = re.sub(r'>\s*', '', log_redirect)
-        with open(log_path, 'w') as log_file:
+        log_path = re.sub(r'>+\s*', '', log_redirect)
+        with open(log_path, 'a') as log_file:
             log_file.write('Test log\n')
 
     # If LyX is the executable, the options are correctly specified,
@@ -174,7 +175,7 @@ def lyx_side_effect(*args, **kwargs):
 
 def latex_side_effect(*args, **kwargs):
     '''
-    This side effect mocks the behaviour of a subprocess.check_output call.
+    This side effect mocks the behaviour of a subprocess.check_call call.
     The mocked machine has pdflatex set up as a command-line executable
     and can export .tex files to .pdf files only using the "-jobname" option.
     '''
@@ -197,8 +198,8 @@ def latex_side_effect(*args, **kwargs):
 
     # As long as output is redirected, create a log
     if log_redirect:
-        log_path = re.sub(r'>\s*', '', log_redirect)
-        with open(log_path, 'w') as log_file:
+        log_path = re.sub(r'>+\s*', '', log_redirect)
+        with open(log_path, 'a') as log_file:
             log_file.write('Test log\n')
 
     # If pdflatex is the executable, the options are correctly specified,
@@ -44,7 +44,7 @@ def command_match(command, executable, which = None):
                          '\s*'
                          '(?P<args>(\s?[\.\/\w]+)*)?'
                          '\s*'
-                         '(?P<log>>\s*[\.\/\w]+)?',
+                         '(?P<log>>>?\s*[\.\/\w]+)?',
                          command)
 
     elif executable in ['r', 'R']:
@@ -62,7 +62,7 @@ def command_match(command, executable, which = None):
                          '\s*'
                          '(?P<args>(\s?[\.\/\w]+)*)?'
                          '\s*'
-                         '(?P<log>> [\.\/\w]+(\.\w+)?)?'
+                         '(?P<log>>>? [\.\/\w]+(\.\w+)?)?'
                          '\s*'
                          '(?P<append>2\>\&1)',
                          command)
@@ -90,7 +90,7 @@ def command_match(command, executable, which = None):
                          '\s*'
                          '(?P<source>[\.\/\w]+\.\w+)?'
                          '\s*'
-                         '(?P<log_redirect>\> [\.\/\w]+\.\w+)?',
+                         '(?P<log_redirect>\>\>? [\.\/\w]+\.\w+)?',
                          command)
 
     elif executable == 'pdflatex':
@@ -104,7 +104,7 @@ def command_match(command, executable, which = None):
                          '\s*'
                          '(?P<source>[\.\/\w]+\.\w+)?'
                          '\s*'
-                         '(?P<log_redirect>\> [\.\/\w]+\.\w+)?',
+                         '(?P<log_redirect>\>\>? [\.\/\w]+\.\w+)?',
                          command)
 
     if which:
@@ -120,10 +120,13 @@ def check_log(test_object, log_path, timestamp = True):
 
     if timestamp:
         test_object.assertIn('*** Builder log created:', log_data)
+        test_object.assertIn('*** Builder log completed:', log_data)
     else:
         test_object.assertNotIn('Log created:', log_data)
 
     os.remove(log_path)
+    if os.path.isfile('%s.json' % log_path):
+        os.remove('%s.json' % log_path)
 
 
 def bad_extension(test_object, builder, 
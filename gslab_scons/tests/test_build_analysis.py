@@ -0,0 +1,123 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+
+# Ensure that Python can find and load the GSLab libraries
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../..')
+
+import gslab_scons.build_analysis as analysis
+import gslab_scons.build_metrics as build_metrics
+
+tree = '''+-.
+  +-SConstruct
+  +-build
+  | +-build/data.dta
+  | | +-source/clean.do
+  | | +-raw/input.csv
+  | +-build/model.rds
+  | | +-source/model.R
+  | | +-build/data.dta
+  | +-build/figure.pdf
+  | | +-source/figure.py
+  | | +-[build/data.dta]
+  | +-build/table.tex
+  |   +-source/table.py
+  +-paper
+    +-paper/paper.pdf
+      +-paper/paper.tex
+      +-build
+'''
+
+
+class TestBuildAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists('./analysis/'):
+            shutil.rmtree('./analysis/')
+        os.mkdir('./analysis/')
+        self.database = './analysis/metrics.db'
+        steps = [('Stata',  'build/data.dta',   0.0, 10.0),
+                 ('R',      'build/model.rds',  10.0, 30.0),
+                 ('Python', 'build/figure.pdf', 10.0, 5.0),
+                 ('Python', 'build/table.tex',  0.0, 5.0),
+                 ('LaTeX',  'paper/paper.pdf',  40.0, 2.0)]
+        for builder, target, started, seconds in steps:
+            build_metrics.record(self.database, build_id = 'build-1', builder = builder,
+                                 target = target, targets = [target],
+                                 started = 100 + started, wall_seconds = seconds, cached = 0)
+        self.steps = analysis.load_steps(self.database)
+        self.dependencies = analysis.step_dependencies(self.steps,
+                                                       analysis.parse_tree(tree.splitlines()))
+
+    def test_dependencies(self):
+        '''
+        Test that step dependencies follow the tree, including through the
+        `build` directory node that no step builds.
+        '''
+        self.assertEqual(self.dependencies['build/model.rds'], {'build/data.dta'})
+        self.assertEqual(self.dependencies['build/figure.pdf'], {'build/data.dta'})
+        self.assertEqual(self.dependencies['build/table.tex'], set())
+        self.assertEqual(self.dependencies['paper/paper.pdf'],
+                         {'build/data.dta', 'build/model.rds',
+                          'build/figure.pdf', 'build/table.tex'})
+
+    def test_critical_path(self):
+        length, path = analysis.critical_path(self.steps, self.dependencies)
+        self.assertEqual(length, 42.0)
+        self.assertEqual(path, ['build/data.dta', 'build/model.rds', 'paper/paper.pdf'])
+
+    def test_simulate(self):
+        '''
+        Test that one job runs the steps back to back and that enough jobs
+        reach the critical path.
+        '''
+        self.assertEqual(analysis.simulate(self.steps, self.dependencies, 1), 52.0)
+        self.assertEqual(analysis.simulate(self.steps, self.dependencies, 2), 42.0)
+        report = analysis.analyse(self.database, jobs = [1, 4])
+        self.assertIn('5 steps taking 52.0 s in total', report)
+
+    def test_long_chain(self):
+        '''
+        Test that chains of steps and of nodes no step builds far longer than
+        Python's recursion limit are analysed.
+        '''
+        length = 5 * sys.getrecursionlimit()
+        steps  = [{'name': 'out/%d' % index, 'builder': 'Python', 'targets': ['out/%d' % index],
+                   'started': None, 'seconds': 1.0} for index in range(length)]
+        graph  = {}
+        for index in range(1, length):
+            graph['out/%d' % index] = {'out/%d' % (index - 1)}
+        graph['out/0'] = {'alias/0'}
+        for index in range(length - 1):
+            graph['alias/%d' % index] = {'alias/%d' % (index + 1)}
+        graph['alias/%d' % (length - 1)] = {'raw/input.csv'}
+        dependencies = analysis.step_dependencies(steps, graph)
+        self.assertEqual(dependencies['out/%d' % (length - 1)], {'out/%d' % (length - 2)})
+        self.assertEqual(dependencies['out/0'], set())
+        total, path = analysis.critical_path(steps, dependencies)
+        self.assertEqual(total, float(length))
+        self.assertEqual(len(path), length)
+        self.assertEqual(analysis.simulate(steps, dependencies, 4), float(length))
+
+    def test_trace(self):
+        '''
+        Test that the Chrome trace places overlapping steps on separate rows.
+        '''
+        trace = analysis.chrome_trace(self.steps)
+        events = dict((event['name'], event) for event in trace['traceEvents'])
+        self.assertEqual(events['build/model.rds']['ts'], 10e6)
+        self.assertEqual(events['build/model.rds']['dur'], 30e6)
+        self.assertNotEqual(events['build/data.dta']['tid'], events['build/table.tex']['tid'])
+        self.assertNotEqual(events['build/model.rds']['tid'], events['build/figure.pdf']['tid'])
+        json.dumps(trace)
+
+    def tearDown(self):
+        if os.path.exists('./analysis/'):
+            shutil.rmtree('./analysis/')
+
+
+if __name__ == '__main__':
+    unittest.main()
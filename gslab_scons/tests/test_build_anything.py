@@ -0,0 +1,83 @@
+import unittest
+import sys
+import os
+import shutil
+import subprocess
+
+# Ensure that Python can find and load the GSLab libraries
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../..')
+
+sconstruct = '''
+import sys
+sys.path.insert(0, %r)
+import gslab_scons as gs
+env = Environment(CL_ARG = 'base')
+gs.build_anything('build/a.txt', 'input.txt', '%s -c "open(\\'build/a.txt\\', \\'w\\').write(\\'1\\')"',
+                  env = env, CL_ARG = 'a', log_ext = 'a')
+gs.build_anything('build/b.txt', 'input.txt', %r, env = env, log_ext = 'b')
+assert env['CL_ARG'] == 'base' and 'log_ext' not in env
+'''
+
+
+class TestBuildAnything(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists('./anything/'):
+            shutil.rmtree('./anything/')
+        os.mkdir('./anything/')
+        open('./anything/input.txt', 'w').close()
+
+    def scons(self, action_b):
+        with open('./anything/SConstruct', 'w') as f:
+            f.write(sconstruct % (os.path.abspath('../..'), sys.executable, action_b))
+        return subprocess.check_output(['scons', '-Q'], cwd = './anything/',
+                                       stderr = subprocess.STDOUT).decode()
+
+    @unittest.skipUnless(shutil.which('scons'), 'requires scons')
+    def test_override_and_rebuild(self):
+        '''
+        Test that steps override env without changing it, log separately,
+        and are rebuilt only when their action changes.
+        '''
+        action = '%s -c "open(\'build/b.txt\', \'w\').write(\'2\')"' % sys.executable
+        self.scons(action)
+        for name, content in [('a', '1'), ('b', '2')]:
+            with open('./anything/build/%s.txt' % name, 'r') as f:
+                self.assertEqual(f.read(), content)
+            self.assertTrue(os.path.isfile('./anything/build/sconscript_%s.log' % name))
+
+        self.assertIn('up to date', self.scons(action))
+        output = self.scons(action.replace("'2'", "'3'"))
+        self.assertEqual(output.count('build_anything_step('), 1)
+        with open('./anything/build/b.txt', 'r') as f:
+            self.assertEqual(f.read(), '3')
+
+    def test_build_time_values(self):
+        '''
+        Test that a step keeps the values of env that it reads when it runs
+        as they were when the step was declared.
+        '''
+        try:
+            import SCons.Environment
+        except ImportError:
+            self.skipTest('requires SCons')
+        from gslab_scons.builders.build_anything import build_anything
+        env = SCons.Environment.Environment(live_output = False, resources = {'cpu': 1})
+        first = build_anything('anything/c.txt', 'anything/input.txt', 'true', env = env)
+        env['live_output'] = True
+        env['resources']['cpu'] = 2
+        second = build_anything('anything/d.txt', 'anything/input.txt', 'true', env = env,
+                                resources = {'cpu': 3})
+        self.assertFalse(first[0].get_build_env()['live_output'])
+        self.assertEqual(first[0].get_build_env()['resources'], {'cpu': 1})
+        self.assertTrue(second[0].get_build_env()['live_output'])
+        self.assertEqual(second[0].get_build_env()['resources'], {'cpu': 3})
+
+    def tearDown(self):
+        if os.path.exists('./anything/'):
+            shutil.rmtree('./anything/')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+from unittest import mock
+
+# Import gslab_scons testing helper modules
+import gslab_scons.tests._side_effects as fx
+
+# Ensure that Python can find and load the GSLab libraries
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../..')
+
+import gslab_scons.build_cache as build_cache
+import gslab_scons.cache_server as cache_server
+import gslab_scons.builders.build_python as gs
+
+# Define path to the builder for use in patching
+path = 'gslab_scons.builders.build_python'
+
+
+class TestBuildCache(unittest.TestCase):
+
+    def setUp(self):
+        for directory in ['./build/', './cache/']:
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+        os.mkdir('./build/')
+        with open('./build/script.py', 'w') as f:
+            f.write('print("test")\n')
+        self.env = {'build_cache': './cache/'}
+
+    def key(self):
+        '''
+        Return the key of the single entry in the cache.
+        '''
+        return [key for prefix in os.listdir('./cache/') if len(prefix) == 2
+                for key in os.listdir(os.path.join('./cache/', prefix))][0]
+
+    def build(self, mock_check_call):
+        mock_check_call.side_effect = fx.python_side_effect
+        gs.build_python('./test_output.txt', ['./build/script.py'], self.env)
+
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_hit(self, mock_check_call):
+        '''
+        Test that an unchanged step is restored from the cache instead of run.
+        '''
+        stats = dict(build_cache.get_cache(self.env).stats)
+        self.build(mock_check_call)
+        self.assertEqual(mock_check_call.call_count, 1)
+        with open('./sconscript.log', 'r') as f:
+            log = f.read()
+        os.remove('./test_output.txt')
+        os.remove('./sconscript.log')
+
+        self.build(mock_check_call)
+        self.assertEqual(mock_check_call.call_count, 1)
+        with open('./test_output.txt', 'r') as f:
+            self.assertEqual(f.read(), 'Test target')
+        with open('./sconscript.log', 'r') as f:
+            self.assertEqual(f.read(), log)
+        with open('./sconscript.log.json', 'r') as f:
+            self.assertTrue(json.load(f)['cached'])
+
+        cache = build_cache.get_cache(self.env)
+        self.assertEqual(cache.stats['hits'] - stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'] - stats['misses'], 1)
+        with open('./cache/stats.json', 'r') as f:
+            self.assertEqual(json.load(f)['stores'], 1)
+
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_miss_on_change(self, mock_check_call):
+        '''
+        Test that changing the script or the command line arguments misses the cache.
+        '''
+        self.build(mock_check_call)
+        with open('./build/script.py', 'a') as f:
+            f.write('print("changed")\n')
+        self.build(mock_check_call)
+        self.assertEqual(mock_check_call.call_count, 2)
+
+        self.env['CL_ARG'] = 'test'
+        self.build(mock_check_call)
+        self.assertEqual(mock_check_call.call_count, 3)
+
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_entry_removed_during_restore(self, mock_check_call):
+        '''
+        Test that an entry losing a file between reading its manifest and 
+        placing its targets is a miss: the targets placed are removed and 
+        the step is built again.
+        '''
+        self.build(mock_check_call)
+        os.remove('./test_output.txt')
+        cache = build_cache.get_cache(self.env)
+        misses = cache.stats['misses']
+        read_manifest = cache.read_manifest
+
+        def evict_log(key):
+            manifest = read_manifest(key)
+            if manifest is not None:
+                os.remove(os.path.join(cache.entry_path(key), 'log'))
+            return manifest
+
+        with mock.patch.object(cache, 'read_manifest', side_effect = evict_log):
+            self.assertFalse(cache.restore(self.key(), ['./test_output.txt'], './sconscript.log'))
+        self.assertFalse(os.path.exists('./test_output.txt'))
+        self.assertEqual(cache.stats['misses'] - misses, 1)
+
+        self.build(mock_check_call)
+        self.assertEqual(mock_check_call.call_count, 2)
+        with open('./test_output.txt', 'r') as f:
+            self.assertEqual(f.read(), 'Test target')
+
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_eviction(self, mock_check_call):
+        '''
+        Test that least recently used entries are evicted past the size limit.
+        '''
+        self.env['build_cache_max_mb'] = 0
+        evictions = build_cache.get_cache(self.env).stats['evictions']
+        self.build(mock_check_call)
+        self.build(mock_check_call)
+        self.assertEqual(mock_check_call.call_count, 2)
+        self.assertEqual(build_cache.get_cache(self.env).stats['evictions'] - evictions, 2)
+
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_remote(self, mock_check_call):
+        '''
+        Test that an entry built against one local cache is fetched from the
+        shared server into another, and that corrupt or unreachable remotes
+        fall back to building locally.
+        '''
+        server = cache_server.start_server('./server/')
+        try:
+            url = 'http://127.0.0.1:%d' % server.server_port
+            self.env['build_cache_url'] = url
+            self.build(mock_check_call)
+            self.assertEqual(mock_check_call.call_count, 1)
+            self.assertEqual(len(os.listdir('./server/ac/')), 1)
+
+            self.env['build_cache'] = './cache_b/'
+            self.build(mock_check_call)
+            self.assertEqual(mock_check_call.call_count, 1)
+            with open('./test_output.txt', 'r') as f:
+                self.assertEqual(f.read(), 'Test target')
+
+            for name in os.listdir('./server/cas/'):
+                with open(os.path.join('./server/cas/', name), 'a') as f:
+                    f.write('corrupt')
+            self.env['build_cache'] = './cache_c/'
+            self.build(mock_check_call)
+            self.assertEqual(mock_check_call.call_count, 2)
+            self.assertEqual(build_cache.get_cache(self.env).stats['remote_errors'], 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.env['build_cache'] = './cache_d/'
+        self.build(mock_check_call)
+        self.assertEqual(mock_check_call.call_count, 3)
+
+    def test_hostile_manifest(self):
+        '''
+        Test that a remote manifest naming files outside the entry is rejected
+        and treated as a miss without downloading anything.
+        '''
+        remote = mock.MagicMock(url = 'http://cache')
+        remote.get_manifest.return_value = {
+            'targets': ['./test_output.txt'], 'size': 0,
+            'digests': {'target_0': '0' * 64, 'log': '1' * 64,
+                        '../../escaped': '2' * 64, os.path.abspath('./escaped'): '3' * 64}}
+        cache = build_cache.BuildCache('./cache/', remote = remote)
+        with mock.patch('sys.stdout'):
+            hit = cache.restore('0' * 64, ['./test_output.txt'], './sconscript.log')
+        self.assertFalse(hit)
+        remote.get_file.assert_not_called()
+        self.assertEqual(cache.stats['remote_errors'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+
+    def test_server_rejects_bad_digest(self):
+        '''
+        Test that the server refuses content that does not hash to its address.
+        '''
+        server = cache_server.start_server('./server/')
+        try:
+            remote = build_cache.RemoteCache('http://127.0.0.1:%d' % server.server_port)
+            digest = build_cache.hash_file('./build/script.py').hexdigest()
+            remote.put_file(digest, './build/script.py')
+            self.assertTrue(remote.has_file(digest))
+            with self.assertRaises(IOError):
+                remote.put_file('0' * 64, './build/script.py')
+            self.assertFalse(remote.has_file('0' * 64))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def tearDown(self):
+        for directory in ['./build/', './cache/', './cache_b/', './cache_c/', 
+                          './cache_d/', './server/']:
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+        for path in ['./test_output.txt', './sconscript.log', './sconscript.log.json']:
+            if os.path.isfile(path):
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ import unittest
 import sys
 import os
 import shutil
+import re
 from unittest import mock
 # Import gslab_scons testing helper modules
 import gslab_scons.tests._test_helpers as helpers
@@ -25,7 +26,7 @@ class TestBuildLateX(unittest.TestCase):
         if not os.path.exists('./build/'):
             os.mkdir('./build/')
 
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_default(self, mock_system):
         '''
         Test that build_latex() behaves correctly when provided with
@@ -38,7 +39,7 @@ class TestBuildLateX(unittest.TestCase):
                               target = target)
         self.assertTrue(os.path.isfile(target))
 
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_list_arguments(self, mock_system):
         '''
         Check that build_latex() works when its source and target 
@@ -98,6 +99,40 @@ class TestBuildLateX(unittest.TestCase):
             gs.build_latex('./nonexistent_directory/latex.pdf', 
                           ['./input/latex_test_file.tex'], env = True)
 
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_persistent_build_dir(self, mock_system):
+        '''
+        Test that latexmk builds in a kept per-target directory and that a
+        preamble format is dumped once per distinct preamble.
+        '''
+        def side_effect(command, **kwargs):
+            if command.startswith('pdftex'):
+                directory = re.search(r'-output-directory=(\S+)', command).group(1)
+                jobname   = re.search(r'-jobname=(\S+)', command).group(1)
+                open(os.path.join(directory, jobname + '.fmt'), 'w').close()
+            else:
+                outdir  = re.search(r'-outdir=(\S+)', command).group(1)
+                jobname = re.search(r'-jobname=(\S+)', command).group(1)
+                self.assertIn('-auxdir=%s' % outdir, command)
+                open(os.path.join(outdir, jobname + '.pdf'), 'w').close()
+                open(os.path.join(outdir, jobname + '.aux'), 'w').close()
+        mock_system.side_effect = side_effect
+
+        env = {'latex_build_dir': './build/latex', 'latex_preamble_format': True}
+        for name, preamble in [('a', 'tikz'), ('b', 'tikz'), ('c', 'pgfplots')]:
+            with open('./build/%s.tex' % name, 'w') as f:
+                f.write('\\documentclass{article}\n\\usepackage{%s}\n'
+                        '\\begin{document}\n%s\n\\end{document}\n' % (preamble, name))
+            gs.build_latex('./build/%s.pdf' % name, './build/%s.tex' % name, env)
+            self.assertTrue(os.path.isfile('./build/%s.pdf' % name))
+            self.assertTrue(os.path.isfile('./build/latex/build/%s/%s.aux' % (name, name)))
+
+        commands = [c[0][0] for c in mock_system.call_args_list]
+        self.assertEqual(len([c for c in commands if c.startswith('pdftex')]), 2)
+        self.assertEqual(len(os.listdir('./build/latex/.formats')), 2)
+        latexmk = [c for c in commands if c.startswith('latexmk')]
+        self.assertEqual(len(set(re.search(r'-fmt=(\S+)', c).group(1) for c in latexmk)), 2)
+
     def tearDown(self):
         if os.path.exists('./build/'):
             shutil.rmtree('./build/')
@@ -26,7 +26,7 @@ class TestBuildLyX(unittest.TestCase):
         if not os.path.exists('./build/'):
             os.mkdir('./build/')
 
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_default(self, mock_system):
         '''
         Test that build_lyx() behaves correctly when provided with
@@ -39,7 +39,7 @@ class TestBuildLyX(unittest.TestCase):
                               target = target)
         self.assertTrue(os.path.isfile(target))
 
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_list_arguments(self, mock_system):
         '''
         Check that build_lyx() works when its source and target 
@@ -0,0 +1,91 @@
+import unittest
+import sys
+import os
+import shutil
+import sqlite3
+from unittest import mock
+
+# Ensure that Python can find and load the GSLab libraries
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../..')
+
+import gslab_scons.build_metrics as build_metrics
+import gslab_scons.builders.build_python as gs
+from gslab_scons._exception_classes import ExecCallError
+
+
+class TestBuildMetrics(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists('./build/'):
+            shutil.rmtree('./build/')
+        os.mkdir('./build/')
+        self.env = {'executable_names': {'python': sys.executable},
+                    'build_metrics': './build/metrics.db'}
+
+    def write_script(self, name, body):
+        with open('./build/%s' % name, 'w') as f:
+            f.write(body)
+
+    def steps(self):
+        connection = sqlite3.connect('./build/metrics.db')
+        connection.row_factory = sqlite3.Row
+        rows = connection.execute('SELECT * FROM steps ORDER BY rowid').fetchall()
+        connection.close()
+        return rows
+
+    def test_record(self):
+        '''
+        Test that successful and failing steps are recorded with their
+        resource use, exit status and target sizes.
+        '''
+        self.write_script('work.py',
+                          "import sys\n"
+                          "data = bytearray(50 * 1024 * 1024)\n"
+                          "total = sum(range(10 ** 6))\n"
+                          "open(sys.argv[1], 'w').write('x' * 100)\n")
+        self.env['CL_ARG'] = './build/out.txt'
+        gs.build_python('./build/out.txt', './build/work.py', self.env)
+
+        self.write_script('fail.py', "import sys\nsys.exit(3)\n")
+        with self.assertRaises(ExecCallError):
+            gs.build_python('./build/fail.txt', './build/fail.py', self.env)
+
+        work, fail = self.steps()
+        self.assertEqual(work['builder'], 'Python')
+        self.assertEqual(work['exit_status'], 0)
+        self.assertEqual(work['target_bytes'], 100)
+        self.assertEqual(work['cached'], 0)
+        self.assertGreater(work['wall_seconds'], 0)
+        self.assertGreater(work['user_seconds'], 0)
+        self.assertGreater(work['peak_rss_kb'], 50 * 1024)
+        self.assertEqual(fail['exit_status'], 3)
+        self.assertEqual(fail['target_bytes'], 0)
+        self.assertEqual(work['build_id'], fail['build_id'])
+
+        report = build_metrics.report('./build/metrics.db')
+        self.assertIn('Slowest steps over 1 builds', report)
+        self.assertIn('Python: build/work.py', report.split('Hungriest')[1])
+
+    def test_record_failure(self):
+        '''
+        Test that a failure to record metrics is a warning and does not 
+        replace the step's own error.
+        '''
+        self.write_script('fail.py', "import sys\nsys.exit(3)\n")
+        error = sqlite3.OperationalError('database is locked')
+        with mock.patch('gslab_scons.build_metrics.record', side_effect = error):
+            with mock.patch('sys.stdout') as mock_stdout:
+                with self.assertRaises(ExecCallError):
+                    gs.build_python('./build/fail.txt', './build/fail.py', self.env)
+        printed = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+        self.assertIn('could not record build metrics', printed)
+        self.assertIn('database is locked', printed)
+
+    def tearDown(self):
+        if os.path.exists('./build/'):
+            shutil.rmtree('./build/')
+
+
+if __name__ == '__main__':
+    unittest.main()
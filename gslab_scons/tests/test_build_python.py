@@ -2,6 +2,7 @@ import unittest
 import sys
 import os
 import shutil
+import io
 from unittest import mock
 import subprocess
 import re
@@ -13,6 +14,8 @@ sys.path.append('../..')
 import gslab_scons.builders.build_python as gs
 from gslab_scons._exception_classes import BadExtensionError, ExecCallError
 from gslab_make.tests import nostderrout
+import gslab_scons.python_workers as python_workers
+import gslab_scons.builders.gslab_builder as gslab_builder
 
 # Define path to the builder for use in patching
 path = 'gslab_scons.builders.build_python'
@@ -23,29 +26,29 @@ class TestBuildPython(unittest.TestCase):
         if not os.path.exists('./build/'):
             os.mkdir('./build/')
 
-    @mock.patch('%s.subprocess.check_output' % path)
-    def test_log_creation(self, mock_check_output):
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_log_creation(self, mock_check_call):
         '''Test build_python()'s behaviour when given standard inputs.'''
-        mock_check_output.side_effect = fx.python_side_effect
+        mock_check_call.side_effect = fx.python_side_effect
         helpers.standard_test(self, gs.build_python, 'py', 
-                              system_mock = mock_check_output)
+                              system_mock = mock_check_call)
 
     def test_bad_extension(self):
         '''Test that build_python() recognises an improper file extension'''
         helpers.bad_extension(self, gs.build_python, good = 'test.py')
    
-    @mock.patch('%s.subprocess.check_output' % path)
-    def test_cl_arg(self, mock_check_output):
-        mock_check_output.side_effect = fx.python_side_effect
-        helpers.test_cl_args(self, gs.build_python, mock_check_output, 'py')
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_cl_arg(self, mock_check_call):
+        mock_check_call.side_effect = fx.python_side_effect
+        helpers.test_cl_args(self, gs.build_python, mock_check_call, 'py')
 
-    @mock.patch('%s.subprocess.check_output' % path)
-    def test_unintended_inputs(self, mock_check_output):
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_unintended_inputs(self, mock_check_call):
         '''
         Test that build_python() handles unintended inputs 
         as expected. 
         '''
-        mock_check_output.side_effect = fx.python_side_effect
+        mock_check_call.side_effect = fx.python_side_effect
 
         check = lambda **kwargs: helpers.input_check(self, gs.build_python, 
                                                      'py', **kwargs)
@@ -69,6 +72,89 @@ class TestBuildPython(unittest.TestCase):
         with self.assertRaises(ExecCallError):
             helpers.standard_test(self, gs.build_python, source = 'test.py')
 
+    def test_output_tail(self):
+        '''
+        Test that output the call does not redirect is appended to the log
+        and that only its tail is included in the error message.
+        '''
+        with open('./build/chatty.py', 'w') as f:
+            f.write("import sys\n"
+                    "sys.stderr.write('noise\\n' * 20000)\n"
+                    "sys.stderr.write('last words\\n')\n"
+                    "sys.exit(1)\n")
+        env = {'executable_names': {'python': sys.executable}, 'output_tail_kb': 1}
+
+        with self.assertRaises(ExecCallError) as context:
+            gs.build_python('./build/test_output.txt', './build/chatty.py', env)
+        message = str(context.exception)
+        self.assertIn('last words', message)
+        self.assertIn('earlier bytes omitted', message)
+        self.assertLess(len(message), 2 * 1024)
+
+        with open('./build/sconscript.log', 'r') as f:
+            log = f.read()
+        self.assertEqual(log.count('noise'), 20000)
+        self.assertTrue(log.endswith('last words\n'))
+
+    def test_live_output(self):
+        '''
+        Test that live output is echoed without the log's header line and
+        that characters split between chunks are decoded whole.
+        '''
+        with open('./build/live.py', 'w') as f:
+            f.write("# -*- coding: utf-8 -*-\n"
+                    "print(u'caf\\xe9 to the log')\n"
+                    "open('./build/test_output.txt', 'w').close()\n")
+        env = {'executable_names': {'python': sys.executable}, 'live_output': True}
+        with mock.patch('sys.stdout', new_callable = io.StringIO) as console:
+            gs.build_python('./build/test_output.txt', './build/live.py', env)
+        self.assertIn(u'caf\xe9 to the log\n', console.getvalue())
+        self.assertNotIn('*** Builder log created', console.getvalue())
+
+        with mock.patch('sys.stdout', new_callable = io.StringIO) as console:
+            stream = gslab_builder.ConsoleStream()
+            encoded = u'caf\xe9'.encode('utf-8')
+            stream.write(encoded[:4])
+            stream.write(encoded[4:])
+            stream.close()
+        self.assertEqual(console.getvalue(), u'caf\xe9\n')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_workers(self):
+        '''
+        Test that scripts run in the warm worker pool find the warm modules
+        imported, see their own argv and working directory, log their output 
+        and report failures, with the error tail passed back over the socket,
+        and that stopping the pool stops the server process.
+        '''
+        with open('./build/work.py', 'w') as f:
+            f.write("import os, sys\n"
+                    "print('imported minidom: %s' % ('xml.dom.minidom' in sys.modules))\n"
+                    "open(sys.argv[2], 'w').write(' '.join(sys.argv[1:]) + ' ' + os.getcwd())\n")
+        with open('./build/fail.py', 'w') as f:
+            f.write("raise ValueError('bad input')\n")
+        env = {'executable_names': {'python': sys.executable}, 
+               'python_workers': ['xml.dom.minidom'], 'CL_ARG': ['first', './build/test_output.txt']}
+
+        gs.build_python('./build/test_output.txt', './build/work.py', env)
+        with open('./build/test_output.txt', 'r') as f:
+            self.assertEqual(f.read(), 'first ./build/test_output.txt %s' % os.getcwd())
+        with open('./build/sconscript.log', 'r') as f:
+            self.assertIn('imported minidom: True', f.read())
+
+        del env['CL_ARG']
+        with self.assertRaises(ExecCallError) as context:
+            gs.build_python('./build/test_output.txt', './build/fail.py', env)
+        self.assertIn('ValueError: bad input', str(context.exception))
+
+        pool = python_workers.get_pool(env, sys.executable)
+        self.assertEqual(pool.runs, 2)
+        server_pid = pool.server_pid
+        pool.stop()
+        self.assertIsNone(pool.process)
+        with self.assertRaises(ProcessLookupError):
+            os.kill(server_pid, 0)
+
     def tearDown(self):
         if os.path.exists('./build/'):
             shutil.rmtree('./build/')
@@ -18,7 +18,7 @@ from gslab_scons._exception_classes import (BadExtensionError,
                                             ExecCallError)
 from gslab_make.tests import nostderrout
 
-system_patch = mock.patch('gslab_scons.builders.build_r.subprocess.check_output')
+system_patch = mock.patch('gslab_scons.builders.build_r.subprocess.check_call')
 
 
 class TestBuildR(unittest.TestCase):
@@ -28,43 +28,43 @@ class TestBuildR(unittest.TestCase):
             os.mkdir('./build/')
 
     @system_patch
-    def test_standard(self, mock_check_output):
+    def test_standard(self, mock_check_call):
         '''Test build_r()'s behaviour when given standard inputs.'''
-        mock_check_output.side_effect = fx.make_r_side_effect(True)
+        mock_check_call.side_effect = fx.make_r_side_effect(True)
         helpers.standard_test(self, gs.build_r, 'R', 
-                              system_mock = mock_check_output)
+                              system_mock = mock_check_call)
         # With a list of targets
         targets = ['./test_output.txt']
         helpers.standard_test(self, gs.build_r, 'R', 
-                              system_mock = mock_check_output,
+                              system_mock = mock_check_call,
                               target      = targets)    
 
     @system_patch
-    def test_cl_arg(self, mock_check_output):
-        mock_check_output.side_effect = fx.make_r_side_effect(True)
-        helpers.test_cl_args(self, gs.build_r, mock_check_output, 'R')
+    def test_cl_arg(self, mock_check_call):
+        mock_check_call.side_effect = fx.make_r_side_effect(True)
+        helpers.test_cl_args(self, gs.build_r, mock_check_call, 'R')
 
     def test_bad_extension(self): 
         '''Test that build_r() recognises an inappropriate file extension'''
         helpers.bad_extension(self, gs.build_r, good = 'test.r')
 
     @system_patch
-    def test_no_executable(self, mock_check_output):
+    def test_no_executable(self, mock_check_call):
         '''
         Check build_r()'s behaviour when R is not recognised as
         an executable.
         '''
-        mock_check_output.side_effect = \
+        mock_check_call.side_effect = \
             fx.make_r_side_effect(recognized = False)
         with self.assertRaises(ExecCallError):
             helpers.standard_test(self, gs.build_r, 'R', 
-                                  system_mock = mock_check_output)
+                                  system_mock = mock_check_call)
    
     @system_patch
-    def test_unintended_inputs(self, mock_check_output):
+    def test_unintended_inputs(self, mock_check_call):
         # We expect build_r() to raise an error if its env
         # argument does not support indexing by strings. 
-        mock_check_output.side_effect = fx.make_r_side_effect(True)
+        mock_check_call.side_effect = fx.make_r_side_effect(True)
 
         check = lambda **kwargs: helpers.input_check(self, gs.build_r, 
                                                      'r', **kwargs)
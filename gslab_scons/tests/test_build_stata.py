@@ -3,6 +3,8 @@ import unittest
 import sys
 import os
 import shutil
+import time
+import threading
 from unittest import mock
 
 # Import gslab_scons testing helper modules
@@ -14,8 +16,38 @@ os.chdir(os.path.dirname(os.path.realpath(__file__)))
 sys.path.append('../..')
 
 import gslab_scons as gs
+import gslab_scons.resource_pool as resource_pool
 from gslab_scons._exception_classes import ExecCallError
 
+# A stand-in for Stata that understands the session driver's commands.
+# Scripts create files with `* target <path>` and fail with `exit <rc>`.
+stata_stub = '''#! %s
+import os, re, sys
+driver = [a for a in sys.argv[1:] if a.endswith('.do')][0]
+open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions'), 'a').write('x')
+log = open(os.path.splitext(driver)[0] + '.log', 'w')
+rc = 0
+for line in open(driver):
+    log.write('. ' + line)
+    marker = re.match(r'display "@@gslab" "_batch (\\d+) (begin|end)', line)
+    if marker and marker.group(2) == 'begin':
+        log.write('@@gslab_batch %%s begin\\n' %% marker.group(1))
+    elif marker:
+        log.write('@@gslab_batch %%s end %%d\\n' %% (marker.group(1), rc))
+    elif line.startswith('cd '):
+        os.chdir(line.split('"')[1])
+    elif line.startswith('capture noisily do '):
+        rc = 0
+        for command in open(line.split('"')[1]):
+            log.write('. ' + command)
+            if command.startswith('* target '):
+                open(command.split()[2], 'w').close()
+            elif command.startswith('exit '):
+                rc = int(command.split()[1])
+                log.write('r(%%d);\\n' %% rc)
+                break
+''' % sys.executable
+
 # Define path to the builder for use in patching
 path = 'gslab_scons.builders.build_stata'
 
@@ -28,7 +60,7 @@ class TestBuildStata(unittest.TestCase):
 
     @helpers.platform_patch('darwin', path)
     @mock.patch('%s.misc.is_in_path'         % path)
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_unix(self, mock_check, mock_path):
         '''Test build_stata()'s standard behaviour on Unix machines'''
         mock_check.side_effect = fx.make_stata_side_effect('stata-mp')
@@ -41,7 +73,7 @@ class TestBuildStata(unittest.TestCase):
 
     @helpers.platform_patch('win32', path)
     @mock.patch('%s.misc.is_in_path'         % path)
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     @mock.patch('%s.misc.is_64_windows'      % path)
     def test_windows(self, mock_is_64, mock_check, mock_path):
         '''
@@ -58,7 +90,7 @@ class TestBuildStata(unittest.TestCase):
 
     @helpers.platform_patch('cygwin', path)
     @mock.patch('%s.misc.is_in_path'         % path)
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_other_platform(self, mock_check, mock_path):
         '''
         Test build_stata()'s standard behaviour on a non-Unix,
@@ -83,7 +115,7 @@ class TestBuildStata(unittest.TestCase):
     
 
     @helpers.platform_patch('darwin', path)
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_stata_executable_unix(self, mock_check):
         mock_check.side_effect = fx.make_stata_side_effect('stata-mp')
         env = {'stata_executable': 'stata-mp'}
@@ -91,7 +123,7 @@ class TestBuildStata(unittest.TestCase):
                               env = env, system_mock = mock_check)
 
     @helpers.platform_patch('win32', path)
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_stata_executable_windows(self, mock_check):
         mock_check.side_effect = fx.make_stata_side_effect('stata-mp')
 
@@ -99,7 +131,7 @@ class TestBuildStata(unittest.TestCase):
         helpers.standard_test(self, gs.build_stata, 'do', 
                               env = env, system_mock = mock_check)
 
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_cl_arg(self, mock_check):
         mock_check.side_effect = fx.make_stata_side_effect('stata-mp')
         
@@ -115,7 +147,7 @@ class TestBuildStata(unittest.TestCase):
                            env    = env)
 
     @mock.patch('%s.misc.is_in_path'         % path)
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_no_executable_in_path(self, mock_check, mock_path):
         '''
         Test build_stata()'s behaviour when there are no valid Stata
@@ -136,7 +168,7 @@ class TestBuildStata(unittest.TestCase):
                            source = './test_script.do', 
                            env    = env)
 
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_unavailable_executable(self, mock_check):
         '''
         Test build_stata()'s behaviour when a Stata executable that 
@@ -150,13 +182,186 @@ class TestBuildStata(unittest.TestCase):
                            source = './input/stata_test_script.do', 
                            env    = env)
 
-    @mock.patch('%s.subprocess.check_output' % path)
+    @mock.patch('%s.subprocess.check_call' % path)
     def test_bad_extension(self, mock_check):
         mock_check.side_effect = fx.make_stata_side_effect('stata-mp')
         env = {'stata_executable': 'stata-mp'}
         helpers.bad_extension(self, gs.build_stata, 
                               good = 'test.do', env = env)
 
+    @helpers.platform_patch('darwin', path)
+    @mock.patch('%s.subprocess.check_call' % path)
+    def test_parallel_same_name(self, mock_check):
+        '''
+        Test that concurrent builds of scripts with the same name each run
+        in their own directory and keep their own Stata log.
+        '''
+        def side_effect(command, cwd = None, **kwargs):
+            with open(os.path.join(cwd, 'analysis.log'), 'w') as log:
+                log.write('Stata log for %s\n' % os.path.normpath(os.path.dirname(cwd)))
+            time.sleep(0.1)
+            open(os.path.join(os.path.dirname(cwd), 'out.txt'), 'w').close()
+        mock_check.side_effect = side_effect
+
+        env = {'stata_executable': 'stata-mp'}
+        threads = []
+        for folder in ['a', 'b']:
+            os.mkdir('./build/%s' % folder)
+            threads.append(threading.Thread(target = gs.build_stata, 
+                                            args = ('./build/%s/out.txt' % folder, 
+                                                    './%s/analysis.do' % folder, env)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for folder in ['a', 'b']:
+            self.assertEqual(sorted(os.listdir('./build/%s' % folder)), 
+                             ['out.txt', 'sconscript.log', 'sconscript.log.json'])
+            with open('./build/%s/sconscript.log' % folder, 'r') as log:
+                self.assertIn('Stata log for %s' % os.path.join('build', folder), log.read())
+        self.assertFalse(os.path.exists('./analysis.log'))
+
+    def test_close_scratch_dir(self):
+        '''
+        Test that directories left in a scratch directory are merged into the
+        target directory and that what cannot be moved is kept and reported.
+        '''
+        os.makedirs('./build/figures/old')
+        open('./build/figures/old/keep.txt', 'w').close()
+        open('./build/clash', 'w').close()
+        builder = gs.builders.build_stata.StataBuilder('./build/out.txt', './input/script.do', {},
+                                                      name = 'Stata')
+        builder.open_scratch_dir()
+        os.makedirs(os.path.join(builder.scratch_dir, 'figures', 'new'))
+        open(os.path.join(builder.scratch_dir, 'figures', 'new', 'plot.png'), 'w').close()
+        open(os.path.join(builder.scratch_dir, 'figures', 'table.tex'), 'w').close()
+        os.makedirs(os.path.join(builder.scratch_dir, 'clash', 'inner'))
+        open(os.path.join(builder.scratch_dir, 'clash', 'inner', 'x.txt'), 'w').close()
+
+        with mock.patch('sys.stdout') as mock_stdout:
+            builder.close_scratch_dir()
+
+        self.assertTrue(os.path.isfile('./build/figures/old/keep.txt'))
+        self.assertTrue(os.path.isfile('./build/figures/new/plot.png'))
+        self.assertTrue(os.path.isfile('./build/figures/table.tex'))
+        self.assertTrue(os.path.isfile(os.path.join(builder.scratch_dir, 'clash', 'inner', 'x.txt')))
+        printed = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+        self.assertIn('could not move %s' % os.path.join(builder.scratch_dir, 'clash'), printed)
+
+    def test_batch(self):
+        '''
+        Test that steps started together run in one Stata session, that each
+        log holds only its own script's output and that a failing script
+        fails only its own step.
+        '''
+        with open('./build/stata', 'w') as f:
+            f.write(stata_stub)
+        os.chmod('./build/stata', 0o755)
+        env = {'executable_names': {'stata': os.path.abspath('./build/stata')},
+               'stata_batch': 0.5}
+        scripts = {'a': '* target ./build/a/out.txt\n',
+                   'b': '* target ./build/b/out.txt\n',
+                   'c': 'display 1\nexit 198\n* target ./build/c/out.txt\n'}
+        errors  = {}
+
+        def build(folder):
+            try:
+                gs.build_stata('./build/%s/out.txt' % folder, 
+                               './build/%s/analysis.do' % folder, env)
+            except ExecCallError as ex:
+                errors[folder] = ex
+
+        threads = []
+        for folder, script in scripts.items():
+            os.mkdir('./build/%s' % folder)
+            with open('./build/%s/analysis.do' % folder, 'w') as f:
+                f.write(script)
+            threads.append(threading.Thread(target = build, args = (folder, )))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with open('./build/sessions', 'r') as f:
+            self.assertEqual(f.read(), 'x')
+        self.assertEqual(list(errors.keys()), ['c'])
+        # The Stata log of a failed step is left next to its targets.
+        logs = {'a': 'sconscript.log', 'b': 'sconscript.log', 'c': 'analysis.log'}
+        for folder, log in logs.items():
+            with open('./build/%s/%s' % (folder, log), 'r') as f:
+                log = f.read()
+            self.assertIn('%s/analysis.do' % folder, log)
+            self.assertNotIn('@@gslab', log)
+            for other in set(scripts) - {folder}:
+                self.assertNotIn('%s/analysis.do' % other, log)
+        self.assertIn('r(198);', log)
+        self.assertFalse(os.path.exists('./build/c/out.txt'))
+
+    def test_batch_with_resource_limit(self):
+        '''
+        Test that steps declaring the only Stata licence still share a session,
+        which reserves the licence once.
+        '''
+        with open('./build/stata', 'w') as f:
+            f.write(stata_stub)
+        os.chmod('./build/stata', 0o755)
+        env = {'executable_names': {'stata': os.path.abspath('./build/stata')},
+               'stata_batch': 0.5, 'resources': {'stata_test': 1},
+               'resource_limits': {'stata_test': 1}}
+        pool = resource_pool.ResourcePool()
+        threads = []
+        for folder in ['a', 'b', 'c']:
+            os.mkdir('./build/%s' % folder)
+            with open('./build/%s/analysis.do' % folder, 'w') as f:
+                f.write('* target ./build/%s/out.txt\n' % folder)
+            threads.append(threading.Thread(
+                target = gs.build_stata,
+                args = ('./build/%s/out.txt' % folder, './build/%s/analysis.do' % folder, env)))
+        with mock.patch.object(resource_pool, '_pool', pool), \
+             mock.patch.object(resource_pool, '_limits', None), \
+             mock.patch.object(pool, 'acquire', wraps = pool.acquire) as acquire:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+        with open('./build/sessions', 'r') as f:
+            self.assertEqual(f.read(), 'x')
+        self.assertEqual(acquire.call_count, 1)
+        for folder in ['a', 'b', 'c']:
+            self.assertTrue(os.path.isfile('./build/%s/out.txt' % folder))
+
+    def test_batch_leader_error(self):
+        '''
+        Test that the steps of a session whose first step fails before it runs
+        are released with an error instead of waiting forever.
+        '''
+        env = {'executable_names': {'stata': os.path.abspath('./build/stata')},
+               'stata_batch': 0.5}
+        errors = {}
+
+        def build(folder):
+            try:
+                gs.build_stata('./build/%s/out.txt' % folder, 
+                               './build/%s/analysis.do' % folder, env)
+            except Exception as ex:
+                errors[folder] = ex
+
+        threads = []
+        for folder in ['a', 'b', 'c']:
+            os.mkdir('./build/%s' % folder)
+            open('./build/%s/analysis.do' % folder, 'w').close()
+            threads.append(threading.Thread(target = build, args = (folder, )))
+        with mock.patch('gslab_scons.stata_sessions.Session.write_driver',
+                        side_effect = OSError('disk full')):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(sorted(errors.keys()), ['a', 'b', 'c'])
+        self.assertTrue(all('disk full' in str(error) for error in errors.values()))
+
     def tearDown(self):
         if os.path.exists('./build/'):
             shutil.rmtree('./build/')
@@ -0,0 +1,99 @@
+import unittest
+import sys
+import os
+import shutil
+import subprocess
+from unittest import mock
+
+# Ensure that Python can find and load the GSLab libraries
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../..')
+
+import gslab_scons.file_signatures as file_signatures
+
+sconstruct = '''
+import sys
+sys.path.insert(0, %r)
+import gslab_scons as gs
+env = Environment()
+env.Decider(gs.signature_decider('signatures.json'))
+env.Command('copy.txt', 'data.txt', Copy('$TARGET', '$SOURCE'))
+'''
+
+
+class TestFileSignatures(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists('./signatures/'):
+            shutil.rmtree('./signatures/')
+        os.mkdir('./signatures/')
+
+    def write(self, name, content):
+        with open('./signatures/%s' % name, 'wb') as f:
+            f.write(content)
+
+    def test_cache(self):
+        '''
+        Test that files are hashed again only when their stat changes and
+        that the cache persists.
+        '''
+        self.write('data.bin', b'a' * 1000)
+        signatures = file_signatures.SignatureCache('./signatures/cache.json')
+        first = signatures.signature('./signatures/data.bin')
+        with mock.patch('%s.fast_hash' % file_signatures.__name__) as mock_hash:
+            self.assertEqual(signatures.signature('./signatures/data.bin'), first)
+            mock_hash.assert_not_called()
+        signatures.save()
+
+        reloaded = file_signatures.SignatureCache('./signatures/cache.json')
+        self.assertEqual(reloaded.signature('./signatures/data.bin'), first)
+        self.assertEqual(reloaded.hashed, 0)
+        self.write('data.bin', b'b' * 1000)
+        self.assertNotEqual(reloaded.signature('./signatures/data.bin'), first)
+        self.assertEqual(reloaded.hashed, 1)
+
+    def test_sampled_hash(self):
+        '''
+        Test that sampled hashes read the head, middle and tail only.
+        '''
+        content = bytearray(b'x' * 100)
+        self.write('data.bin', bytes(content))
+        sampled = file_signatures.fast_hash('./signatures/data.bin', 10)
+        for position, changed in [(5, True), (50, True), (95, True), (20, False)]:
+            edited = bytearray(content)
+            edited[position] = ord('y')
+            self.write('data.bin', bytes(edited))
+            self.assertEqual(file_signatures.fast_hash('./signatures/data.bin', 10) != sampled,
+                             changed)
+        self.assertEqual(file_signatures.fast_hash('./signatures/data.bin', 40),
+                         file_signatures.fast_hash('./signatures/data.bin'))
+
+    @unittest.skipUnless(shutil.which('scons'), 'requires scons')
+    def test_decider(self):
+        '''
+        Test that SCons rebuilds a target when its source's content changes
+        but not when the source is only touched.
+        '''
+        with open('./signatures/SConstruct', 'w') as f:
+            f.write(sconstruct % os.path.abspath('../..'))
+        self.write('data.txt', b'first')
+
+        def built():
+            output = subprocess.check_output(['scons', '-Q'], cwd = './signatures/')
+            return b'Copy' in output
+
+        self.assertTrue(built())
+        self.assertFalse(built())
+        os.utime('./signatures/data.txt', (1, 1))
+        self.assertFalse(built())
+        self.write('data.txt', b'second')
+        self.assertTrue(built())
+        self.assertTrue(os.path.isfile('./signatures/signatures.json'))
+
+    def tearDown(self):
+        if os.path.exists('./signatures/'):
+            shutil.rmtree('./signatures/')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,12 @@ import unittest
 import sys
 import os
 import re
+import io
+import time
+import threading
 from unittest import mock
 import shutil
+from datetime import datetime
 # Import gslab_scons testing helpers
 import gslab_scons.tests._test_helpers as helpers
 
@@ -55,17 +59,85 @@ class TestLog(unittest.TestCase):
         self.assertTrue(re.search(message_match, log_contents.strip()))
 
     @helpers.platform_patch('darwin', path)
-    @mock.patch('gslab_scons.log.os.popen')
-    @mock.patch('gslab_scons.log.open')
-    def test_start_log_popen_on_unix(self, mock_open, mock_popen):
+    def test_start_log_multiplexer_on_unix(self):
         '''
-        Test that start_log() uses popen() to initialise its log
-        on Unix machines.
-        '''    
-        gs.start_log(mode = 'develop', vers = '')
-        mock_popen.assert_called_with('tee -a sconstruct.log', 'w')
-        gs.start_log(mode = 'develop', vers = '', log = 'test_log.txt')
-        mock_popen.assert_called_with('tee -a test_log.txt', 'w')
+        Test that start_log() sends standard output and errors through a
+        LogMultiplexer writing to the console and the log, not through tee.
+        '''
+        initial_stdout, initial_stderr = sys.stdout, sys.stderr
+        console = io.StringIO()
+        sys.stdout = console
+        with mock.patch('gslab_scons.log.os.popen') as mock_popen:
+            gs.start_log(mode = 'develop', log = 'test_log.txt')
+        multiplexer = sys.stdout
+        print('Test message')
+        sys.stderr.write('Test error\n')
+        multiplexer.close()
+        sys.stdout, sys.stderr = initial_stdout, initial_stderr
+
+        mock_popen.assert_not_called()
+        self.assertIsInstance(multiplexer, gs.LogMultiplexer)
+        self.assertEqual(console.getvalue(), 'Test message\nTest error\n')
+        with open('test_log.txt', 'r') as f:
+            self.assertTrue(re.search(r'^\*\*\* New build: \{[0-9\s\-:]+\} \*\*\*\n'
+                                      'Test message\nTest error\n$', f.read()))
+
+    def test_multiplexer_threads(self):
+        '''
+        Test that lines written in pieces by concurrent threads come out
+        whole and tagged with the label each thread set, on the console
+        and in the log.
+        '''
+        console = io.StringIO()
+        multiplexer = gs.LogMultiplexer(console, 'test_log.txt', buffer_size = 100)
+
+        def job(number):
+            gs.set_job('step %d' % number)
+            for line in range(50):
+                multiplexer.write('line %d ' % line)
+                time.sleep(0.0005)
+                multiplexer.write('of job %d\nstill job %d' % (number, number))
+                multiplexer.write(' here\n')
+
+        threads = [threading.Thread(target = job, args = (n, )) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        multiplexer.write('unfinished')
+        multiplexer.close()
+
+        lines = console.getvalue().splitlines()
+        self.assertEqual(len(lines), 4 * 100 + 1)
+        self.assertEqual(lines[-1], 'unfinished')
+        for line in lines[:-1]:
+            match = re.match(r'^\[step (\d)\] (?:line \d+ of|still) job (\d)', line)
+            self.assertTrue(match, line)
+            self.assertEqual(match.group(1), match.group(2))
+        with open('test_log.txt', 'r') as f:
+            self.assertEqual(f.read(), console.getvalue())
+
+    def test_multiplexer_flush_from_thread(self):
+        '''
+        Test that flush() from a thread other than the main thread writes out
+        only whole lines, and that threads without a label are not tagged.
+        '''
+        console = io.StringIO()
+        multiplexer = gs.LogMultiplexer(console, 'test_log.txt', flush_interval = 60)
+
+        def job():
+            multiplexer.write('whole\npart')
+            multiplexer.flush()
+
+        thread = threading.Thread(target = job)
+        thread.start()
+        thread.join()
+        self.assertEqual(console.getvalue(), 'whole\n')
+        multiplexer.write('prompt: ')
+        multiplexer.flush()
+        self.assertEqual(console.getvalue(), 'whole\nprompt: ')
+        multiplexer.close()
+        self.assertEqual(console.getvalue(), 'whole\nprompt: part')
 
     # Set the platform to Windows
     @helpers.platform_patch('win32', path)
@@ -189,11 +261,92 @@ class TestLog(unittest.TestCase):
             self.assertTrue(re.search('Build completed', line))
             self.assertTrue(re.search('\{%s\}' % now, line))
 
+    @mock.patch('gslab_scons.log.misc.current_time')
+    def test_end_log_manifest(self, mock_time):
+        '''
+        Test that end_log() appends the logs registered in the manifest, 
+        latest first, and ignores other logs in the tree.
+        '''
+        mock_time.return_value = '2000-01-01 00:00:00'
+        os.mkdir('./log_test/')
+        with open('sconstruct.log', 'w') as f:
+            f.write('*** New build: {2000-01-01 00:00:00} ***\n')
+        gs.start_manifest('sconstruct.log')
+        logs = {'early': 'A' * (3 * 1024 * 1024), 'late': 'late log\n', 
+                'broken': 'broken log\n', 'stale': 'stale log\n'}
+        for name, content in logs.items():
+            with open('./log_test/sconscript_%s.log' % name, 'w') as f:
+                f.write(content)
+        gs.register_builder_log('./log_test/sconscript_early.log')
+        gs.register_builder_log('./log_test/sconscript_late.log')
+        gs.register_builder_log('./log_test/sconscript_broken.log')
+        gs.register_builder_log('./log_test/sconscript_early.log', '2000-01-01 00:00:05')
+        gs.register_builder_log('./log_test/sconscript_late.log', '2000-01-01 00:00:09')
+        gs.end_log()
+
+        with open('./release/sconstruct.log', 'r') as f:
+            content = f.read()
+        late  = content.index(os.path.join('log_test', 'sconscript_late.log'))
+        early = content.index(os.path.join('log_test', 'sconscript_early.log'))
+        self.assertLess(late, early)
+        self.assertIn('late log\n', content)
+        self.assertIn('does not have timestamps, the Sconscript may not have finished.\n'
+                      'log_test/sconscript_broken.log\nbroken log\n', content)
+        self.assertIn(logs['early'] + '*** Warning', content)
+        self.assertTrue(content.endswith('broken log\n'))
+        self.assertNotIn('stale', content)
+        self.assertFalse(os.path.exists('sconstruct.log.manifest'))
+        shutil.rmtree('./log_test/')
+
+    def test_builder_log_end_time(self):
+        '''
+        Test that a builder log's completion time is read from its JSON sidecar,
+        from the header of an old-style log or the end of a log without a
+        sidecar, or is datetime.min otherwise.
+        '''
+        os.mkdir('./log_test/')
+        with open('./log_test/sconscript.log', 'w') as f:
+            f.write('*** Builder log created: {2000-01-01 00:00:00}\n'
+                    'Test log\n'
+                    '\n*** Builder log completed: {2000-01-01 00:00:05}\n')
+        with open('./log_test/sconscript.log.json', 'w') as f:
+            f.write('{"completed": "2000-01-01 00:00:05"}')
+        with open('./log_test/sconscript_old.log', 'w') as f:
+            f.write('*** Builder log created: {2000-01-01 00:00:00}\n'
+                    '*** Builder log completed: {2000-01-01 00:00:07}\n'
+                    'Test log\n')
+        with open('./log_test/sconscript_baseline.log', 'w') as f:
+            f.write('*** Builder log created: {2000-01-01 00:00:00}\n'
+                    '\n'
+                    '*** Builder log completed: {2000-01-01 00:00:08}\n'
+                    'Test log\n')
+        with open('./log_test/sconscript_nosidecar.log', 'w') as f:
+            f.write('*** Builder log created: {2000-01-01 00:00:00}\n'
+                    'Test log\n'
+                    '\n*** Builder log completed: {2000-01-01 00:00:06}\n')
+        with open('./log_test/sconscript_broken.log', 'w') as f:
+            f.write('*** Builder log created: {2000-01-01 00:00:00}\n'
+                    'Test log {2000-01-01 00:00:09}\n')
+
+        self.assertEqual(gs.builder_log_end_time('./log_test/sconscript.log'),
+                         datetime(2000, 1, 1, 0, 0, 5))
+        self.assertEqual(gs.builder_log_end_time('./log_test/sconscript_old.log'),
+                         datetime(2000, 1, 1, 0, 0, 7))
+        self.assertEqual(gs.builder_log_end_time('./log_test/sconscript_baseline.log'),
+                         datetime(2000, 1, 1, 0, 0, 8))
+        self.assertEqual(gs.builder_log_end_time('./log_test/sconscript_nosidecar.log'),
+                         datetime(2000, 1, 1, 0, 0, 6))
+        self.assertEqual(gs.builder_log_end_time('./log_test/sconscript_broken.log'),
+                         datetime.min)
+        shutil.rmtree('./log_test/')
+
     def tearDown(self):
         if os.path.isfile('sconstruct.log'):
            os.remove('sconstruct.log')
         if os.path.isfile('test_log.txt'):
            os.remove('test_log.txt')
+        if os.path.isfile('test_log.txt.manifest'):
+           os.remove('test_log.txt.manifest')
         if os.path.exists('./release/'):
             shutil.rmtree('./release/')
 
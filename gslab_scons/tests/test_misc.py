@@ -212,6 +212,28 @@ class TestMisc(unittest.TestCase):
         with self.assertRaises(TypeError):
             self.assertEqual(misc.make_list_if_string(None), None)
 
+    def test_get_executable(self):
+        '''
+        Test that get_executable() prefers an executable set for the language,
+        matched without regard to case or surrounding spaces, falls back to
+        the default and raises PrerequisiteError for a language without one.
+        '''
+        names = {'Python': ' /usr/bin/Python3 ', 'stata': 'None', '': 'x'}
+        self.assertEqual(misc.get_executable('python', names), '/usr/bin/python3')
+        self.assertEqual(misc.get_executable('r', names), 'Rscript')
+        with self.assertRaises(ex_classes.PrerequisiteError):
+            misc.get_executable('fortran', names)
+
+        # Normalised mappings are memoised by their items, so changing the
+        # mapping gives a new result.
+        hits = misc._normalise_executables.cache_info().hits
+        misc.get_executable('python', names)
+        self.assertEqual(misc._normalise_executables.cache_info().hits, hits + 1)
+        names['python'] = 'python2'
+        self.assertEqual(misc.get_executable('python', names), 'python2')
+        self.assertEqual(misc.get_executable('python', {'python': ['python3']}),
+                         "['python3']")
+
     def test_check_code_extension(self):
         '''Unit tests for check_code_extension()
 
@@ -260,17 +282,49 @@ class TestMisc(unittest.TestCase):
         shutil.rmtree('state_of_repo')
         os.remove('state_of_repo.log')
 
-    def test_lyx_scan(self):
+    def test_finder(self):
+        '''
+        Test that finder() matches file names, prunes excluded directories
+        and gives the same result with and without threads.
+        '''
+        for directory in ['finder/a/b', 'finder/c', 'finder/.git/x', 'finder/tests']:
+            os.makedirs(directory)
+        for log in ['finder/sconscript.log', 'finder/a/b/sconscript_x.log', 'finder/c/other.txt',
+                    'finder/.git/x/sconscript.log', 'finder/c/sconscript.log',
+                    'finder/tests/sconscript.log']:
+            open(log, 'w').close()
+        expected = ['finder/a/b/sconscript_x.log', 'finder/c/sconscript.log', 
+                    'finder/sconscript.log']
+        for workers in [1, 4]:
+            found = misc.finder('finder', '*sconscript*.log', ['.git', 'tests'], workers)
+            self.assertEqual(found, [os.path.normpath(p) for p in expected])
+        self.assertEqual(len(misc.finder('finder', '*.log')), 5)
+        self.assertEqual(misc.finder('missing', '*.log'), [])
+        shutil.rmtree('finder')
+
+    @mock.patch('%s.scan_cache.get_scan_cache' % path)
+    def test_lyx_scan(self, mock_get_cache):
+        # Use a memo that is not saved to disk
+        mock_get_cache.return_value = misc.scan_cache.ScanCache(os.devnull)
         # Open a test LyX file containing dependency statements
         infile = open('./input/lyx_test_dependencies.lyx').read()
-        # Mock an SCons node object to return this file's contents
+        # Mock an SCons node object for this file that returns its contents
         # when its get_contents() method is called.
-        node   = mock.MagicMock(get_contents = lambda: infile)
+        node   = mock.MagicMock(get_contents = lambda: infile.encode('utf-8'),
+                                get_abspath = lambda: os.path.abspath(
+                                    './input/lyx_test_dependencies.lyx'))
         # Mock an SCons environment object with an EXTENSIONS data attribute
         env    = mock.MagicMock(EXTENSIONS = ['.lyx', '.txt'])
         output = misc.lyx_scan(node, env, None)
         # Ensure lyx_scan scanned the test file correctly
         self.assertEqual(output, ['lyx_test_file.lyx', 'tables_appendix.txt'])
+        # A file that has not changed is not read again
+        node.get_contents = mock.MagicMock()
+        self.assertEqual(misc.lyx_scan(node, env, None), output)
+        node.get_contents.assert_not_called()
+        env.EXTENSIONS = ['.txt']
+        self.assertEqual(misc.lyx_scan(mock.MagicMock(get_contents = lambda: infile), env, None),
+                         ['tables_appendix.txt'])
 
     @mock.patch('%s.raw_input' % path)
     def test_load_yaml_value(self, mock_raw_input):
@@ -36,7 +36,7 @@ patch_collection = \
               mock.patch('%s.getpass.getpass' % path)(
               mock.patch('%s.os.makedirs' % path)(
               mock.patch('%s.shutil.copy' % path)(
-              mock.patch('%s.shutil.make_archive' % path)(
+              mock.patch('%s.parallel_zip.make_archive' % path)(
               mock.patch('%s.shutil.move' % path)(\
               mock.patch('gslab_scons.misc.check_and_expand_path')(\
                 f \
@@ -170,8 +170,7 @@ class TestReleaseFunction(unittest.TestCase):
 
         # ...that it zipped them if zip_release == True, ...
         if args['zip_release']:
-            mock_make_archive.assert_called_with('release_content', 'zip', 
-                                                 'release_content')
+            mock_make_archive.assert_called_with('release_content', 'release_content')
             # ...and that it moved them to the local_release directory
             mock_move.assert_called_with('release_content.zip', 
                                          '%s/release.zip' % args['local_release'])       
@@ -0,0 +1,173 @@
+import unittest
+import sys
+import os
+import time
+import shutil
+import threading
+import subprocess
+from unittest import mock
+
+# Ensure that Python can find and load the GSLab libraries
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../..')
+
+import gslab_scons.resource_pool as resource_pool
+
+step = '''
+import sys, time
+start = time.time()
+time.sleep(float(sys.argv[2]))
+open(sys.argv[1], 'w').write('%f %f' % (start, time.time()))
+'''
+
+sconstruct = '''
+import sys
+sys.path.insert(0, %r)
+import gslab_scons as gs
+env = Environment()
+for n in range(3):
+    gs.build_anything('stata_%%d.txt' %% n, 'step.py', '%s step.py stata_%%d.txt 1' %% n,
+                      env = env, resources = {'stata_test': 1},
+                      resource_limits = {'stata_test': 1})
+gs.build_anything('unthrottled.txt', 'step.py', '%s step.py unthrottled.txt 0', env = env)
+'''
+
+
+class TestResourcePool(unittest.TestCase):
+
+    def setUp(self):
+        resource_pool._pool   = resource_pool.ResourcePool()
+        resource_pool._limits = None
+        resource_pool._next_unit = {}
+
+    def run_steps(self, envs):
+        '''
+        Run one thread per env, each holding its resources for a short while,
+        and return the largest number of threads of each kind running at once.
+        '''
+        lock    = threading.Lock()
+        running = {}
+        peak    = {}
+
+        def step(env):
+            kind = env.get('kind')
+            with resource_pool.reserve(env):
+                with lock:
+                    running[kind] = running.get(kind, 0) + 1
+                    peak[kind] = max(peak.get(kind, 0), running[kind])
+                time.sleep(0.05)
+                with lock:
+                    running[kind] -= 1
+
+        threads = [threading.Thread(target = step, args = (env, )) for env in envs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return peak
+
+    def test_license_limit(self):
+        '''
+        Test that steps needing a license are throttled to the license count
+        while steps declaring nothing run freely.
+        '''
+        limits = {'stata_test': 2}
+        envs  = [{'kind': 'stata', 'resources': {'stata_test': 1},
+                  'resource_limits': limits} for _ in range(6)]
+        envs += [{'kind': 'python'} for _ in range(6)]
+        peak = self.run_steps(envs)
+        self.assertEqual(peak['stata'], 2)
+        self.assertEqual(peak['python'], 6)
+
+    def test_limits_set_once(self):
+        '''
+        Test that the first step giving resource_limits sets them for the
+        build and that later, different limits are ignored with a warning.
+        '''
+        first = [{'kind': 'stata', 'resources': {'stata_test': 1},
+                  'resource_limits': {'stata_test': 1}}]
+        later = [{'kind': 'stata', 'resources': {'stata_test': 1},
+                  'resource_limits': {'stata_test': 4}} for _ in range(4)]
+        self.run_steps(first)
+        with mock.patch('sys.stdout') as mock_stdout:
+            peak = self.run_steps(later)
+        self.assertEqual(peak['stata'], 1)
+        self.assertEqual(resource_pool._pool.limits['stata_test'], 1)
+        printed = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+        self.assertIn('ignoring resource_limits', printed)
+
+    @unittest.skipUnless(shutil.which('scons'), 'requires scons')
+    def test_cheap_step_runs_while_saturated(self):
+        '''
+        Test that steps waiting for a saturated resource do not take the job
+        slots, so that a step declaring nothing finishes while they wait.
+        '''
+        if os.path.exists('./pool/'):
+            shutil.rmtree('./pool/')
+        os.mkdir('./pool/')
+        try:
+            with open('./pool/step.py', 'w') as f:
+                f.write(step)
+            with open('./pool/SConstruct', 'w') as f:
+                f.write(sconstruct % (os.path.abspath('../..'), sys.executable, sys.executable))
+            subprocess.check_output(['scons', '-Q', '-j', '3'], cwd = './pool/',
+                                    stderr = subprocess.STDOUT)
+            times = {}
+            for name in ['stata_0', 'stata_1', 'stata_2', 'unthrottled']:
+                with open('./pool/%s.txt' % name, 'r') as f:
+                    times[name] = [float(t) for t in f.read().split()]
+        finally:
+            shutil.rmtree('./pool/')
+        stata = sorted(times[name] for name in times if name.startswith('stata'))
+        self.assertLess(times['unthrottled'][1], stata[0][1])
+        for before, after in zip(stata, stata[1:]):
+            self.assertLessEqual(before[1], after[0])
+
+    def test_schedule_resources(self):
+        '''
+        Test that steps of the builders in env are given one unit of each
+        resource per unit declared, handed out in turn, except for steps run
+        in shared Stata sessions.
+        '''
+        try:
+            import SCons.Environment
+            import SCons.Builder
+        except ImportError:
+            self.skipTest('requires SCons')
+        from gslab_scons.builders.build_stata import build_stata
+        env = SCons.Environment.Environment(
+            BUILDERS = {'Step':  SCons.Builder.Builder(action = 'true'),
+                        'Stata': SCons.Builder.Builder(action = build_stata)},
+            resources = {'stata_test': 1, 'mem_test': 1.5},
+            resource_limits = {'stata_test': 2, 'mem_test': 4})
+        resource_pool.schedule_resources(env)
+        resource_pool.schedule_resources(env)
+        first  = env.Step('pool_a.txt', 'pool_in.txt')[0]
+        second = env.Step('pool_b.txt', 'pool_in.txt')[0]
+        third  = env.Step('pool_c.txt', 'pool_in.txt', resources = {})[0]
+        names = lambda node: sorted(os.path.basename(str(n)) for n in node.side_effects)
+        self.assertEqual(names(first), ['mem_test_0', 'mem_test_1', 'stata_test_0'])
+        self.assertEqual(names(second), ['mem_test_2', 'mem_test_3', 'stata_test_1'])
+        self.assertEqual(names(third), [])
+        # Steps run in shared Stata sessions are left to the session.
+        fourth = env.Stata('pool_d.txt', 'pool_in.do')[0]
+        fifth  = env.Stata('pool_e.txt', 'pool_in.do', stata_batch = True)[0]
+        self.assertEqual(names(fourth), ['mem_test_0', 'mem_test_1', 'stata_test_0'])
+        self.assertEqual(names(fifth), [])
+
+    def test_all_or_nothing(self):
+        '''
+        Test that requests are granted whole and that requests larger than
+        the limit are capped instead of waiting forever.
+        '''
+        pool = resource_pool.ResourcePool({'mem_gb': 32, 'matlab': 1})
+        first = pool.acquire({'mem_gb': 24, 'matlab': 1})
+        self.assertFalse(pool.available(pool.clamp({'mem_gb': 8, 'matlab': 1})))
+        self.assertTrue(pool.available(pool.clamp({'mem_gb': 8})))
+        pool.release(first)
+        self.assertEqual(pool.acquire({'mem_gb': 100}), {'mem_gb': 32.0})
+        self.assertEqual(pool.clamp({'unknown': 3}), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import sys
+import os
+import shutil
+import subprocess
+from unittest import mock
+
+# Ensure that Python can find and load the GSLab libraries
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append('../..')
+
+import gslab_scons.scanners as scanners
+import gslab_scons.scan_cache as scan_cache
+
+sconstruct = '''
+import sys
+sys.path.insert(0, %r)
+import gslab_scons as gs
+env = Environment()
+gs.add_scanners(env)
+env.Command('build/data.csv', 'raw.csv', Copy('$TARGET', '$SOURCE'))
+env.Command('build/out.txt', 'analysis.py',
+            '%s $SOURCE > $TARGET')
+'''
+
+
+class TestScanners(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists('./scanners/'):
+            shutil.rmtree('./scanners/')
+        os.mkdir('./scanners/')
+
+    def write(self, name, content):
+        with open('./scanners/%s' % name, 'w') as f:
+            f.write(content)
+
+    def test_find_stata(self):
+        script = ('use "raw/data file.dta", clear\n'
+                  '* use commented.dta\n'
+                  'merge 1:1 id using build/other\n'
+                  'use id x using build/subset.dta\n'
+                  'do source/helper\n'
+                  'include "lib/tools.do"\n'
+                  "use `file'\n"
+                  'append using $root/extra.dta\n'
+                  'save build/output.dta, replace\n')
+        self.assertEqual(scanners.find_stata(script),
+                         ['raw/data file.dta', 'build/other.dta', 'build/subset.dta',
+                          'source/helper.do', 'lib/tools.do'])
+
+    def test_find_stata_outputs(self):
+        '''
+        Test that files written by commands that take `using` are not inputs.
+        '''
+        script = ('log using "output/analysis.log", replace text\n'
+                  'esttab est1 using "output/table.tex", replace\n'
+                  'export delimited using output/out.csv, replace\n'
+                  'outsheet id x using output/x.csv, comma replace\n'
+                  'file open notes using output/notes.txt, write replace\n'
+                  'file open both using output/both.txt, read write\n'
+                  'quietly merge 1:1 id using build/other\n'
+                  'capture: append using "build/more.dta"\n'
+                  'joinby id using build/pairs\n'
+                  'file open lines using raw/lines.txt, read text\n')
+        self.assertEqual(scanners.find_stata(script),
+                         ['build/other.dta', 'build/more.dta', 'build/pairs.dta',
+                          'raw/lines.txt'])
+
+    def test_find_r(self):
+        script = ('df <- read.csv("raw/a.csv")\n'
+                  '# load("commented.RData")\n'
+                  "load(file = 'b.RData'); source(\"lib/helpers.R\")\n"
+                  'x <- readRDS(paste0(dir, "c.rds"))\n'
+                  'write.csv(df, "build/out.csv")\n')
+        self.assertEqual(scanners.find_r(script), ['raw/a.csv', 'b.RData', 'lib/helpers.R'])
+
+    def test_find_python(self):
+        script = ("df = pd.read_csv('raw/a.csv')\n"
+                  "open('build/out.txt', 'w').write('x')\n"
+                  "with open(\"raw/b.json\") as f: pass\n"
+                  "with open(r'raw/c.txt', mode = 'rb') as f: pass\n"
+                  "open(f'{name}.csv')\n"
+                  "matrix = np.load('m.npy')\n")
+        self.assertEqual(scanners.find_python(script),
+                         ['raw/b.json', 'raw/c.txt', 'raw/a.csv', 'm.npy'])
+
+    def test_scan_cache(self):
+        '''
+        Test that the memo keeps at most max_entries results, dropping the least
+        recently used, that finding stored results does not mark it for saving,
+        and that an unchanged file is keyed without being read.
+        '''
+        memo = scan_cache.ScanCache('./scanners/memo.json', max_entries = 2)
+        for key in ['a', 'b']:
+            memo.scan(key, lambda: [key])
+        self.assertEqual(memo.scan('a', lambda: ['new']), ['a'])
+        memo.scan('c', lambda: ['c'])
+        memo.save()
+        reloaded = scan_cache.ScanCache('./scanners/memo.json', max_entries = 2)
+        self.assertEqual(list(reloaded.entries.keys()), ['a', 'c'])
+        reloaded.scan('a', lambda: ['new'])
+        self.assertFalse(reloaded.changed)
+
+        self.write('script.py', "open('a.txt')\n")
+        node = mock.MagicMock(get_abspath = lambda: os.path.abspath('./scanners/script.py'))
+        key = scan_cache.content_key(node)
+        node.get_contents.assert_not_called()
+        self.assertEqual(scan_cache.content_key(node), key)
+        self.write('script.py', "open('b.txt')\n")
+        self.assertNotEqual(scan_cache.content_key(node), key)
+
+    @unittest.skipUnless(shutil.which('scons'), 'requires scons')
+    def test_rebuilds(self):
+        '''
+        Test that a step is rebuilt when a file its script reads changes,
+        including one built by another step, and not otherwise.
+        '''
+        self.write('SConstruct', sconstruct % (os.path.abspath('../..'), sys.executable))
+        self.write('analysis.py', "print(open('build/data.csv').read())\n"
+                                  "print(open('lookup.txt').read())\n")
+        self.write('raw.csv', '1,2\n')
+        self.write('lookup.txt', 'a\n')
+        self.write('unrelated.txt', 'b\n')
+
+        def built():
+            output = subprocess.check_output(['scons', '-Q', 'build/out.txt'],
+                                             cwd = './scanners/')
+            return b'analysis.py > build/out.txt' in output
+
+        self.assertTrue(built())
+        self.assertFalse(built())
+        self.write('unrelated.txt', 'c\n')
+        self.assertFalse(built())
+        self.write('lookup.txt', 'd\n')
+        self.assertTrue(built())
+        self.write('raw.csv', '3,4\n')
+        self.assertTrue(built())
+        self.assertTrue(os.path.isfile('./scanners/.gslab_scan_cache.json'))
+
+    def tearDown(self):
+        if os.path.exists('./scanners/'):
+            shutil.rmtree('./scanners/')
+
+
+if __name__ == '__main__':
+    unittest.main()